@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+# Samuel Dunn
+# CS 483, Fall 2019
+
+# Measures how much memory Card objects take and how quickly they can
+# be inflated, using every card in an internal_index.json.
+# Compares inflating one card at a time (Card().deserialize) with the
+# bulk path (Card.deserialize_many).
+#
+# Run from the top level directory:
+#   python -m benchmarks.card_model [-f path/to/internal_index.json]
+
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import tracemalloc
+
+from mtg_qe.model.card import Card
+
+def measure(label, inflate, records, repeats):
+    best = None
+    for _ in range(repeats):
+        gc.collect()
+        start = time.perf_counter()
+        cards = inflate(records)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        del cards
+
+    # measure memory separately, tracemalloc slows allocation down.
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    cards = inflate(records)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(f'{label:18s} {len(records) / best:12.0f} cards/s  '
+          f'{best * 1000:8.1f}ms total  '
+          f'{(after - before) / len(cards):8.1f} bytes/card')
+
+def main():
+    parser = argparse.ArgumentParser('card_model')
+    parser.add_argument('-f', '--internal-index', type=str, default=None, help='path to internal_index.json, defaults to the installed corpus.')
+    parser.add_argument('-r', '--repeats', type=int, default=20, help='number of timed runs (the best is reported.)')
+    args = parser.parse_args()
+
+    path = args.internal_index
+    if path is None:
+        from mtg_qe.data import get_data_location, unpack_archive
+        unpack_archive()
+        path = os.path.join(get_data_location(), 'internal_index.json')
+
+    with open(path) as fd:
+        records = list(json.load(fd)['by_multiverseid'].values())
+
+    print(f'{len(records)} cards, Card uses __slots__: {not hasattr(Card(), "__dict__")}')
+    measure('Card().deserialize', lambda recs: [Card().deserialize(r) for r in recs], records, args.repeats)
+    measure('deserialize_many', Card.deserialize_many, records, args.repeats)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+# Samuel Dunn
+# CS 483, Fall 2019
+
+# Compares the legacy whoosh schema (pickled cards in every document) with
+# the compact schema (multiverseid only) on two axes:
+#   - size of the whoosh index on disk
+#   - time to turn a page of hits into Card objects
+#
+# Run from the top level directory:
+#   python -m benchmarks.compact_index -i scrape_data.tar.gz
+
+import os
+import sys
+import time
+import tarfile
+import argparse
+import tempfile
+import statistics
+
+from whoosh.qparser import MultifieldParser, OrGroup
+
+from mtg_qe.data.index_setup import IndexInitializer
+
+QUERIES = ['dragon', 'counter target spell', 'draw a card', 'flying', 'destroy target creature',
+           'elf', 'goblin', 'sacrifice', 'graveyard', 'token']
+
+def dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total
+
+def time_hydration(whoosh_index, by_multiverseid, pagelen, repeats):
+    """
+    Returns per-page hydration times (seconds) over all QUERIES.
+    Only hydration is timed, not the search itself.
+    """
+    timings = []
+    parser = MultifieldParser(['rules_text', 'name', 'flavor_text'], whoosh_index.schema, group=OrGroup)
+    with whoosh_index.searcher() as searcher:
+        for text in QUERIES:
+            results = searcher.search_page(parser.parse(text), 1, pagelen=pagelen)
+            for _ in range(repeats):
+                start = time.perf_counter()
+                cards = []
+                for hit in results:
+                    stored = searcher.stored_fields(hit.docnum)
+                    card = stored.get('data_obj', None)
+                    if card is None:
+                        card = by_multiverseid.get(stored['multiverseid'])
+                    cards.append(card)
+                timings.append(time.perf_counter() - start)
+
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser('compact_index')
+    parser.add_argument('-i', '--input-targz', type=str, required=True, help='the .tar.gz file scraping outputs.')
+    parser.add_argument('-n', '--pagelen', type=int, default=10, help='results per page.')
+    parser.add_argument('-r', '--repeats', type=int, default=20, help='how many times to hydrate each page.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scrape_dir:
+        with tarfile.open(args.input_targz, mode='r:gz') as intar:
+            intar.extractall(scrape_dir)
+        sets_dir = os.path.join(scrape_dir, 'raw_data', 'sets')
+
+        for label, compact in (('legacy', False), ('compact', True)):
+            with tempfile.TemporaryDirectory() as td:
+                start = time.perf_counter()
+                ix, internal = IndexInitializer(sets_dir, td, compact=compact).init_indexes()
+                build_time = time.perf_counter() - start
+
+                timings = time_hydration(ix, internal['by_multiverseid'], args.pagelen, args.repeats)
+                print(f'{label:8s} index size: {dir_size(os.path.join(td, "whoosh_index")) / 1024:10.1f} KiB  '
+                      f'build: {build_time:6.2f}s  '
+                      f'hydrate/page: median {statistics.median(timings) * 1e6:8.1f}us  '
+                      f'max {max(timings) * 1e6:8.1f}us')
+                ix.close()
+
+if __name__ == '__main__':
+    sys.exit(main())
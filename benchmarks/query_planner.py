@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+# Samuel Dunn
+# CS 483, Fall 2019
+
+# Compares running representative advanced search forms as one flat whoosh
+# And (how advanced_query used to work) against the query planner, which runs
+# the filters first and has whoosh score only the text clauses.
+# The result cache is disabled so every run actually searches.
+#
+# Uses the installed corpus, run from the top level directory:
+#   python -m benchmarks.query_planner
+
+import sys
+import time
+import argparse
+import statistics
+
+from mtg_qe import data
+from mtg_qe.data.query_planner import parse_advanced_parameters
+
+FORMS = [
+    {'rules_text': 'draw a card', 'cmc': [2, 3], 'legal_formats': 'Modern'},
+    {'rules_text': 'destroy target creature', 'black': [1, -1], 'types': 'instant'},
+    {'name': 'dragon', 'power': [4, -1], 'red': [1, -1]},
+    {'flavor_text': 'fire', 'sets': 'Core Set 2020'},
+    {'cmc': 4, 'green': [2, -1], 'types': 'creature'},
+    {'legal_formats': 'Pauper', 'subtypes': 'elf warrior'},
+    {'rules_text': 'flying', 'toughness': [-1, 2], 'white': [1, -1], 'legal_formats': 'Legacy'},
+]
+
+def flat_and(parameters, pagelen):
+    """
+    Runs `parameters` the old way: every parameter a sub query of one whoosh And.
+    """
+    with data.get_searcher_pool().searcher() as searcher:
+        query = parse_advanced_parameters(searcher.schema, parameters)
+        results = searcher.search_page(query, 1, pagelen=pagelen)
+        return [data._card_from_stored_fields(hit.fields()) for hit in results]
+
+def planned(parameters, pagelen):
+    return data.advanced_search(parameters, 0, pagelen).hits
+
+def time_form(search, parameters, pagelen, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        search(parameters, pagelen)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser('query_planner')
+    parser.add_argument('-n', '--pagelen', type=int, default=10, help='results per page.')
+    parser.add_argument('-r', '--repeats', type=int, default=20, help='how many times to run each form.')
+    parser.add_argument('--explain', action='store_true', help='print the plan chosen for each form.')
+    args = parser.parse_args()
+
+    data.set_query_cache_size(0)
+    # warm up: load the index, internal index and derived stores.
+    planned(FORMS[0], args.pagelen)
+
+    for parameters in FORMS:
+        before = time_form(flat_and, parameters, args.pagelen, args.repeats)
+        after = time_form(planned, parameters, args.pagelen, args.repeats)
+        print(f'{before * 1e3:8.2f}ms -> {after * 1e3:8.2f}ms  ({before / after:5.1f}x)  {parameters}')
+        if args.explain:
+            print('    ' + data.explain_advanced_query(parameters).replace('\n', '\n    '))
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+# Samuel Dunn
+# CS 483, Fall 2019
+
+# Times rendering results.html and advanced_results.html from several threads at once,
+# the way cherrypy's worker threads do, and reports the median and 99th percentile render. Two ways:
+# 'before' is the old setup: a default jinja Environment (reload checks, no bytecode cache,
+# templates in jinja's LRU cache) with Card objects and an art_locator callback per row.
+# 'after' is the production Environment (see site/templating.py) with the flat rows
+# the handlers now pass, counting the time to build them.
+#
+# Uses the installed corpus, run from the top level directory:
+#   python -m benchmarks.render_concurrency
+#   python -m benchmarks.render_concurrency --threads 1 8 32
+
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+
+from jinja2 import Environment, FileSystemLoader
+
+from mtg_qe import data
+from mtg_qe.site.main import MTGSearch
+from mtg_qe.site.templating import TEMPLATE_DIR, make_environment
+from mtg_qe.site.static_assets import asset_url
+
+TEMPLATES = ('results.html', 'advanced_results.html')
+
+def legacy_templates(directory):
+    # the results templates as they were, calling back into python for every row's artwork.
+    for name in TEMPLATES:
+        with open(os.path.join(TEMPLATE_DIR, name)) as fd:
+            source = fd.read().replace("card['artwork']", 'art_locator(card)').replace("{% if card['text_html'] %}", '{% if card.text %}')
+            for field in ('multiverseid', 'name', 'text_html'):
+                source = source.replace(f"card['{field}']", f'card.{field}')
+        with open(os.path.join(directory, name), 'w') as fd:
+            fd.write(source)
+
+def percentile(sorted_timings, p):
+    return sorted_timings[min(len(sorted_timings) - 1, int(len(sorted_timings) * p))]
+
+def run(threads, renders, render_one):
+    """
+    Calls render_one(thread number, i) `renders` times from each of `threads` threads.
+    Returns every call's duration, sorted, and the total wall time.
+    """
+    timings = [[] for _ in range(threads)]
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(n):
+        barrier.wait()
+        for i in range(renders):
+            start = time.perf_counter()
+            render_one(n, i)
+            timings[n].append(time.perf_counter() - start)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for x in workers:
+        x.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for x in workers:
+        x.join()
+    return sorted(t for x in timings for t in x), time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser('render_concurrency')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 10], help='concurrent renderers to time (cherrypy defaults to 10 worker threads.)')
+    parser.add_argument('-r', '--renders', type=int, default=500, help='renders per thread.')
+    parser.add_argument('-n', '--results', type=int, default=10, help='results per page.')
+    args = parser.parse_args()
+
+    cards = [card for _, card in data.get_internal_index()['by_multiverseid'].items()]
+    rng = random.Random(483)
+    pages = [rng.sample(cards, args.results) for _ in range(64)]
+
+    legacy_dir = tempfile.mkdtemp(prefix='mtg_qe_legacy_templates')
+    cache_dir = tempfile.mkdtemp(prefix='mtg_qe_template_cache')
+    try:
+        legacy_templates(legacy_dir)
+        before_env = Environment(loader=FileSystemLoader(legacy_dir))
+        before_env.globals['asset'] = asset_url
+
+        start = time.perf_counter()
+        after_env = make_environment(True, cache_dir)
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        make_environment(True, cache_dir)
+        warm = time.perf_counter() - start
+        print(f'production environment: {cold * 1e3:.1f}ms to compile every template, {warm * 1e3:.1f}ms from the bytecode cache')
+
+        site = MTGSearch(after_env)
+        common = dict(searchquery='benchmark', corrected_from=None, pagenum=2, resultsnum=args.results,
+                      lastpage=0, nextpages=3, total=1000, facets=None)
+
+        def before(name):
+            def render_one(n, i):
+                before_env.get_template(name).render(result=pages[(n + i) % len(pages)],
+                                                     art_locator=site._locate_art_for_card, **common)
+            return render_one
+
+        def after(name):
+            def render_one(n, i):
+                after_env.get_template(name).render(result=site._result_rows(pages[(n + i) % len(pages)]), **common)
+            return render_one
+
+        print('template                threads        before p50/p99           after p50/p99   p99 speedup')
+        for name in TEMPLATES:
+            # once through each, so neither side times compiling.
+            before(name)(0, 0)
+            after(name)(0, 0)
+            for threads in args.threads:
+                old, _ = run(threads, args.renders, before(name))
+                new, _ = run(threads, args.renders, after(name))
+                print(f'{name:22s} {threads:8d}  {percentile(old, 0.5) * 1e6:8.1f}/{percentile(old, 0.99) * 1e6:8.1f}us'
+                      f'  {percentile(new, 0.5) * 1e6:8.1f}/{percentile(new, 0.99) * 1e6:8.1f}us'
+                      f'  {percentile(old, 0.99) / percentile(new, 0.99):8.2f}x')
+    finally:
+        shutil.rmtree(legacy_dir, ignore_errors=True)
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+# Samuel Dunn
+# CS 483, Fall 2019
+
+# Times rendering results.html for pages of 10, 50 and 100 results, two ways:
+# 'before' renders each card's rules text in the template (through the old uncompiled
+# regex, the way results pages used to), 'after' uses the html rendered at index time
+# (through the rows the results handlers pass the template.)
+# Cards are drawn at random from the corpus, the same cards for both.
+#
+# Uses the installed corpus, run from the top level directory:
+#   python -m benchmarks.render_results
+
+import os
+import re
+import sys
+import time
+import random
+import argparse
+import statistics
+
+from jinja2 import Environment, FileSystemLoader, DictLoader, ChoiceLoader
+
+from mtg_qe import data
+from mtg_qe.utils.mana import curly_bracket_to_img_link
+from mtg_qe.site.main import MTGSearch
+from mtg_qe.site.static_assets import asset_url
+
+TEMPLATES = os.path.join(os.path.dirname(data.__file__), '..', 'site', 'templates')
+
+def legacy_replace_curly_brackets_in_text(text):
+    # replace_curly_brackets_in_text as it was: the pattern compiled (well, looked up) per call,
+    # and a lambda per symbol.
+    if text:
+        sub_aux = lambda match: curly_bracket_to_img_link(match.group(1))
+        pattern = r'(\{.*?\})'
+        return re.sub(pattern, sub_aux, text)
+
+def time_renders(template, cards, repeats, **context):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        template.render(searchquery='benchmark', result=cards, corrected_from=None, pagenum=1,
+                        resultsnum=len(cards), lastpage=0, nextpages=3, **context)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser('render_results')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 50, 100], help='results per page to time.')
+    parser.add_argument('-r', '--repeats', type=int, default=200, help='renders per page size.')
+    args = parser.parse_args()
+
+    with open(os.path.join(TEMPLATES, 'results.html')) as fd:
+        legacy_source = fd.read().replace("{% if card['text_html'] %}", '{% if card.text %}')
+    legacy_source = legacy_source.replace("card['text_html']", 'mana_symbol_fixer(card.text)').replace("card['artwork']", 'art_locator(card)')
+    for field in ('multiverseid', 'name'):
+        legacy_source = legacy_source.replace(f"card['{field}']", f'card.{field}')
+
+    loader = FileSystemLoader(TEMPLATES)
+    after_env = Environment(loader=loader)
+    before_env = Environment(loader=ChoiceLoader([DictLoader({'results.html': legacy_source}), loader]))
+    for env in (after_env, before_env):
+        env.globals['asset'] = asset_url
+    after = after_env.get_template('results.html')
+    before = before_env.get_template('results.html')
+    site = MTGSearch(after_env)
+
+    cards = [card for _, card in data.get_internal_index()['by_multiverseid'].items()]
+    with_html = sum(1 for card in cards if card._text_html is not None)
+    print(f'{len(cards)} cards, {with_html} with rules text html from the index')
+
+    rng = random.Random(483)
+    art = site._locate_art_for_card
+    print(' results       before        after   speedup')
+    for size in args.sizes:
+        page = rng.sample(cards, size)
+        # touch text_html so cards without stored html (old corpora) don't time rendering it the first time.
+        for card in page:
+            card.text_html
+        old = time_renders(before, page, args.repeats, art_locator=art, mana_symbol_fixer=legacy_replace_curly_brackets_in_text)
+        new = time_renders(after, site._result_rows(page), args.repeats)
+        print(f'{size:8d} {old * 1e6:10.1f}us {new * 1e6:10.1f}us {old / new:8.2f}x')
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+# Samuel Dunn
+# CS 483, Fall 2019
+
+# Times building the similar cards neighbour lists, and measures the memory it peaks at,
+# for the corpus as it is and scaled up. A scaled corpus repeats every card, each copy
+# missing a random fifth of its features, so copies are near (but not exact) duplicates.
+# Peak memory is measured with tracemalloc, which sees numpy's allocations.
+#
+# Uses the installed corpus, run from the top level directory:
+#   python -m benchmarks.similar_cards
+#   python -m benchmarks.similar_cards --scales 1 10
+
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+
+from mtg_qe import data
+from mtg_qe.data import similar_cards
+from mtg_qe.data.similar_cards import card_features, tfidf_matrix, top_k_neighbours
+
+def scaled(names, features, scale, rng):
+    if scale == 1:
+        return names, features
+
+    out_names, out_features = [], []
+    for copy in range(scale):
+        for name, counts in zip(names, features):
+            out_names.append(f'{name} #{copy}')
+            out_features.append({x: n for x, n in counts.items() if copy == 0 or rng.random() >= 0.2})
+    return out_names, out_features
+
+def measure(features, k):
+    tracemalloc.start()
+    start = time.perf_counter()
+    matrix = tfidf_matrix(features)
+    vectorized = time.perf_counter()
+    top_k_neighbours(*matrix, k)
+    done = time.perf_counter()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return vectorized - start, done - vectorized, peak, len(matrix[1]), matrix[3]
+
+def main():
+    parser = argparse.ArgumentParser('similar_cards')
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10], help='corpus sizes to measure, as multiples of the installed corpus.')
+    parser.add_argument('-k', type=int, default=similar_cards.TOP_K, help='neighbours kept per card.')
+    args = parser.parse_args()
+
+    try:
+        import scipy
+        backend = f'scipy {scipy.__version__}'
+    except ImportError:
+        backend = 'numpy'
+
+    cards = [card for _, card in data.get_internal_index()['by_name'].items()]
+    names, features = [card.name for card in cards], [card_features(card) for card in cards]
+    print(f'{len(cards)} unique cards, k={args.k}, products by {backend}')
+    print(f'block budgets: {similar_cards.MAX_PRODUCTS} products, {similar_cards.MAX_CELLS} cells')
+    print(' scale     cards  features   nonzeros    tf-idf   neighbours   peak memory')
+
+    rng = random.Random(483)
+    for scale in args.scales:
+        _, scaled_features = scaled(names, features, scale, rng)
+        tfidf, neighbours, peak, nonzeros, columns = measure(scaled_features, args.k)
+        print(f'{scale:5d}x {len(scaled_features):9d} {columns:9d} {nonzeros:10d} {tfidf:8.2f}s {neighbours:11.2f}s '
+              f'{peak / 2**20:10.1f}MB')
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+# Samuel Dunn
+# CS 483, Fall 2019
+
+# Times name suggestions over a sweep of prefix lengths.
+# Prefixes are taken from random card names. 'cold' times clear the short
+# prefix cache before every lookup, 'warm' times repeat the same lookups.
+#
+# Uses the installed corpus, run from the top level directory:
+#   python -m benchmarks.suggest
+
+import sys
+import time
+import random
+import argparse
+import statistics
+
+from mtg_qe import data
+from mtg_qe.data.name_suggester import NameSuggester, get_name_suggester
+
+def time_lookups(suggester, prefixes, k, clear):
+    timings = []
+    for prefix in prefixes:
+        if clear:
+            suggester._cache.clear()
+        start = time.perf_counter()
+        suggester.suggest(prefix, k)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser('suggest')
+    parser.add_argument('-k', type=int, default=10, help='suggestions per lookup.')
+    parser.add_argument('-s', '--samples', type=int, default=500, help='prefixes per length.')
+    parser.add_argument('--max-length', type=int, default=10, help='longest prefix to time.')
+    args = parser.parse_args()
+
+    generation = data.get_index_generation()
+    suggester = get_name_suggester(generation)
+    if suggester is None:
+        print('corpus has no saved name suggester, building one from the internal index.')
+        suggester = NameSuggester.from_cards((card for _, card in data.get_internal_index()['by_name'].items()), generation)
+
+    rng = random.Random(483)
+    names = [suggester._names[rng.randrange(len(suggester))] for _ in range(args.samples)]
+    print(f'{len(suggester)} names, k={args.k}')
+    print(' len   matches(avg)     cold p50     cold max     warm p50')
+    for length in range(1, args.max_length + 1):
+        prefixes = [name[:length] for name in names]
+        matches = statistics.mean(len(range(*suggester._span(p.lower()))) for p in prefixes)
+        cold = time_lookups(suggester, prefixes, args.k, True)
+        warm = time_lookups(suggester, prefixes, args.k, False)
+        print(f'{length:4d} {matches:14.1f} {statistics.median(cold) * 1e6:10.1f}us {max(cold) * 1e6:10.1f}us '
+              f'{statistics.median(warm) * 1e6:10.1f}us')
+
+if __name__ == '__main__':
+    sys.exit(main())
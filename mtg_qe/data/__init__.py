@@ -12,10 +12,30 @@
 import os
 import functools
 
+import numpy as np
+
 from . import whoosh_integrations
 from . import internal_index_integration
-
-from whoosh.qparser import MultifieldParser, QueryParser, AndGroup, OrGroup
+from .results_page import ResultsPage
+from .query_cache import QueryCache
+from .columnar_store import get_columnar_store
+from .facet_index import get_facet_index
+from .query_planner import plan_advanced_query
+from .name_suggester import NameSuggester, get_name_suggester
+from .name_matcher import NameMatcher, get_name_matcher
+from .spelling import SpellingCorrector, get_spelling_corrector
+from . import artwork_pack
+from . import corpus_version
+from .related_index import find_related, related_built
+from .similar_cards import SimilarCards, get_similar_cards
+
+from whoosh.qparser import MultifieldParser, AndGroup, OrGroup
+
+# Results of recent searches, see `simple_search` and `advanced_search`.
+_query_cache = QueryCache(1024)
+
+# Document masks of advanced query filters, shared between queries that have filters in common.
+_filter_cache = QueryCache(256)
 
 def require_unpacked_archive(meth):
     """
@@ -38,12 +58,28 @@ def get_data_location():
 @require_unpacked_archive
 def get_whoosh_index():
     """
+    Returns the shared whoosh index handle.
+    """
+    return get_searcher_pool().index
+
+@require_unpacked_archive
+def get_searcher_pool():
+    """
+    Returns the process wide pool of whoosh searchers.
+    Use `with get_searcher_pool().searcher() as searcher:` to borrow one.
     """
     try:
-        return whoosh_integrations.get_whoosh_index()
+        return whoosh_integrations.get_searcher_pool()
     except Exception:
         unpack_archive()
-        return whoosh_integrations.get_whoosh_index()
+        return whoosh_integrations.get_searcher_pool()
+
+def get_index_generation():
+    """
+    Returns the generation of the whoosh index currently being searched.
+    This changes whenever a new index is written to disk.
+    """
+    return get_searcher_pool().generation
 
 @require_unpacked_archive
 def get_internal_index():
@@ -56,9 +92,23 @@ def get_internal_index():
     stores all cards (all cards scraped) by their multiverseid.
     Between the two, any time we have a result from whoosh and need
     to navigate to another card or print, we should be covered.
+    Note: the card 'dicts' are read-only stores that only inflate
+    cards when they are looked up (see LazyCardStore.)
     """
     return internal_index_integration.get_internal_index()
 
+def get_query_cache_stats():
+    """
+    Returns the hit/miss/eviction counters of the search result cache.
+    """
+    return _query_cache.stats
+
+def set_query_cache_size(max_entries):
+    """
+    Sets how many result pages the search result cache may hold. 0 disables caching.
+    """
+    _query_cache.max_entries = max_entries
+
 def get_all_formats():
     """
     Returns a alpabetized tuple of all playable formats as discovered while scraping
@@ -83,106 +133,374 @@ def get_all_card_subtypes():
     """
     return tuple(get_internal_index()['subtypes'])
 
-def simple_query(query, or_group=False, page = 0, n = 10):
+def _parse_simple_query(schema, query, or_group=False):
+    """
+    Builds the whoosh query object used by `simple_query` out of the user's input.
+    """
+    # parse against the main text fields (note: subtypes is here to help aid in "tribe" searches, and boost planeswalker results)
+    qparser = MultifieldParser(['rules_text', 'name', 'flavor_text'], schema, group = OrGroup if or_group else AndGroup)
+
+    return qparser.parse(query.lower()) # all text fields are lowered in whoosh, so do same here
+
+def _search_page(searcher, query, page, n, filter=None, facets=None):
+    """
+    Runs `query` through `searcher` once and packages the requested page,
+    along with the total hit count, into a ResultsPage.
+    :param filter: optionally, a set of document numbers results must be within.
+    :param facets: facet counts to attach to the ResultsPage.
+    """
+    # Quick note: whoosh expects pages to start with 1, so we'll take page+1
+    results = searcher.search_page(query, page+1, pagelen=n, filter=filter)
+
+    if results.total == 0:
+        return ResultsPage.empty(page, n, facets)
+
+    # whoosh clamps requests past the end to the last page, so report the page we actually got.
+    return ResultsPage([_card_from_stored_fields(x.fields()) for x in results], results.total, results.pagenum - 1, n, facets)
+
+def _page_from_docnums(searcher, docnums, page, n, facets=None):
+    """
+    Packages a page of an (already ordered) array of document numbers into a ResultsPage.
+    Page numbers past the end are clamped to the last page, like whoosh does.
+    """
+    total = len(docnums)
+    if total == 0:
+        return ResultsPage.empty(page, n, facets)
+
+    page = min(page, (total - 1) // n)
+    hits = [_card_from_stored_fields(searcher.stored_fields(int(x))) for x in docnums[page * n:(page + 1) * n]]
+    return ResultsPage(hits, total, page, n, facets)
+
+def _plan_advanced_query(searcher, generation, parameters):
+    """
+    Builds the QueryPlan for advanced query `parameters`, letting the columnar store
+    and facet bitsets answer the filters they can (when the corpus has them, and they match the index.)
+    """
+    doc_count = searcher.doc_count_all()
+    stores = [store for store in (get_columnar_store(generation), get_facet_index(generation))
+              if store is not None and store.doc_count == doc_count]
+    return plan_advanced_query(parameters, stores)
+
+def _advanced_search_page(searcher, generation, plan, page, n, facets=False):
+    """
+    Runs an advanced query according to `plan`.
+    The filters run first (most selective first, see QueryPlan.order) and whoosh only
+    scores the text clauses, restricted to the documents the filters let through.
+    """
+    import logging
+
+    # ordering the filters means estimating each one, which filter_mask skips when the
+    # combined mask is already cached. So only do it up front when the plan is being logged.
+    log = logging.getLogger('advanced_query')
+    if log.isEnabledFor(logging.DEBUG):
+        plan.order(searcher)
+        log.debug("query plan:\n%s", plan.explain())
+
+    doc_count = searcher.doc_count_all()
+    facet_index = get_facet_index(generation)
+    if facet_index is not None and facet_index.doc_count != doc_count:
+        facet_index = None
+
+    # facets are counted over the full result set, so we need all matches as a mask.
+    def facet_counts(matches):
+        return facet_index.counts(matches) if facets and facet_index is not None else None
+
+    mask = plan.filter_mask(searcher, _filter_cache, generation)
+    query = plan.scoring_query(searcher.schema)
+
+    if query is None:
+        # there's no text to score, whoosh would give every match the same score
+        # and order them by document number. So we can page straight out of the filter.
+        return _page_from_docnums(searcher, np.flatnonzero(mask), page, n, facet_counts(mask))
+
+    if mask is None:
+        counts = None
+        if facets and facet_index is not None:
+            counts = facet_counts(_docnums_to_mask(searcher.docs_for_query(query), doc_count))
+        return _search_page(searcher, query, page, n, facets=counts)
+
+    if not mask.any():
+        return ResultsPage.empty(page, n, facet_counts(mask))
+
+    # whoosh wants the filter as a set of document numbers, which is worth keeping around too.
+    allowed = _filter_cache.get(('allowed', plan.filter_key), generation)
+    if allowed is None:
+        allowed = set(np.flatnonzero(mask).tolist())
+        _filter_cache.put(('allowed', plan.filter_key), allowed, generation)
+
+    counts = None
+    if facets and facet_index is not None:
+        counts = facet_counts(_docnums_to_mask((x for x in searcher.docs_for_query(query) if x in allowed), doc_count))
+    return _search_page(searcher, query, page, n, filter=allowed, facets=counts)
+
+def _docnums_to_mask(docnums, doc_count):
+    """
+    Converts an iterable of document numbers into a boolean array.
+    """
+    mask = np.zeros(doc_count, dtype=bool)
+    mask[np.fromiter(docnums, dtype=np.int64)] = True
+    return mask
+
+def _card_from_stored_fields(stored):
+    """
+    Returns the Card a whoosh document refers to.
+    Legacy indexes pickle the whole card into the document, compact ones
+    only store the multiverseid, which we resolve through the internal index.
+    """
+    card = stored.get('data_obj', None)
+    if card is None:
+        card = find_card_by_multiverseid(stored['multiverseid'])
+
+    return card
+
+def _cached_search_page(generation, key, grouping, page, n, search):
+    """
+    Consults the result cache before calling `search` (which should produce the ResultsPage.)
+    Entries are keyed on `key`, the normalized form of the parsed query, so
+    inputs that only differ cosmetically share a cache entry.
+    """
+    key = (grouping, key, page, n)
+    results = _query_cache.get(key, generation)
+    if results is None:
+        results = search()
+        _query_cache.put(key, results, generation)
+
+    return results
+
+def _simple_search_with(searcher, generation, query, or_group, page, n, parsed=None):
+    """
+    `simple_search`'s work, using a searcher the caller already has.
+    :param dict parsed: optionally, a memo of already parsed queries (see `multi_search`)
+    """
+    key = (query, or_group)
+    if parsed is None or key not in parsed:
+        parsed_query = _parse_simple_query(searcher.schema, query, or_group)
+        if parsed is not None:
+            parsed[key] = parsed_query
+    else:
+        parsed_query = parsed[key]
+
+    return _cached_search_page(generation, repr(parsed_query.normalize()), 'or' if or_group else 'and', page, n,
+                               lambda: _search_page(searcher, parsed_query, page, n))
+
+def _advanced_search_with(searcher, generation, parameters, page, n, facets, plans=None):
+    """
+    `advanced_search`'s work, using a searcher the caller already has.
+    :param dict plans: optionally, a memo of already made QueryPlans (see `multi_search`)
+    """
+    key = repr(sorted(parameters.items()))
+    if plans is None or key not in plans:
+        plan = _plan_advanced_query(searcher, generation, parameters)
+        if plans is not None:
+            plans[key] = plan
+    else:
+        plan = plans[key]
+
+    if not plan.scoring and not plan.filters:
+        return ResultsPage.empty(page, n)
+
+    # run that query and return the appropriate results page.
+    return _cached_search_page(generation, plan.cache_key(searcher.schema), 'advanced+facets' if facets else 'advanced', page, n,
+                               lambda: _advanced_search_page(searcher, generation, plan, page, n, facets))
+
+def simple_search(query, or_group=False, page = 0, n = 10):
     """
     Performs a simple keyword query using `query` through whoosh. This, by default, will look at all 3 major text based fields. (name, rules text, flavor text.)
     :param str query: the input query
     :param bool or_group: specifies whetehr to use a AND grouping or an OR grouping.
     :param int page: the page to return.
     :param int n: how many results should be in the return set.
-    :return: Exact class TBD, will provide way to iterate over the page's worth of results.
+    :return: a ResultsPage holding the page's cards, the total hit count and the page count.
     """
-    ix = get_whoosh_index()
-
     # fix `page` and `n` (they may be string versions of ints)
     page = int(page)
     n = int(n)
 
-    # parse against the main text fields (note: subtypes is here to help aid in "tribe" searches, and boost planeswalker results)
-    qparser = MultifieldParser(['rules_text', 'name', 'flavor_text'], ix.schema, group = OrGroup if or_group else AndGroup)
-
-    query = qparser.parse(query.lower()) # all text fields are lowered in whoosh, so do same here
-
-    with ix.searcher() as searcher:
-        # Quick note: whoosh expects pages to start with 1, so we'll take page+1
-        results = searcher.search_page(query, page+1, pagelen=n)
-        return [x['data_obj'] for x in results]
-
+    pool = get_searcher_pool()
+    generation = pool.generation
+    with pool.searcher() as searcher:
+        return _simple_search_with(searcher, generation, query, or_group, page, n)
 
-def advanced_query(parameters, page = 0, n = 10):
+def advanced_search(parameters, page = 0, n = 10, facets = False):
     """
-    :param dict text_paramters: a dictionary of field-to-query pairs specifying text-based queries.
-        this is good for fields like "rules_text", "name", "flavor_text", etc.
-    :param dict range_parameters: a dictionary of field to range pairs.
-        this is good for fields like power, toughness, cmc, etc.
-    :param dict point_parameters: a dictionary of field to value parameters. Every card in the return
-        set must have an exact match to every value in the dict.
-        In example, if point_parameters is {'cmc': 5} then for every card in the set card.cmc == 5 must evaluate to true.
-        .. warning::
-            using this parameter will cause the query system to filter through whoosh results, slowing down computation.
+    :param dict parameters: a dictionary of field-to-query pairs. Values may be:
+        - strings, for text based fields like "rules_text", "name", "flavor_text", etc.
+        - [from, to] pairs for range queries (power, toughness, cmc, etc.), where -1 is an open bound.
+        - ints, for exact matches on numeric fields. (ie {'cmc': 5} means card.cmc == 5 for every card in the set.)
     :param int page: the 'page' of results to return
     :param int n: the number of results per page.
-    :return: Exact class TBD, will provide way to iterate over the page's worth of results.
+    :param bool facets: when True, the ResultsPage also carries per format/set/type/subtype
+        counts over the whole result set. (see ResultsPage.facets)
+    :return: a ResultsPage holding the page's cards, the total hit count and the page count.
     """
-    import whoosh.fields
-    from whoosh.query import And, Or
-    schema = get_whoosh_index().schema
-
     # fix `page` and `n` (they may be string versions of ints)
     page = int(page)
     n = int(n)
 
-    # After talking with Ben it sounds like we can do something to the effect
-    # of taking multiple sub queries and perform unions and intersections on their
-    # results
-    # This is going to be the best way to get the desired results.
-
-    # to start: build a list of all the query objects we'll be searching.
-    query_objs = []
-    for field, target in parameters.items():
-        # Coerce potential numeric point queries to whoosh syntax.
-        if isinstance(target, float):
-            target = int(target+0.5)
-        if isinstance(target, int):
-            target = str(target)
-            #target = f"{{{target-1} TO {target+1}}}"
-            #target = target.replace("[ TO", "[TO").replace("TO ]", "TO]")
-
-        # Coerce range queries to whoosh syntax, assume they're inclusive bounds.
-        if isinstance(target, (list, tuple)):
-            if len(target) != 2:
-                raise ValueError(f"Unable to treat parameter as range query! ({target})")
-            target = f"[{target[0] if target[0] != -1 else ''} TO {target[1] if target[1] != -1 else ''}]"
-
-            # whoosh has issues if there's an open ended range with a space separating TO from the bracket:
-            target = target.replace("[ TO", "[TO").replace("TO ]", "TO]")
-
-        # the comma-separated KEYWORD fields have been giving us some issue
-        # it seems that whoosh is a bit bi-polar when it comes to commas in these fields.
-        # so we'll add two subqueries, one with a comma and one without.
-        if field in schema and isinstance(schema[field], whoosh.fields.KEYWORD):
-            # add the extra query object:
-            subqueries = [QueryParser(field, schema).parse(target.lower()+','),
-                          QueryParser(field, schema).parse(target.lower())]
-            query_objs.append(Or(subqueries))
+    pool = get_searcher_pool()
+    generation = pool.generation
+    with pool.searcher() as searcher:
+        return _advanced_search_with(searcher, generation, parameters, page, n, facets)
+
+def multi_search(specs):
+    """
+    Runs a batch of simple and/or advanced queries with a single searcher.
+    Queries in the batch share parsed queries and advanced query plans
+    (and so their filter masks), so bursts of related queries are cheap.
+    :param list specs: one dict per query, either:
+        - {'query': str, 'or_group': bool, 'page': int, 'n': int} for a simple search, or
+        - {'parameters': dict, 'page': int, 'n': int, 'facets': bool} for an advanced search.
+        Everything but 'query'/'parameters' is optional, and defaults as in `simple_search`/`advanced_search`.
+    :return: a list of (ResultsPage, seconds) pairs, in the same order as `specs`.
+    """
+    import time
+
+    parsed, plans, results = {}, {}, []
+    pool = get_searcher_pool()
+    generation = pool.generation
+    with pool.searcher() as searcher:
+        for spec in specs:
+            if not isinstance(spec, dict):
+                raise ValueError(f"Query specs must be dicts! ({spec!r})")
+
+            page = int(spec.get('page', 0))
+            n = int(spec.get('n', 10))
+
+            start = time.perf_counter()
+            if 'query' in spec:
+                page_obj = _simple_search_with(searcher, generation, str(spec['query']), bool(spec.get('or_group', False)),
+                                               page, n, parsed)
+            elif 'parameters' in spec:
+                if not isinstance(spec['parameters'], dict):
+                    raise ValueError(f"Advanced query parameters must be a dict! ({spec['parameters']!r})")
+                page_obj = _advanced_search_with(searcher, generation, spec['parameters'], page, n,
+                                                 bool(spec.get('facets', False)), plans)
+            else:
+                raise ValueError(f"Query specs need either a 'query' or 'parameters' entry! ({spec!r})")
+
+            results.append((page_obj, time.perf_counter() - start))
+
+    return results
+
+def explain_advanced_query(parameters):
+    """
+    Returns a description of how `advanced_search` would run `parameters`:
+    which clauses whoosh scores, and which filters run first (and in what order.)
+    The same description is logged at debug level whenever an advanced query runs.
+    """
+    pool = get_searcher_pool()
+    with pool.searcher() as searcher:
+        plan = _plan_advanced_query(searcher, pool.generation, parameters)
+        plan.order(searcher)
+        return plan.explain()
+
+def iter_search(query=None, parameters=None, or_group=False, ranked=False):
+    """
+    Iterates over every card matching a simple (`query`) or advanced (`parameters`) search,
+    for exporting whole result sets. Exactly one of `query` and `parameters` should be given.
+    The search is run once, and cards are hydrated one at a time as they're consumed,
+    so memory use doesn't grow with the number of results. (The searcher is held until
+    the iterator is exhausted or closed.)
+    :param bool or_group: as in `simple_search`.
+    :param bool ranked: when True cards come in rank order, which means whoosh has to score
+        (and hold the document numbers of) every match first. Otherwise they come in index order,
+        straight off of the postings.
+    :return: an iterator of Card objects.
+    """
+    if (query is None) == (parameters is None):
+        raise ValueError("iter_search needs exactly one of `query` or `parameters`")
+    if parameters is not None and not isinstance(parameters, dict):
+        raise ValueError(f"Advanced query parameters must be a dict! ({parameters!r})")
+
+    pool = get_searcher_pool()
+
+    # parse up front, so bad queries are reported when the iterator is made (not part way through consuming it.)
+    with pool.searcher() as searcher:
+        if query is not None:
+            plan = None
+            parsed = _parse_simple_query(searcher.schema, query, or_group)
+        else:
+            plan = _plan_advanced_query(searcher, pool.generation, parameters)
+            parsed = plan.scoring_query(searcher.schema)
+
+    def docnums(searcher):
+        mask = None
+        if plan is not None:
+            if not plan.scoring and not plan.filters:
+                return
+            mask = plan.filter_mask(searcher, _filter_cache, pool.generation)
+
+        if parsed is None:
+            # filters only, their mask is already in index order.
+            yield from (int(x) for x in np.flatnonzero(mask))
+
+        elif ranked:
+            allowed = None if mask is None else set(np.flatnonzero(mask).tolist())
+            yield from (docnum for docnum, _ in searcher.search(parsed, limit=None, filter=allowed).items())
 
         else:
-            query_objs.append(QueryParser(field, schema).parse(target.lower())) # again, lower capitalization on everything
+            yield from (docnum for docnum in searcher.docs_for_query(parsed) if mask is None or mask[docnum])
+
+    def cards():
+        with pool.searcher() as searcher:
+            for docnum in docnums(searcher):
+                yield _card_from_stored_fields(searcher.stored_fields(docnum))
+
+    return cards()
 
-    if not len(query_objs):
-        return []
+def simple_query(query, or_group=False, page = 0, n = 10):
+    """
+    Performs a simple keyword query using `query` through whoosh. This, by default, will look at all 3 major text based fields. (name, rules text, flavor text.)
+    :param str query: the input query
+    :param bool or_group: specifies whetehr to use a AND grouping or an OR grouping.
+    :param int page: the page to return.
+    :param int n: how many results should be in the return set.
+    :return: a list of the page's cards. (see `simple_search` for the full ResultsPage.)
+    """
+    return simple_search(query, or_group, page, n).hits
 
-    # now build a nice big compound query:
-    query = And(query_objs)
-    with get_whoosh_index().searcher() as searcher:
-        # run that query and return the appropriate results page.
-        try:
-            results = searcher.search_page(query, page+1, n)
-        except Exception:
-            print(repr(query))
-            raise
 
-        return [x['data_obj'] for x in results]
+def advanced_query(parameters, page = 0, n = 10):
+    """
+    :param dict parameters: see `advanced_search`
+    :param int page: the 'page' of results to return
+    :param int n: the number of results per page.
+    :return: a list of the page's cards. (see `advanced_search` for the full ResultsPage.)
+    """
+    return advanced_search(parameters, page, n).hits
+
+def suggest_names(prefix, k=10):
+    """
+    Returns up to `k` card names starting with `prefix`, most printed cards first.
+    This never touches whoosh, so it's cheap enough to call on every keystroke.
+    """
+    generation = get_index_generation()
+    suggester = get_name_suggester(generation)
+    if suggester is None:
+        # corpora built before the suggester existed, build one from the internal index (once.)
+        suggester = globals().get('!!_name_suggester', None)
+        if suggester is None or suggester.generation != generation:
+            suggester = NameSuggester.from_cards((card for _, card in get_internal_index()['by_name'].items()), generation)
+            globals()['!!_name_suggester'] = suggester
+
+    return suggester.suggest(prefix, int(k))
+
+def suggest_correction(query):
+    """
+    Returns a spelling corrected version of simple query `query`, or None if no
+    word in it needs (or has) a correction. Words are corrected against the
+    terms in the name and rules text fields, see SpellingCorrector.
+    """
+    generation = get_index_generation()
+    corrector = get_spelling_corrector(generation)
+    if corrector is None:
+        # corpora built before the corrector existed, build one from the whoosh index (once.)
+        corrector = globals().get('!!_spelling_corrector', None)
+        if corrector is None or corrector.generation != generation:
+            corrector = SpellingCorrector.build(get_whoosh_index())
+            globals()['!!_spelling_corrector'] = corrector
+
+    return corrector.correct(query)
 
 def find_card_by_multiverseid(multiverseid):
     """
@@ -196,8 +514,100 @@ def find_card_by_name(name):
     """
     Returns the card with matching multiverseid, or None if no match.
     Note: card printings have a many to 1 relationship with name.
+    If there's no exact match, names that only differ in case, accents or punctuation
+    (ie. "aether vial" for "Æther Vial") are also accepted.
+    """
+    card = get_internal_index()['by_name'].get(name, None)
+    if card is None:
+        matches = _get_name_matcher().exact(name)
+        if len(matches) == 1:
+            card = get_internal_index()['by_name'].get(matches[0], None)
+
+    return card
+
+def find_cards_by_approximate_name(name, k=5):
+    """
+    Returns up to `k` cards whose names are closest to `name`, best match first.
+    Names are compared with case, accents and punctuation ignored, candidates are
+    found by shared character trigrams and ranked by edit distance.
+    :return: a list of (Card, distance) pairs, where a distance of 0 means the names match once normalized.
+    """
+    by_name = get_internal_index()['by_name']
+    return [(by_name[match], distance) for match, distance in _get_name_matcher().approximate(name, int(k))]
+
+def _get_name_matcher():
+    """
+    Returns the NameMatcher for the current index.
+    """
+    generation = get_index_generation()
+    matcher = get_name_matcher(generation)
+    if matcher is None:
+        # corpora built before the matcher existed, build one from the internal index (once.)
+        matcher = globals().get('!!_name_matcher', None)
+        if matcher is None or matcher.generation != generation:
+            matcher = NameMatcher.from_names(get_internal_index()['by_name'].keys(), generation)
+            globals()['!!_name_matcher'] = matcher
+
+    return matcher
+
+@require_unpacked_archive
+def find_related_cards(name, k=10):
+    """
+    Returns up to `k` cards most often found in decks alongside the card named `name`, most related first.
+    Returns None if the related cards index has no entry for `name` (or there's no index.)
+    Cards the site has refreshed come from its overlay, the rest from the corpus' index (see related_index.find_related.)
+    """
+    related, _ = find_related(name, k)
+    if related is None:
+        return None
+
+    by_name = get_internal_index()['by_name']
+    return [by_name[x] for x, _ in related if x in by_name]
+
+@require_unpacked_archive
+def find_similar_cards(name, k=10):
+    """
+    Returns up to `k` cards most like the card named `name` (by rules text, type line and colors),
+    most similar first. Returns None if there's no card named `name`.
+    """
+    generation = get_index_generation()
+    similar = get_similar_cards(generation)
+    if similar is None:
+        # corpora built before similar cards existed, build them from the whoosh index (once.)
+        similar = globals().get('!!_similar_cards', None)
+        if similar is None or similar.generation != generation:
+            similar = SimilarCards.build(get_whoosh_index(), _card_from_stored_fields)
+            globals()['!!_similar_cards'] = similar
+
+    found = similar.similar(name, k)
+    if found is None:
+        return None
+
+    by_name = get_internal_index()['by_name']
+    return [by_name[x] for x, _ in found if x in by_name]
+
+@require_unpacked_archive
+def get_artwork_manifest():
+    """
+    Returns the corpus' ArtworkManifest: which cards have local artwork, with each image's size and hash.
+    """
+    return artwork_pack.get_artwork_manifest()
+
+@require_unpacked_archive
+def get_artwork_pack():
+    """
+    Returns the corpus' ArtworkPack, or None if the corpus predates artwork packs
+    (in which case the artwork is loose files under get_data_location()/artwork.)
+    """
+    return artwork_pack.get_artwork_pack()
+
+@require_unpacked_archive
+def get_corpus_version():
+    """
+    Returns (version, built) for the installed corpus: a hash of its contents, and when (time.time()) it was built.
+    The version only changes when a different corpus is installed.
     """
-    return get_internal_index()['by_name'].get(name, None)
+    return corpus_version.get_corpus_version()
 
 def unpack_archive():
     """
@@ -208,8 +618,7 @@ def unpack_archive():
     Info:
     The archive contains a folder 'corpus_data' that looks something like this:
     corpus_data/
-        artwork/
-            <all artwork folders and files>
+        artwork.pack   (corpora built before the artwork pack have an artwork/ folder of images instead)
 
         whoosh_index/
             <whoosh index files>
@@ -0,0 +1,252 @@
+# Samuel Dunn
+# CS 483, Fall 2019
+
+# This module provides the artwork pack: every card image in the corpus
+# concatenated into one file, followed by an index of where each card's image starts.
+# Serving an image is then a slice of a memory mapped file, rather than a
+# file (and directory) per card that all have to be extracted on first boot.
+#
+# Layout:
+#   MAGIC
+#   image bytes, back to back
+#   index: three little-endian int64 arrays (multiverseids, sorted; offsets; lengths)
+#   footer: int64 index offset, int64 image count, MAGIC
+#
+# Alongside the pack (or loose artwork) goes the artwork manifest: which multiverseids have
+# artwork, with each image's size and sha256, so the site can tell which cards have artwork
+# (and give out strong ETags) without touching the filesystem.
+
+import os
+import mmap
+import struct
+import hashlib
+
+import numpy as np
+
+ARTWORK_PACK_FILE = 'artwork.pack'
+ARTWORK_MANIFEST_FILE = 'artwork_manifest.npz'
+
+MAGIC = b'MTGART01'
+_FOOTER = struct.Struct('<qq8s')
+
+def _artwork_images(artwork_dir):
+    """
+    Returns [(multiverseid, image path relative to `artwork_dir`)] for the scraper's artwork directory
+    (one folder per multiverseid, holding that printing's image), sorted by multiverseid.
+    """
+    entries = []
+    for name in os.listdir(artwork_dir):
+        folder = os.path.join(artwork_dir, name)
+        if not name.isdigit() or not os.path.isdir(folder):
+            continue
+        images = sorted(x for x in os.listdir(folder) if os.path.isfile(os.path.join(folder, x)))
+        if images:
+            entries.append((int(name), os.path.join(name, images[0])))
+    return sorted(entries)
+
+def write_artwork_pack(artwork_dir, path):
+    """
+    Packs the scraper's artwork directory into a single file at `path`.
+    Returns the ArtworkManifest of the packed images.
+    """
+    ids, offsets, lengths, digests, paths = [], [], [], [], []
+    with open(path, 'wb') as out:
+        out.write(MAGIC)
+        for multiverseid, image in _artwork_images(artwork_dir):
+            with open(os.path.join(artwork_dir, image), 'rb') as fd:
+                blob = fd.read()
+            ids.append(multiverseid)
+            offsets.append(out.tell())
+            lengths.append(len(blob))
+            digests.append(hashlib.sha256(blob).digest())
+            paths.append(image)
+            out.write(blob)
+
+        index_offset = out.tell()
+        for values in (ids, offsets, lengths):
+            out.write(np.array(values, dtype='<i8').tobytes())
+        out.write(_FOOTER.pack(index_offset, len(ids), MAGIC))
+
+    return ArtworkManifest(ids, lengths, digests, paths)
+
+class ArtworkManifest(object):
+    """
+    The multiverseids with local artwork, and each image's size, sha256 and (for loose artwork)
+    path within the artwork directory.
+    """
+    def __init__(self, ids, sizes, digests, paths):
+        """
+        :param ids: sorted multiverseids.
+        :param sizes: parallel to `ids`, each image's size in bytes.
+        :param digests: parallel to `ids`, each image's sha256 digest (as bytes, or an N x 32 uint8 array.)
+        :param list paths: parallel to `ids`, each image's path relative to the artwork directory.
+        """
+        self._ids = np.asarray(ids, dtype=np.int64)
+        self._sizes = np.asarray(sizes, dtype=np.int64)
+        self._digests = np.frombuffer(b''.join(digests), dtype=np.uint8).reshape(-1, 32) if isinstance(digests, list) else np.asarray(digests, dtype=np.uint8)
+        self._paths = list(paths)
+        # the hex digests get asked for on every artwork request, work them out once.
+        self._etags = {}
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _find(self, multiverseid):
+        try:
+            multiverseid = int(multiverseid)
+        except (TypeError, ValueError):
+            return None
+        i = int(np.searchsorted(self._ids, multiverseid))
+        return i if i < len(self._ids) and self._ids[i] == multiverseid else None
+
+    def __contains__(self, multiverseid):
+        return self._find(multiverseid) is not None
+
+    def size(self, multiverseid):
+        i = self._find(multiverseid)
+        return None if i is None else int(self._sizes[i])
+
+    def path(self, multiverseid):
+        """
+        Returns the path (relative to the artwork directory) of `multiverseid`'s image, or None.
+        """
+        i = self._find(multiverseid)
+        return None if i is None else self._paths[i]
+
+    def etag(self, multiverseid):
+        """
+        Returns a strong ETag (quoted sha256 of the image) for `multiverseid`'s artwork, or None.
+        """
+        i = self._find(multiverseid)
+        if i is None:
+            return None
+        etag = self._etags.get(i, None)
+        if etag is None:
+            etag = self._etags[i] = f'"{self._digests[i].tobytes().hex()}"'
+        return etag
+
+    def save(self, path):
+        """
+        Writes the manifest to `path` (a .npz file.)
+        """
+        np.savez(path, ids=self._ids, sizes=self._sizes, digests=self._digests, paths=np.array(self._paths, dtype=str))
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a manifest previously written by `save`.
+        """
+        with np.load(path) as archive:
+            return cls(archive['ids'], archive['sizes'], archive['digests'], archive['paths'].tolist())
+
+    @classmethod
+    def from_directory(cls, artwork_dir):
+        """
+        Builds a manifest of the loose images in `artwork_dir` (reading every one of them.)
+        """
+        ids, sizes, digests, paths = [], [], [], []
+        for multiverseid, image in _artwork_images(artwork_dir):
+            with open(os.path.join(artwork_dir, image), 'rb') as fd:
+                blob = fd.read()
+            ids.append(multiverseid)
+            sizes.append(len(blob))
+            digests.append(hashlib.sha256(blob).digest())
+            paths.append(image)
+        return cls(ids, sizes, digests, paths)
+
+    @classmethod
+    def from_pack(cls, pack):
+        """
+        Builds a manifest of the images in ArtworkPack `pack`.
+        """
+        digests = [hashlib.sha256(pack.get(x)).digest() for x in pack._ids]
+        return cls(pack._ids, pack._lengths, digests, [''] * len(pack))
+
+class ArtworkPack(object):
+    """
+    Read-only access to an artwork pack through a memory map.
+    """
+    def __init__(self, path):
+        self._path = path
+        self._fd = open(path, 'rb')
+        self._map = mmap.mmap(self._fd.fileno(), 0, access=mmap.ACCESS_READ)
+        self.mtime = os.path.getmtime(path)
+
+        index_offset, count, magic = _FOOTER.unpack(self._map[-_FOOTER.size:])
+        if magic != MAGIC or self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f'{path} is not an artwork pack.')
+
+        index = np.frombuffer(self._map[index_offset:index_offset + 3 * 8 * count], dtype='<i8')
+        self._ids, self._offsets, self._lengths = index[:count], index[count:2*count], index[2*count:]
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _find(self, multiverseid):
+        try:
+            multiverseid = int(multiverseid)
+        except (TypeError, ValueError):
+            return None
+        i = int(np.searchsorted(self._ids, multiverseid))
+        return i if i < len(self._ids) and self._ids[i] == multiverseid else None
+
+    def __contains__(self, multiverseid):
+        return self._find(multiverseid) is not None
+
+    def get(self, multiverseid):
+        """
+        Returns the image bytes for `multiverseid` (a memoryview into the pack), or None if it isn't packed.
+        """
+        i = self._find(multiverseid)
+        if i is None:
+            return None
+        start = int(self._offsets[i])
+        return memoryview(self._map)[start:start + int(self._lengths[i])]
+
+    def close(self):
+        self._map.close()
+        self._fd.close()
+
+
+def get_artwork_pack():
+    """
+    Returns the ArtworkPack shipped with the corpus, or None if the corpus has loose artwork files instead.
+    """
+    # same module-global caching trick as internal_index_integration.get_internal_index
+    if '!!_artwork_pack' not in globals():
+        from . import get_data_location
+        path = os.path.join(get_data_location(), ARTWORK_PACK_FILE)
+        globals()['!!_artwork_pack'] = ArtworkPack(path) if os.path.exists(path) else None
+
+    return globals()['!!_artwork_pack']
+
+def get_artwork_manifest():
+    """
+    Returns the corpus' ArtworkManifest. Corpora built before the manifest existed get one
+    made from their artwork (once, it's saved to the corpus for next time.)
+    """
+    if '!!_artwork_manifest' not in globals():
+        from . import get_data_location
+        path = os.path.join(get_data_location(), ARTWORK_MANIFEST_FILE)
+        if os.path.exists(path):
+            manifest = ArtworkManifest.load(path)
+        else:
+            pack = get_artwork_pack()
+            artwork_dir = os.path.join(get_data_location(), 'artwork')
+            if pack is not None:
+                manifest = ArtworkManifest.from_pack(pack)
+            elif os.path.isdir(artwork_dir):
+                manifest = ArtworkManifest.from_directory(artwork_dir)
+            else:
+                manifest = ArtworkManifest([], [], [], [])
+
+            try:
+                manifest.save(path)
+            except OSError:
+                # a read-only install, it'll have to be worked out again next time.
+                pass
+
+        globals()['!!_artwork_manifest'] = manifest
+
+    return globals()['!!_artwork_manifest']
@@ -0,0 +1,170 @@
+# Samuel Dunn
+# CS 483, Fall 2019
+
+# This module provides a columnar copy of the numeric whoosh fields.
+# Each column is a numpy array indexed by whoosh document number, which
+# lets range and point constraints (cmc, power, color counts, etc.) be
+# answered with vectorized comparisons instead of walking whoosh postings.
+
+import os
+import threading
+
+import numpy as np
+
+# the numeric fields in the whoosh schema that get a column.
+NUMERIC_COLUMNS = ('cmc', 'power', 'toughness', 'white', 'blue', 'black', 'red', 'green')
+
+COLUMNS_FILE = 'columns.npz'
+
+class ColumnarStore(object):
+    """
+    Holds one float32 array per numeric field, where element i is the value
+    for whoosh document i. Documents without a value (ie. a power of '*')
+    hold NaN, which never satisfies a comparison, matching whoosh's behavior.
+
+    A store is only valid for the index generation it was built from.
+    """
+    def __init__(self, columns, generation):
+        """
+        :param dict columns: maps field names to equal length numpy arrays.
+        :param int generation: the whoosh index generation the columns line up with.
+        """
+        self._columns = columns
+        self._generation = generation
+        self._doc_count = len(next(iter(columns.values()))) if columns else 0
+
+    @property
+    def generation(self):
+        return self._generation
+
+    @property
+    def doc_count(self):
+        return self._doc_count
+
+    def column(self, field):
+        """
+        Returns the array backing `field`.
+        """
+        return self._columns[field]
+
+    def can_filter(self, field, target):
+        """
+        Returns True if the advanced query parameter `field`: `target` can be answered by this store.
+        Targets follow advanced_query's conventions: a number for a point query,
+        or a [from, to] pair for a range query.
+        """
+        if field not in self._columns:
+            return False
+
+        if isinstance(target, (list, tuple)):
+            return len(target) == 2 and all(isinstance(x, (int, float)) and not isinstance(x, bool) for x in target)
+
+        return isinstance(target, (int, float)) and not isinstance(target, bool)
+
+    def mask(self, field, target):
+        """
+        Returns a boolean array flagging the documents that satisfy `field`: `target`.
+        Range bounds are inclusive, and -1 stands for an open bound (as in advanced_query.)
+        """
+        column = self._columns[field]
+        if isinstance(target, (list, tuple)):
+            low, high = target
+            result = np.ones(self._doc_count, dtype=bool) if low == -1 else column >= low
+            if high != -1:
+                result &= column <= high
+
+            # NaN slips through open ranges (np.ones), make sure its excluded.
+            if low == -1 and high == -1:
+                result &= ~np.isnan(column)
+            return result
+
+        # point queries are rounded to whole numbers, like whoosh does in advanced_query.
+        if isinstance(target, float):
+            target = int(target + 0.5)
+        return column == target
+
+    def filter(self, constraints):
+        """
+        Returns the sorted array of document numbers that satisfy every constraint.
+        :param dict constraints: field: target pairs (see `can_filter`)
+        """
+        result = np.ones(self._doc_count, dtype=bool)
+        for field, target in constraints.items():
+            result &= self.mask(field, target)
+
+        return np.flatnonzero(result)
+
+    def save(self, path):
+        """
+        Writes the store to `path` (a .npz file.)
+        """
+        np.savez(path, __generation__=np.array(self._generation), **self._columns)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a store previously written by `save`.
+        """
+        with np.load(path) as archive:
+            columns = {name: archive[name] for name in archive.files if name != '__generation__'}
+            generation = int(archive['__generation__'])
+
+        return cls(columns, generation)
+
+    @classmethod
+    def build(cls, whoosh_index, documents_for):
+        """
+        Builds a store lining up with the documents in `whoosh_index`.
+        :param documents_for: a callable that takes a document's stored fields and returns
+            the field values that were indexed for it (see index_setup.make_whoosh_document)
+        """
+        with whoosh_index.searcher() as searcher:
+            reader = searcher.reader()
+            doc_count = reader.doc_count_all()
+            columns = {name: np.full(doc_count, np.nan, dtype=np.float32) for name in NUMERIC_COLUMNS}
+            for docnum, stored in reader.iter_docs():
+                doc = documents_for(stored)
+                for name in NUMERIC_COLUMNS:
+                    value = doc.get(name, None)
+                    if value is not None:
+                        columns[name][docnum] = value
+
+        return cls(columns, whoosh_index.latest_generation())
+
+
+def get_columnar_store(generation):
+    """
+    Returns the ColumnarStore saved with the corpus, so long as it was built
+    for index generation `generation`. Returns None otherwise (including when
+    the corpus doesn't have one), in which case callers should use whoosh alone.
+    """
+    return load_corpus_store(COLUMNS_FILE, ColumnarStore.load, generation)
+
+def load_corpus_store(filename, loader, generation):
+    """
+    Loads (and caches) a store saved in the corpus directory under `filename`.
+    The store is only returned if its `generation` matches `generation`.
+    :param loader: a callable taking the file's path and returning the store.
+    """
+    # same module-global caching trick as internal_index_integration.get_internal_index
+    store = globals().get(f'!!_{filename}', None)
+    if store is not None and store.generation == generation:
+        return store
+
+    # Only look at the disk once per generation, the file won't appear by itself.
+    if globals().get(f'!!_{filename}_checked', None) == generation:
+        return None
+
+    with _load_lock:
+        from . import get_data_location
+        path = os.path.join(get_data_location(), filename)
+        store = loader(path) if os.path.exists(path) else None
+        globals()[f'!!_{filename}'] = store
+        globals()[f'!!_{filename}_checked'] = generation
+
+    if store is None or store.generation != generation:
+        return None
+
+    return store
+
+_load_lock = threading.Lock()
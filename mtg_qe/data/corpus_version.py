@@ -0,0 +1,86 @@
+# Samuel Dunn
+# CS 483, Fall 2019
+
+# This module provides the corpus version: a hash of the files that make up the corpus,
+# recorded (with when the corpus was built) when the corpus is built. The site uses it to tag
+# its pages, since a page can only change when a new corpus is deployed.
+#
+# The hash covers everything searches and pages are made from: the internal index, the whoosh
+# index, the derived stores and the artwork manifest (which has every image's hash, so the
+# artwork itself isn't read.) The related cards index is left out, it's rebuilt while the site runs.
+
+import os
+import json
+import time
+import hashlib
+
+from .artwork_pack import ARTWORK_MANIFEST_FILE
+
+CORPUS_VERSION_FILE = 'corpus_version.json'
+
+def _versioned_files(corpus_dir):
+    """
+    Returns the paths (relative to `corpus_dir`) of the files the corpus version covers, sorted.
+    """
+    from .index_setup import DERIVED_FILES
+
+    names = ['internal_index.json', ARTWORK_MANIFEST_FILE] + list(DERIVED_FILES)
+    index_dir = os.path.join(corpus_dir, 'whoosh_index')
+    if os.path.isdir(index_dir):
+        # whoosh's lock files come and go, and say nothing about the contents.
+        names.extend('whoosh_index/' + x for x in os.listdir(index_dir) if not x.endswith('.lock'))
+
+    return sorted(x for x in names if os.path.isfile(os.path.join(corpus_dir, x)))
+
+def compute_corpus_version(corpus_dir):
+    """
+    Returns the version (a hex digest) of the corpus in `corpus_dir`.
+    """
+    digest = hashlib.sha256()
+    for name in _versioned_files(corpus_dir):
+        digest.update(name.encode('utf-8') + b'\0')
+        with open(os.path.join(corpus_dir, name), 'rb') as fd:
+            for block in iter(lambda: fd.read(1 << 20), b''):
+                digest.update(block)
+        digest.update(b'\0')
+
+    return digest.hexdigest()[:32]
+
+def write_corpus_version(corpus_dir, built=None):
+    """
+    Works out the version of the corpus in `corpus_dir` and records it there, with when it was built.
+    Returns (version, built.)
+    :param float built: when (time.time()) the corpus was built, defaults to now.
+    """
+    version = compute_corpus_version(corpus_dir)
+    built = time.time() if built is None else built
+    with open(os.path.join(corpus_dir, CORPUS_VERSION_FILE), 'w') as fd:
+        json.dump({'version': version, 'built': built}, fd)
+    return version, built
+
+def get_corpus_version():
+    """
+    Returns (version, built) for the installed corpus: its version, and when (time.time()) it was built.
+    Corpora built before versions were recorded get one worked out from their files (once, it's saved
+    to the corpus for next time), with the internal index's modification time as when they were built.
+    """
+    # same module-global caching trick as internal_index_integration.get_internal_index
+    if '!!_corpus_version' not in globals():
+        from . import get_data_location
+        corpus_dir = get_data_location()
+        path = os.path.join(corpus_dir, CORPUS_VERSION_FILE)
+        if os.path.exists(path):
+            with open(path) as fd:
+                obj = json.load(fd)
+            found = (obj['version'], obj['built'])
+        else:
+            built = os.path.getmtime(os.path.join(corpus_dir, 'internal_index.json'))
+            try:
+                found = write_corpus_version(corpus_dir, built)
+            except OSError:
+                # a read-only install, it'll have to be worked out again next time.
+                found = (compute_corpus_version(corpus_dir), built)
+
+        globals()['!!_corpus_version'] = found
+
+    return globals()['!!_corpus_version']
@@ -0,0 +1,166 @@
+# Samuel Dunn
+# CS 483, Fall 2019
+
+# This module provides the deck cache: what we've fetched from tappedout for related cards,
+# kept in one SQLite file. It holds the card names of each deck (already pulled out of the
+# deck's page) and the deck links each search term turned up. Entries expire after a while,
+# and the oldest are evicted once the cache holds too many decks (or searches.)
+
+import os
+import json
+import time
+import sqlite3
+import threading
+
+# where the site keeps its deck cache, and where it used to keep deck pages.
+DEFAULT_CACHE_FILE = os.path.join(os.path.dirname(__file__), 'related_cache.sqlite')
+LEGACY_CACHE_DIR = os.path.join(os.path.dirname(__file__), 'related_cache')
+
+# how long (in seconds) entries are good for. Decks rarely change, search results do.
+DECK_TTL = 30 * 24 * 60 * 60
+SEARCH_TTL = 7 * 24 * 60 * 60
+
+# the most decks and searches kept, past these the oldest are evicted.
+# (a search is kept per card refreshed, there's a little over 20000 cards.)
+MAX_DECKS = 20000
+MAX_SEARCHES = 20000
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS decks (deck TEXT PRIMARY KEY, cards TEXT NOT NULL, fetched REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS decks_fetched ON decks (fetched);
+CREATE TABLE IF NOT EXISTS searches (term TEXT PRIMARY KEY, decks TEXT NOT NULL, fetched REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS searches_fetched ON searches (fetched);
+'''
+
+class DeckCache(object):
+    """
+    Deck card lists and search results, in a SQLite file. Safe to share between threads.
+    """
+    def __init__(self, path=DEFAULT_CACHE_FILE, deck_ttl=DECK_TTL, search_ttl=SEARCH_TTL, max_decks=MAX_DECKS,
+                 max_searches=MAX_SEARCHES):
+        self._path = path
+        self._deck_ttl = deck_ttl
+        self._search_ttl = search_ttl
+        self._max_decks = max_decks
+        self._max_searches = max_searches
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _get(self, table, key_column, value_column, key, ttl):
+        with self._lock:
+            row = self._db.execute(f'SELECT {value_column}, fetched FROM {table} WHERE {key_column} = ?', (key,)).fetchone()
+            if row is None or time.time() - row[1] > ttl:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def get_deck(self, deck):
+        """
+        Returns the card names in `deck`, or None if it isn't cached (or has expired.)
+        """
+        return self._get('decks', 'deck', 'cards', deck, self._deck_ttl)
+
+    def get_search(self, term):
+        """
+        Returns the deck links searching for `term` found, or None if it isn't cached (or has expired.)
+        """
+        return self._get('searches', 'term', 'decks', term, self._search_ttl)
+
+    def put_deck(self, deck, cards, fetched=None):
+        """
+        Caches the card names in `deck`, evicting the oldest decks if the cache is over its size.
+        """
+        with self._lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO decks VALUES (?, ?, ?)',
+                             (deck, json.dumps(list(cards)), time.time() if fetched is None else fetched))
+            self._evict()
+
+    def put_search(self, term, decks):
+        """
+        Caches the deck links searching for `term` found, evicting the oldest searches if the cache is over its size.
+        """
+        with self._lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO searches VALUES (?, ?, ?)', (term, json.dumps(list(decks)), time.time()))
+            self._evict()
+
+    def _evict(self):
+        # expired entries first, then the oldest past each table's size.
+        now = time.time()
+        evicted = 0
+        for table, key_column, ttl, max_rows in (('decks', 'deck', self._deck_ttl, self._max_decks),
+                                                 ('searches', 'term', self._search_ttl, self._max_searches)):
+            evicted += self._db.execute(f'DELETE FROM {table} WHERE fetched < ?', (now - ttl,)).rowcount
+
+            over = self._db.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] - max_rows
+            if over > 0:
+                evicted += self._db.execute(f'DELETE FROM {table} WHERE {key_column} IN '
+                                            f'(SELECT {key_column} FROM {table} ORDER BY fetched LIMIT ?)', (over,)).rowcount
+        self.evictions += evicted
+
+    def all_decks(self):
+        """
+        Returns {deck: [card names]} for every deck that hasn't expired.
+        """
+        with self._lock:
+            rows = self._db.execute('SELECT deck, cards FROM decks WHERE fetched >= ?', (time.time() - self._deck_ttl,)).fetchall()
+        return {deck: json.loads(cards) for deck, cards in rows}
+
+    def stats(self):
+        """
+        Returns a json serializable summary of the cache's size and how it's been used.
+        """
+        with self._lock:
+            decks = self._db.execute('SELECT COUNT(*) FROM decks').fetchone()[0]
+            searches = self._db.execute('SELECT COUNT(*) FROM searches').fetchone()[0]
+        return {'decks': decks, 'searches': searches, 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+    def import_deck_pages(self, cache_dir):
+        """
+        Adds every deck page saved in `cache_dir` (the old, one html file per deck cache) to the cache.
+        Decks are dated by when their page was saved. Returns the number of decks imported.
+        """
+        from .related_index import read_deck_list
+
+        count = 0
+        for file_name in os.listdir(cache_dir):
+            if file_name.endswith('.html'):
+                path = os.path.join(cache_dir, file_name)
+                self.put_deck(file_name[:-len('.html')], read_deck_list(path), os.path.getmtime(path))
+                count += 1
+        return count
+
+    def close(self):
+        self._db.close()
+
+def migrate_deck_pages(cache_file=DEFAULT_CACHE_FILE, legacy_dir=LEGACY_CACHE_DIR):
+    '''
+    Imports the deck pages of the old cache directory `legacy_dir` into the deck cache `cache_file`,
+    then renames the directory (to legacy_dir + '.imported') so it isn't imported again. Nothing is deleted.
+    Returns the number of decks imported, or None if there was no directory to import.
+    '''
+    import logging
+
+    log = logging.getLogger('migrate')
+    if not os.path.isdir(legacy_dir):
+        log.info('no legacy deck pages to import.')
+        return None
+
+    cache = DeckCache(cache_file)
+    try:
+        count = cache.import_deck_pages(legacy_dir)
+    finally:
+        cache.close()
+
+    done_dir = legacy_dir + '.imported'
+    if os.path.exists(done_dir):
+        # imported before (then filled again by an old site), keep both.
+        done_dir = f'{done_dir}.{int(time.time())}'
+    os.rename(legacy_dir, done_dir)
+    log.info(f'Imported {count} deck pages from {legacy_dir} into {cache_file}, the pages are kept in {done_dir}')
+    return count
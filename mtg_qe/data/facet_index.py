@@ -0,0 +1,206 @@
+# Samuel Dunn
+# CS 483, Fall 2019
+
+# This module provides bitset indexes over the card attributes the advanced
+# search page filters on with drop downs (formats, expansions, types and subtypes.)
+# For every distinct value there is one bitmap with a bit per whoosh document.
+# Filters become bitwise AND/ORs, and the bitmaps double as a cheap way to
+# count how many results fall under each value (facet counts.)
+
+import numpy as np
+
+from .columnar_store import load_corpus_store
+
+FACETS_FILE = 'facets.npz'
+
+# advanced_query field -> function pulling that field's values off of a card.
+FACET_FIELDS = {
+    'legal_formats': lambda card: card.legal_formats,
+    'sets': lambda card: card.other_prints.keys(),
+    'types': lambda card: card.type.split() if card.type else (),
+    'subtypes': lambda card: card.subtypes.split() if card.subtypes else (),
+}
+
+# types and subtypes are searched for by word (ie. 'Legendary Creature' means both),
+# formats and sets are picked from a list and need to match a whole value.
+_TOKENIZED_FIELDS = ('types', 'subtypes')
+
+# bits set in each possible byte value, for counting set bits in packed bitmaps.
+_POPCOUNT = np.array([bin(x).count('1') for x in range(256)], dtype=np.uint8)
+
+def _popcount_rows(packed):
+    """
+    Returns the number of set bits in each row of a 2D packed bitmap array.
+    """
+    if hasattr(np, 'bitwise_count'): # numpy >= 2.0
+        return np.bitwise_count(packed).sum(axis=1, dtype=np.int64)
+    return _POPCOUNT[packed].sum(axis=1, dtype=np.int64)
+
+class FacetIndex(object):
+    """
+    Holds, for each facet field, the field's distinct values and a matrix of
+    packed bitmaps (one row per value, np.packbits layout, one bit per document.)
+
+    Like the ColumnarStore, an index is only valid for the whoosh index generation
+    it was built from.
+    """
+    def __init__(self, values, bitmaps, doc_count, generation):
+        """
+        :param dict values: field -> list of values (as displayed)
+        :param dict bitmaps: field -> 2D uint8 array, row i is the bitmap for values[field][i]
+        :param int doc_count: the number of documents each bitmap covers.
+        :param int generation: the whoosh index generation the bitmaps line up with.
+        """
+        self._values = values
+        self._bitmaps = bitmaps
+        self._doc_count = doc_count
+        self._generation = generation
+        self._rows = {field: {v.lower(): i for i, v in enumerate(vals)} for field, vals in values.items()}
+
+    @property
+    def generation(self):
+        return self._generation
+
+    @property
+    def doc_count(self):
+        return self._doc_count
+
+    @property
+    def fields(self):
+        return tuple(self._values)
+
+    def values(self, field):
+        """
+        Returns the distinct values of `field`.
+        """
+        return tuple(self._values[field])
+
+    def _terms(self, field, target):
+        """
+        Splits an advanced query target into the values that must all match.
+        """
+        if field in _TOKENIZED_FIELDS:
+            return target.lower().split()
+        return [target.lower().strip()]
+
+    def can_filter(self, field, target):
+        """
+        Returns True if the advanced query parameter `field`: `target` can be answered by this index.
+        `target` may be a string, or a list of strings (any of which may match.)
+        Values this index doesn't know about are left to whoosh.
+        """
+        if field not in self._rows:
+            return False
+
+        targets = target if isinstance(target, (list, tuple)) else [target]
+        if not targets or not all(isinstance(x, str) for x in targets):
+            return False
+
+        rows = self._rows[field]
+        return all(self._terms(field, x) and all(term in rows for term in self._terms(field, x)) for x in targets)
+
+    def bitmap(self, field, target):
+        """
+        Returns the packed bitmap of documents satisfying `field`: `target` (see `can_filter`.)
+        A list of targets is OR'd together, the words of a type/subtype target are AND'd.
+        """
+        rows = self._rows[field]
+        bits = self._bitmaps[field]
+        targets = target if isinstance(target, (list, tuple)) else [target]
+
+        result = np.zeros(bits.shape[1], dtype=np.uint8)
+        for x in targets:
+            matched = np.full(bits.shape[1], 0xff, dtype=np.uint8)
+            for term in self._terms(field, x):
+                matched &= bits[rows[term]]
+            result |= matched
+
+        return result
+
+    def mask(self, field, target):
+        """
+        Like `bitmap`, but returns a boolean array with one entry per document.
+        """
+        return np.unpackbits(self.bitmap(field, target), count=self._doc_count).astype(bool)
+
+    def counts(self, mask, limit=None):
+        """
+        Counts how many of the documents flagged in `mask` (a boolean array) have each value.
+        Returns a dict of field -> [(value, count), ...], most common first, omitting zeros.
+        :param int limit: the most values to return per field.
+        """
+        packed = np.packbits(mask)
+        facets = {}
+        for field, bits in self._bitmaps.items():
+            counts = _popcount_rows(bits & packed)
+            order = np.lexsort((np.arange(len(counts)), -counts))
+            values = self._values[field]
+            facets[field] = [(values[i], int(counts[i])) for i in order[:limit] if counts[i]]
+
+        return facets
+
+    def save(self, path):
+        """
+        Writes the index to `path` (a .npz file.)
+        """
+        arrays = {'__generation__': np.array(self._generation), '__doc_count__': np.array(self._doc_count)}
+        for field in self._values:
+            arrays[f'{field}__values'] = np.array(self._values[field], dtype=str)
+            arrays[f'{field}__bits'] = self._bitmaps[field]
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads an index previously written by `save`.
+        """
+        values, bitmaps = {}, {}
+        with np.load(path) as archive:
+            for name in archive.files:
+                if name.endswith('__values'):
+                    field = name[:-len('__values')]
+                    values[field] = archive[name].tolist()
+                    bitmaps[field] = archive[f'{field}__bits']
+            doc_count = int(archive['__doc_count__'])
+            generation = int(archive['__generation__'])
+
+        return cls(values, bitmaps, doc_count, generation)
+
+    @classmethod
+    def build(cls, whoosh_index, card_for):
+        """
+        Builds an index lining up with the documents in `whoosh_index`.
+        :param card_for: a callable that takes a document's stored fields and returns its Card.
+        """
+        with whoosh_index.searcher() as searcher:
+            reader = searcher.reader()
+            doc_count = reader.doc_count_all()
+
+            # first gather the documents each value appears in.
+            postings = {field: {} for field in FACET_FIELDS}
+            for docnum, stored in reader.iter_docs():
+                card = card_for(stored)
+                for field, get_values in FACET_FIELDS.items():
+                    for value in get_values(card):
+                        value = value.strip()
+                        # values are matched case-insensitively, keep the first spelling we see.
+                        postings[field].setdefault(value.lower(), (value, []))[1].append(docnum)
+
+        values, bitmaps = {}, {}
+        for field, by_value in postings.items():
+            ordered = sorted(by_value.values(), key=lambda x: x[0])
+            values[field] = [value for value, _ in ordered]
+            bits = np.zeros((len(ordered), doc_count), dtype=bool)
+            for row, (_, docnums) in enumerate(ordered):
+                bits[row, docnums] = True
+            bitmaps[field] = np.packbits(bits, axis=1)
+
+        return cls(values, bitmaps, doc_count, whoosh_index.latest_generation())
+
+
+def get_facet_index(generation):
+    """
+    Returns the FacetIndex saved with the corpus, so long as it was built
+    for index generation `generation`. Returns None otherwise.
+    """
+    return load_corpus_store(FACETS_FILE, FacetIndex.load, generation)
@@ -8,6 +8,88 @@ import tempfile
 
 from ..utils.json_helpers import CardEncoder
 from ..utils.mana import fix_variable_mana
+from .columnar_store import ColumnarStore, COLUMNS_FILE
+from .facet_index import FacetIndex, FACETS_FILE
+from .name_suggester import NameSuggester, SUGGEST_FILE
+from .name_matcher import NameMatcher, NAME_GRAMS_FILE
+from .spelling import SpellingCorrector, SPELLING_FILE
+from .similar_cards import SimilarCards, SIMILAR_FILE
+from .artwork_pack import write_artwork_pack, ArtworkManifest, ARTWORK_PACK_FILE, ARTWORK_MANIFEST_FILE
+from .related_index import RelatedIndex, read_deck_lists, RELATED_FILE
+from .corpus_version import write_corpus_version, CORPUS_VERSION_FILE
+
+# files, besides the whoosh index and internal_index.json, that get built alongside the indexes.
+DERIVED_FILES = (COLUMNS_FILE, FACETS_FILE, SUGGEST_FILE, NAME_GRAMS_FILE, SPELLING_FILE, SIMILAR_FILE)
+
+def _fix_int_vals(n):
+    try:
+        return None if n is None else int(n)
+    except Exception:
+        # this is a wild-card value (* is somewhere in there, there are also cards with text like '1+*')
+        return None
+
+def _count_mana_symbols(card):
+    if not card.mana_cost:
+        return 0, 0, 0, 0, 0
+
+    as_str = ''.join(card.mana_cost)
+    return as_str.count('W'), as_str.count('U'), as_str.count('B'), as_str.count('R'),as_str.count('G')
+
+def make_whoosh_document(card, compact=False):
+    """
+    Returns the dict of field values to pass to `writer.add_document` for `card`.
+    :param bool compact: whether the document is going into an index made with
+        make_whoosh_schema(compact=True)
+    """
+    # precompute some things, this makes the whoosh_writer.add_doc call somewhat cleaner
+    p, t = _fix_int_vals(card.power), _fix_int_vals(card.toughness)
+    cmc = _fix_int_vals(card.cmc)
+    w, u, b, r, g = _count_mana_symbols(card)
+    types = card.type.lower() if card.type else None
+    subtypes = card.subtypes.lower() if card.subtypes else None
+    rules_text = card.text.lower() if card.text else None
+    flavor = card.flavor.lower() if card.flavor else None
+
+    doc = dict(name=card.name.lower(),
+               rules_text=rules_text,
+               flavor_text=flavor,
+               sets=', '.join(card.other_prints).lower(),
+               types=types,
+               subtypes=subtypes,
+               power = p, toughness = t,
+               cmc = 0 if not cmc else cmc,
+               mana_cost = ', '.join(card.mana_cost) if card.mana_cost else None,
+               white = w, blue = u, black = b, red = r, green = g,
+               legal_formats = ', '.join(card.legal_formats).lower())
+
+    # either store the whole card, or just enough to find it in the internal index.
+    if compact:
+        doc['multiverseid'] = card.multiverseid
+    else:
+        doc['data_obj'] = card
+
+    return doc
+
+def build_derived_stores(whoosh_index, cards_by_multiverseid, dest_dir):
+    """
+    Builds the stores that are indexed by whoosh document number (the ColumnarStore
+    and FacetIndex), the name stores (NameSuggester and NameMatcher), the SpellingCorrector
+    and the SimilarCards neighbour lists for `whoosh_index`, and saves them to `dest_dir`.
+    These must be rebuilt any time the whoosh index is.
+    :param dict cards_by_multiverseid: used to find the cards of compact-schema documents.
+    """
+    def card_for(stored):
+        card = stored.get('data_obj', None)
+        if card is None:
+            card = cards_by_multiverseid[stored['multiverseid']]
+        return card
+
+    ColumnarStore.build(whoosh_index, lambda stored: make_whoosh_document(card_for(stored))).save(os.path.join(dest_dir, COLUMNS_FILE))
+    FacetIndex.build(whoosh_index, card_for).save(os.path.join(dest_dir, FACETS_FILE))
+    NameSuggester.build(whoosh_index, card_for).save(os.path.join(dest_dir, SUGGEST_FILE))
+    NameMatcher.build(whoosh_index, card_for).save(os.path.join(dest_dir, NAME_GRAMS_FILE))
+    SpellingCorrector.build(whoosh_index).save(os.path.join(dest_dir, SPELLING_FILE))
+    SimilarCards.build(whoosh_index, card_for).save(os.path.join(dest_dir, SIMILAR_FILE))
 
 class IndexInitializer(object):
     '''
@@ -24,10 +106,16 @@ class IndexInitializer(object):
     This class manages the 'index_setup' stage, below there is a method `cli_entry`
     that manages this as the corpus setup stage.
     '''
-    def __init__(self, path_to_sets, temp_path):
+    def __init__(self, path_to_sets, temp_path, compact=True):
+        """
+        :param str path_to_sets: the directory holding the scraper's set files.
+        :param str temp_path: the directory to write the indexes to.
+        :param bool compact: whether whoosh documents should store only multiverseids (see make_whoosh_schema)
+        """
         self._log = logging.getLogger('II')
         self._path = path_to_sets
         self._workspace = temp_path
+        self._compact = compact
         if not os.path.exists(path_to_sets):
             raise ValueError(f'Unable to initialize index with non existent directory: {path_to_sets}')
 
@@ -45,24 +133,10 @@ class IndexInitializer(object):
         if not os.path.exists(os.path.join(self._workspace, 'whoosh_index')):
             os.mkdir(os.path.join(self._workspace, 'whoosh_index'))
 
-        whoosh_index = create_in(os.path.join(self._workspace, 'whoosh_index'), make_whoosh_schema())
+        whoosh_index = create_in(os.path.join(self._workspace, 'whoosh_index'), make_whoosh_schema(self._compact))
         whoosh_writer = whoosh_index.writer()
         internal_index = {'by_name': {}, 'by_multiverseid': {}}
 
-        def fix_int_vals(n):
-            try:
-                return None if n is None else int(n)
-            except Exception:
-                # this is a wild-card value (* is somewhere in there, there are also cards with text like '1+*')
-                return None
-
-        def count_mana_symbols(card):
-            if not card.mana_cost:
-                return 0, 0, 0, 0, 0
-
-            as_str = ''.join(card.mana_cost)
-            return as_str.count('W'), as_str.count('U'), as_str.count('B'), as_str.count('R'),as_str.count('G')
-
         # used to know when we've passed a card quickly. (amortized O(1) if I remember correctly, once its big enough it'll be O(n))
         cards_by_name = set()
 
@@ -82,32 +156,11 @@ class IndexInitializer(object):
                 set_data = json.load(fd)
 
             self._log.info(f'Updating index with contents of {os.path.basename(set_file)}')
-            for serialized_data in set_data:
-                card = Card().deserialize(serialized_data)
+            for card in Card.deserialize_many(set_data):
 
                 if card.name not in cards_by_name:
-                    # precompute some things, this makes the whoosh_writer.add_doc call somewhat cleaner
-                    p, t = fix_int_vals(card.power), fix_int_vals(card.toughness)
-                    cmc = fix_int_vals(card.cmc)
-                    w, u, b, r, g = count_mana_symbols(card)
-                    types = card.type.lower() if card.type else None
-                    subtypes = card.subtypes.lower() if card.subtypes else None
-                    rules_text = card.text.lower() if card.text else None
-                    flavor = card.flavor.lower() if card.flavor else None
-
                     # shove everything into whoosh
-                    whoosh_writer.add_document(name=card.name.lower(),
-                                               rules_text=rules_text,
-                                               flavor_text=flavor,
-                                               sets=', '.join(card.other_prints).lower(),
-                                               types=types,
-                                               subtypes=subtypes,
-                                               power = p, toughness = t,
-                                               cmc = 0 if not cmc else cmc,
-                                               mana_cost = ', '.join(card.mana_cost) if card.mana_cost else None,
-                                               white = w, blue = u, black = b, red = r, green = g,
-                                               legal_formats = ', '.join(card.legal_formats).lower(),
-                                               data_obj=card)
+                    whoosh_writer.add_document(**make_whoosh_document(card, self._compact))
 
                     # add to internal index and update card_by_name
                     internal_index['by_name'][card.name] = card
@@ -129,6 +182,9 @@ class IndexInitializer(object):
 
         # write both indexes to disk.
         whoosh_writer.commit()
+        self._log.info('Building columnar store, facet bitsets, name stores, spelling dictionary and similar cards')
+        build_derived_stores(whoosh_index, internal_index['by_multiverseid'], self._workspace)
+
         with open(os.path.join(self._workspace, 'internal_index.json'), 'w') as fd:
             # Before we dump stuff, lets go ahead and store the metadata info here too.
             # that way we don't have to write a nearly identical module for the metadata info as
@@ -157,6 +213,9 @@ def cli_entry():
     parser = argparse.ArgumentParser('mtg_qe_init_corpus')
     parser.add_argument('-i', '--input-targz', type=str, required=True, help='the path to the .tar.gz file scraping outputs.')
     parser.add_argument('-o', '--output', type=str, default='corpus_files.tar.gz', help='the name of the file to save corpus data to')
+    parser.add_argument('--legacy-schema', action='store_true', help='store pickled cards in the whoosh index (the pre-compact layout) rather than just multiverseids.')
+    parser.add_argument('--loose-artwork', action='store_true', help='ship the artwork as a directory of images (the old layout) rather than a single artwork pack.')
+    parser.add_argument('--related-cache', type=str, default=None, help='a deck cache file (or directory of saved tappedout deck pages) to build the related cards index from.')
 
     args = parser.parse_args()
 
@@ -175,20 +234,163 @@ def cli_entry():
         with tempfile.TemporaryDirectory() as td:
             # Prep the indexes
             logger.info('Building indexes')
-            ii = IndexInitializer(os.path.join(scrape_dir, 'raw_data', 'sets'), td)
-            ii.init_indexes()
+            ii = IndexInitializer(os.path.join(scrape_dir, 'raw_data', 'sets'), td, compact=not args.legacy_schema)
+            _, internal_index = ii.init_indexes()
+
+            if args.related_cache:
+                logger.info('Building related cards index...')
+                related = RelatedIndex.from_decks(read_deck_lists(args.related_cache), internal_index['by_name'].keys())
+                related.save(os.path.join(td, RELATED_FILE))
+                logger.info(f'Related cards for {len(related)} cards')
 
             # now have 3 things in td, a whoosh_index folder
             # and a internal_index.json file.
 
-            # Package them up and save to output file, along with the scrape's artwork dir.
+            # Pack the scrape's artwork into a single file, so unpacking the corpus
+            # doesn't have to create a file and folder per card.
+            # Either way, the manifest records which cards have artwork (and its hash.)
+            artwork_dir = os.path.join(scrape_dir, 'raw_data', 'artwork')
+            if args.loose_artwork:
+                logger.info('Hashing artwork...')
+                manifest = ArtworkManifest.from_directory(artwork_dir)
+            else:
+                logger.info('Packing artwork...')
+                manifest = write_artwork_pack(artwork_dir, os.path.join(td, ARTWORK_PACK_FILE))
+                logger.info(f'Packed {len(manifest)} images')
+            manifest.save(os.path.join(td, ARTWORK_MANIFEST_FILE))
+
+            # the site tags its pages with the corpus version, so browsers and caches know when they change.
+            version, _ = write_corpus_version(td)
+            logger.info(f'Corpus version {version}')
+
+            # Package them up and save to output file, along with the artwork.
             with tarfile.open(args.output, 'w:gz') as tar:
                 logger.info(f'Writing output to {args.output}...')
                 tar.add(os.path.join(td, 'internal_index.json'), arcname = 'corpus_files/internal_index.json')
+                tar.add(os.path.join(td, CORPUS_VERSION_FILE), arcname = f'corpus_files/{CORPUS_VERSION_FILE}')
                 tar.add(os.path.join(td, 'whoosh_index'), arcname = 'corpus_files/whoosh_index')
+                for derived in DERIVED_FILES:
+                    tar.add(os.path.join(td, derived), arcname = f'corpus_files/{derived}')
+                if args.related_cache:
+                    tar.add(os.path.join(td, RELATED_FILE), arcname = f'corpus_files/{RELATED_FILE}')
 
                 # Write the artwork contents in too
-                tar.add(os.path.join(scrape_dir, 'raw_data', 'artwork'), arcname = 'corpus_files/artwork')
+                tar.add(os.path.join(td, ARTWORK_MANIFEST_FILE), arcname = f'corpus_files/{ARTWORK_MANIFEST_FILE}')
+                if args.loose_artwork:
+                    tar.add(artwork_dir, arcname = 'corpus_files/artwork')
+                else:
+                    tar.add(os.path.join(td, ARTWORK_PACK_FILE), arcname = f'corpus_files/{ARTWORK_PACK_FILE}')
 
         logger.info('Cleaning up...')
-    logger.info('Done! index build successful.')
\ No newline at end of file
+    logger.info('Done! index build successful.')
+
+
+def migrate_to_compact_schema(corpus_dir):
+    '''
+    Rewrites the whoosh index within an extracted corpus directory so that
+    it uses the compact schema (documents store multiverseids, not pickled cards.)
+    Every other file in the corpus is left alone.
+
+    This should be done while the site is not running.
+    Returns False if the index was already compact, True otherwise.
+    '''
+    import shutil
+    from whoosh.index import open_dir, create_in
+    from .whoosh_integrations import make_whoosh_schema, is_compact_schema
+
+    log = logging.getLogger('migrate')
+    index_dir = os.path.join(corpus_dir, 'whoosh_index')
+    old_index = open_dir(index_dir)
+    if is_compact_schema(old_index.schema):
+        log.info('whoosh index already uses the compact schema.')
+        return False
+
+    # Build the replacement next to the old index, the pickled cards in the
+    # old one give us everything needed to regenerate each document.
+    new_dir = index_dir + '.compact'
+    if os.path.exists(new_dir):
+        shutil.rmtree(new_dir)
+    os.mkdir(new_dir)
+
+    new_index = create_in(new_dir, make_whoosh_schema(compact=True))
+    writer = new_index.writer()
+    cards = {}
+    with old_index.searcher() as searcher:
+        for count, stored in enumerate(searcher.all_stored_fields(), 1):
+            card = stored['data_obj']
+            cards[card.multiverseid] = card
+            writer.add_document(**make_whoosh_document(card, compact=True))
+            if count % 5000 == 0:
+                log.info(f'Migrated {count} documents')
+    writer.commit()
+
+    old_index.close()
+
+    # swap the directories.
+    old_dir = index_dir + '.old'
+    os.rename(index_dir, old_dir)
+    os.rename(new_dir, index_dir)
+    shutil.rmtree(old_dir)
+
+    # the derived stores are indexed by document number, so they have to be rebuilt with the index.
+    new_index = open_dir(index_dir)
+    build_derived_stores(new_index, cards, corpus_dir)
+    new_index.close()
+    log.info('Done! whoosh index migrated to the compact schema.')
+    return True
+
+def migrate_to_artwork_pack(corpus_dir):
+    '''
+    Replaces the loose artwork directory within an extracted corpus directory
+    with an artwork pack (and writes its manifest.)
+
+    This should be done while the site is not running.
+    Returns False if there was no artwork directory to pack, True otherwise.
+    '''
+    import shutil
+
+    log = logging.getLogger('migrate')
+    artwork_dir = os.path.join(corpus_dir, 'artwork')
+    if not os.path.isdir(artwork_dir):
+        log.info('no loose artwork to pack.')
+        return False
+
+    # write the pack under a temporary name, so an interrupted migration leaves the old artwork usable.
+    pack_path = os.path.join(corpus_dir, ARTWORK_PACK_FILE)
+    manifest = write_artwork_pack(artwork_dir, pack_path + '.tmp')
+    manifest.save(os.path.join(corpus_dir, ARTWORK_MANIFEST_FILE))
+    os.replace(pack_path + '.tmp', pack_path)
+    shutil.rmtree(artwork_dir)
+    log.info(f'Done! packed {len(manifest)} images into {ARTWORK_PACK_FILE}.')
+    return True
+
+def migrate_cli_entry():
+    '''
+    Command line entry point for `migrate_to_compact_schema`.
+    '''
+    import argparse
+    from . import get_data_location
+
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser('mtg_qe_migrate_index')
+    parser.add_argument('-d', '--corpus-dir', type=str, default=None, help='the extracted corpus directory to migrate. Defaults to the installed corpus.')
+    parser.add_argument('--pack-artwork', action='store_true', help='also replace the loose artwork directory with an artwork pack.')
+    parser.add_argument('--import-deck-pages', action='store_true',
+                        help="also import the old related_cache folder of deck pages into the site's deck cache (the folder is renamed, not deleted.)")
+    args = parser.parse_args()
+
+    corpus_dir = args.corpus_dir or get_data_location()
+    changed = migrate_to_compact_schema(corpus_dir)
+    if args.pack_artwork:
+        changed = migrate_to_artwork_pack(corpus_dir) or changed
+
+    # the corpus' files changed, so its version has too.
+    if changed:
+        version, _ = write_corpus_version(corpus_dir)
+        logging.getLogger('migrate').info(f'Corpus version is now {version}')
+
+    # the deck cache is the site's, not the corpus', so this doesn't change the version.
+    if args.import_deck_pages:
+        from .deck_cache import migrate_deck_pages
+        migrate_deck_pages()
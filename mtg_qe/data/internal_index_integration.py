@@ -1,6 +1,9 @@
 # Samuel Dunn
 # CS 483, Fall 2019
 
+import threading
+from collections import OrderedDict
+
 def get_internal_index():
     """
     Returns the 'internal index' for the project.
@@ -11,6 +14,8 @@ def get_internal_index():
     stores all cards (all cards scraped) by their multiverseid.
     Between the two, any time we have a result from whoosh and need
     to navigate to another card or print, we should be covered.
+    Note: the card 'dicts' are read-only stores that only inflate
+    cards when they are looked up (see LazyCardStore.)
     """
     # there's a fun trick to 'hiding', rather obscuring, things in module namespace.
     # namespaces, and instance attributes, ultimately boil down
@@ -40,21 +45,126 @@ def get_internal_index():
     if globals().get('!!_idx_dict', None) == None:
         # load the json file into globals()['!!_idx_dict']
         from . import get_data_location
-        from ..model.card import Card
         import os
         import json
         with open(os.path.join(get_data_location(), 'internal_index.json')) as fd:
             deflated_cards = json.load(fd)
 
-        # inflate all cards in the data set.
-        inflated_cards = {'by_name': {}, 'by_multiverseid': {}}
-        for top_level_key in inflated_cards: # there are non-card fields in internal_index, so iter over inflated_cads
-            for key, value in deflated_cards[top_level_key].items():
-                inflated_cards[top_level_key][key] = Card().deserialize(value)
+        # Rather than inflating every card up front (most are never looked at)
+        # wrap the serialized records in stores that inflate cards as they're asked for.
+        # 'by_name' holds the same records as 'by_multiverseid', so its backed by that
+        # store rather than holding a second copy of every record.
+        by_multiverseid = LazyCardStore(deflated_cards['by_multiverseid'])
+        name_to_id = {name: str(record['multiverseid']) for name, record in deflated_cards['by_name'].items()}
 
-        # push the inflated cards into the dict with non-card fields.
-        deflated_cards.update(inflated_cards)
+        # push the card stores into the dict with non-card fields.
+        deflated_cards.update({'by_name': CardNameIndex(name_to_id, by_multiverseid),
+                               'by_multiverseid': by_multiverseid})
         # Set the global value:
         globals()['!!_idx_dict'] = deflated_cards
 
-    return globals().get('!!_idx_dict')
\ No newline at end of file
+    return globals().get('!!_idx_dict')
+
+
+class LazyCardStore(object):
+    """
+    A read-only, dict-like, collection of cards that are kept in their serialized
+    form until they're looked up.
+
+    Inflated cards are kept in a bounded LRU, so frequently viewed cards are
+    only deserialized once while memory use stays flat.
+    """
+    def __init__(self, records, max_cards=4096):
+        """
+        :param dict records: maps keys to serialized cards (as produced by Card.serialize)
+        :param int max_cards: the most inflated cards to keep around.
+        """
+        self._records = records
+        self._max_cards = max_cards
+        self._cards = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Returns the card stored under `key`, or `default` if there is none.
+        """
+        with self._lock:
+            card = self._cards.get(key, None)
+            if card is not None:
+                self._cards.move_to_end(key)
+                return card
+
+        record = self._records.get(key, None)
+        if record is None:
+            return default
+
+        from ..model.card import Card
+        card = Card().deserialize(record)
+        with self._lock:
+            # another thread may have beat us to it, if so hand back their card
+            # so that callers consistently see the same object.
+            card = self._cards.setdefault(key, card)
+            self._cards.move_to_end(key)
+            while len(self._cards) > self._max_cards:
+                self._cards.popitem(last=False)
+
+        return card
+
+    def __getitem__(self, key):
+        card = self.get(key, None)
+        if card is None:
+            raise KeyError(key)
+        return card
+
+    def __contains__(self, key):
+        return key in self._records
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def __len__(self):
+        return len(self._records)
+
+    def keys(self):
+        return self._records.keys()
+
+    def items(self):
+        """
+        Iterates over (key, card) pairs. Note: this inflates every card.
+        """
+        for key in self._records:
+            yield key, self[key]
+
+
+class CardNameIndex(object):
+    """
+    A read-only, dict-like, view that maps card names onto cards held in a LazyCardStore.
+    """
+    def __init__(self, name_to_key, store):
+        self._name_to_key = name_to_key
+        self._store = store
+
+    def get(self, name, default=None):
+        key = self._name_to_key.get(name, None)
+        if key is None:
+            return default
+        return self._store.get(key, default)
+
+    def __getitem__(self, name):
+        return self._store[self._name_to_key[name]]
+
+    def __contains__(self, name):
+        return name in self._name_to_key
+
+    def __iter__(self):
+        return iter(self._name_to_key)
+
+    def __len__(self):
+        return len(self._name_to_key)
+
+    def keys(self):
+        return self._name_to_key.keys()
+
+    def items(self):
+        for name in self._name_to_key:
+            yield name, self[name]
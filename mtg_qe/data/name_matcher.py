@@ -0,0 +1,153 @@
+# Samuel Dunn
+# CS 483, Fall 2019
+
+# This module backs approximate card name lookups.
+# Every unique name is normalized (see utils.text.normalize_name) and broken into
+# character trigrams. An inverted index from trigram to names finds the names that
+# share the most trigrams with what was typed, and edit distance picks between them.
+
+import numpy as np
+
+from ..utils.text import normalize_name, trigrams, edit_distance
+from .columnar_store import load_corpus_store
+
+NAME_GRAMS_FILE = 'name_grams.npz'
+
+# how many of the best trigram matches are compared by edit distance (at least.)
+_RERANK = 8
+
+class NameMatcher(object):
+    """
+    Normalized name keys plus a trigram inverted index over them.
+    Like the other derived stores, a matcher is tagged with the index generation it was built for.
+    """
+    def __init__(self, names, grams, offsets, postings, generation):
+        """
+        :param list names: the card names, name ids are indexes into this list.
+        :param list grams: the distinct trigrams, sorted.
+        :param offsets: numpy array, postings[offsets[i]:offsets[i+1]] are the ids of names containing grams[i]
+        :param postings: numpy array of name ids.
+        :param int generation: the whoosh index generation this was built alongside.
+        """
+        self._names = list(names)
+        self._keys = [normalize_name(x) for x in self._names]
+        self._gram_counts = np.array([len(trigrams(x)) for x in self._keys], dtype=np.int32)
+        self._grams = {gram: i for i, gram in enumerate(grams)}
+        self._offsets = np.asarray(offsets, dtype=np.int64)
+        self._postings = np.asarray(postings, dtype=np.int32)
+        self._generation = generation
+
+        # several printed names can normalize the same way, so keep a list.
+        self._by_key = {}
+        for name, key in zip(self._names, self._keys):
+            self._by_key.setdefault(key, []).append(name)
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def exact(self, name):
+        """
+        Returns the names that normalize to the same key as `name` (usually zero or one.)
+        """
+        return list(self._by_key.get(normalize_name(name), ()))
+
+    def approximate(self, name, k=5):
+        """
+        Returns up to `k` (name, distance) pairs for the names closest to `name`, best first.
+        Distance is the edit distance between normalized names, so 0 means they're the same
+        once case, accents and punctuation are ignored.
+        """
+        key = normalize_name(name)
+        if not key or k <= 0:
+            return []
+
+        # count shared trigrams for every name that has at least one.
+        query_grams = trigrams(key)
+        rows = [self._grams[gram] for gram in query_grams if gram in self._grams]
+        if not rows:
+            return []
+        overlap = np.bincount(np.concatenate([self._postings[self._offsets[i]:self._offsets[i+1]] for i in rows]),
+                              minlength=len(self._names))
+
+        # Dice coefficient, so long names don't win just by having more trigrams.
+        # (only names sharing a trigram are worth scoring.)
+        matched = np.flatnonzero(overlap)
+        overlap = overlap[matched]
+        similarity = 2.0 * overlap / (len(query_grams) + self._gram_counts[matched])
+        count = min(max(k * 2, _RERANK), len(matched))
+        candidates = np.argpartition(-similarity, count - 1)[:count]
+
+        # now the (more expensive) edit distance on the short list, best trigram matches first.
+        # Names more than a third of the query's length in edits away aren't sensible matches,
+        # and once we have k matches anything further away than the worst of them can be skipped.
+        bound = max(2, len(key) // 3)
+        scored = []
+        for i in candidates[np.argsort(-similarity[candidates], kind='stable')]:
+            # a single edit can only change 3 trigrams, which bounds the distance from below for free.
+            if (len(query_grams) - overlap[i]) > 3 * bound:
+                continue
+
+            distance = edit_distance(key, self._keys[matched[i]], bound)
+            if distance <= bound:
+                scored.append((distance, -similarity[i], self._names[matched[i]]))
+                if len(scored) >= k:
+                    scored.sort()
+                    del scored[k:]
+                    bound = scored[-1][0]
+
+        scored.sort()
+        return [(name, distance) for distance, _, name in scored[:k]]
+
+    def save(self, path):
+        """
+        Writes the matcher to `path` (a .npz file.)
+        """
+        grams = sorted(self._grams, key=self._grams.get)
+        np.savez(path, __generation__=np.array(self._generation), names=np.array(self._names, dtype=str),
+                 grams=np.array(grams, dtype=str), offsets=self._offsets, postings=self._postings)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a matcher previously written by `save`.
+        """
+        with np.load(path) as archive:
+            return cls(archive['names'].tolist(), archive['grams'].tolist(), archive['offsets'], archive['postings'],
+                       int(archive['__generation__']))
+
+    @classmethod
+    def from_names(cls, names, generation):
+        """
+        Builds a matcher (and its trigram index) for `names`.
+        """
+        names = sorted(set(names))
+        by_gram = {}
+        for i, name in enumerate(names):
+            for gram in trigrams(normalize_name(name)):
+                by_gram.setdefault(gram, []).append(i)
+
+        grams = sorted(by_gram)
+        offsets = np.zeros(len(grams) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(by_gram[gram]) for gram in grams])
+        postings = np.array([i for gram in grams for i in by_gram[gram]], dtype=np.int32)
+        return cls(names, grams, offsets, postings, generation)
+
+    @classmethod
+    def build(cls, whoosh_index, card_for):
+        """
+        Builds a matcher over the names of the cards in `whoosh_index`.
+        :param card_for: a callable that takes a document's stored fields and returns its Card.
+        """
+        with whoosh_index.searcher() as searcher:
+            names = [card_for(stored).name for stored in searcher.all_stored_fields()]
+
+        return cls.from_names(names, whoosh_index.latest_generation())
+
+
+def get_name_matcher(generation):
+    """
+    Returns the NameMatcher saved with the corpus, so long as it was built
+    for index generation `generation`. Returns None otherwise.
+    """
+    return load_corpus_store(NAME_GRAMS_FILE, NameMatcher.load, generation)
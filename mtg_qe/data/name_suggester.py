@@ -0,0 +1,121 @@
+# Samuel Dunn
+# CS 483, Fall 2019
+
+# This module backs card name autocompletion.
+# Every unique card name is kept in one sorted array, so all names starting with
+# a prefix sit in a contiguous slice we can find with two binary searches.
+# Each name carries a popularity weight (its number of printings), and the
+# best weighted names in the slice are the suggestions.
+
+import bisect
+
+import numpy as np
+
+from .columnar_store import load_corpus_store
+from .query_cache import QueryCache
+
+SUGGEST_FILE = 'names.npz'
+
+# prefixes up to this long match enough names that ranking them is worth caching.
+SHORT_PREFIX = 3
+
+class NameSuggester(object):
+    """
+    Sorted card names with popularity weights.
+    Like the other derived stores, a suggester is tagged with the index generation it was built for.
+    """
+    def __init__(self, names, weights, generation):
+        """
+        :param list names: the card names, sorted case-insensitively.
+        :param weights: numpy array of popularity weights, parallel to `names`.
+        :param int generation: the whoosh index generation this was built alongside.
+        """
+        self._names = list(names)
+        self._keys = [x.lower() for x in self._names]
+        self._weights = np.asarray(weights, dtype=np.int32)
+        self._generation = generation
+        self._cache = QueryCache(4096)
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def __len__(self):
+        return len(self._names)
+
+    def _span(self, prefix):
+        """
+        Returns the [lo, hi) range of names starting with `prefix` (already lowered.)
+        """
+        lo = bisect.bisect_left(self._keys, prefix)
+        # every string starting with `prefix` sorts before prefix + the largest code point.
+        hi = bisect.bisect_left(self._keys, prefix + '\U0010ffff', lo)
+        return lo, hi
+
+    def suggest(self, prefix, k=10):
+        """
+        Returns up to `k` names starting with `prefix` (case-insensitive), most printed first,
+        ties broken alphabetically.
+        """
+        prefix = prefix.lower().lstrip()
+        if not prefix or k <= 0:
+            return []
+
+        short = len(prefix) <= SHORT_PREFIX
+        if short:
+            cached = self._cache.get((prefix, k), self._generation)
+            if cached is not None:
+                return list(cached)
+
+        lo, hi = self._span(prefix)
+        if hi - lo <= k:
+            order = sorted(range(lo, hi), key=lambda i: -self._weights[i])
+        else:
+            # np.lexsort is stable, so equal weights stay in (alphabetical) index order.
+            order = lo + np.lexsort((-self._weights[lo:hi],))[:k]
+
+        names = [self._names[i] for i in order]
+        if short:
+            self._cache.put((prefix, k), tuple(names), self._generation)
+        return names
+
+    def save(self, path):
+        """
+        Writes the suggester to `path` (a .npz file.)
+        """
+        np.savez(path, __generation__=np.array(self._generation), names=np.array(self._names, dtype=str), weights=self._weights)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a suggester previously written by `save`.
+        """
+        with np.load(path) as archive:
+            return cls(archive['names'].tolist(), archive['weights'], int(archive['__generation__']))
+
+    @classmethod
+    def from_cards(cls, cards, generation):
+        """
+        Builds a suggester out of an iterable of (unique named) cards.
+        """
+        pairs = sorted(((card.name, len(card.other_prints) or 1) for card in cards), key=lambda x: (x[0].lower(), x[0]))
+        return cls([name for name, _ in pairs], [weight for _, weight in pairs], generation)
+
+    @classmethod
+    def build(cls, whoosh_index, card_for):
+        """
+        Builds a suggester over the cards in `whoosh_index` (there's one document per unique name.)
+        :param card_for: a callable that takes a document's stored fields and returns its Card.
+        """
+        with whoosh_index.searcher() as searcher:
+            cards = [card_for(stored) for stored in searcher.all_stored_fields()]
+
+        return cls.from_cards(cards, whoosh_index.latest_generation())
+
+
+def get_name_suggester(generation):
+    """
+    Returns the NameSuggester saved with the corpus, so long as it was built
+    for index generation `generation`. Returns None otherwise.
+    """
+    return load_corpus_store(SUGGEST_FILE, NameSuggester.load, generation)
@@ -0,0 +1,105 @@
+# Samuel Dunn
+# CS 483, Fall 2019
+
+# This module provides a small, thread safe, LRU cache used to hold on to
+# search results between requests. The corpus only changes when a new index
+# is built, so results can be reused until the index generation changes.
+
+import threading
+from collections import OrderedDict
+
+class QueryCache(object):
+    """
+    A bounded LRU mapping of query keys to results.
+
+    Every lookup and insert is made against an index generation. If the
+    generation differs from the one the cached entries were made under,
+    the cache is emptied first, so stale results are never handed out.
+    """
+    def __init__(self, max_entries=1024):
+        """
+        :param int max_entries: the most results to hold before evicting the least recently used.
+        """
+        self._max_entries = max(0, int(max_entries))
+        self._entries = OrderedDict()
+        self._generation = None
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    @property
+    def max_entries(self):
+        return self._max_entries
+
+    @max_entries.setter
+    def max_entries(self, value):
+        with self._lock:
+            self._max_entries = max(0, int(value))
+            self._evict()
+
+    def get(self, key, generation):
+        """
+        Returns the value cached under `key`, or None if there isn't one.
+        :param key: any hashable.
+        :param generation: the index generation the caller is searching.
+        """
+        with self._lock:
+            self._check_generation(generation)
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def put(self, key, value, generation):
+        """
+        Stores `value` under `key`, evicting old entries as necessary.
+        """
+        with self._lock:
+            self._check_generation(generation)
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def clear(self):
+        """
+        Drops every cached entry. (statistics are left alone.)
+        """
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def stats(self):
+        """
+        Returns a dict of counters describing how the cache has been performing.
+        """
+        with self._lock:
+            return {'hits': self._hits,
+                    'misses': self._misses,
+                    'evictions': self._evictions,
+                    'invalidations': self._invalidations,
+                    'size': len(self._entries),
+                    'max_entries': self._max_entries}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _check_generation(self, generation):
+        # caller holds the lock
+        if generation != self._generation:
+            if self._entries:
+                self._invalidations += 1
+                self._entries.clear()
+            self._generation = generation
+
+    def _evict(self):
+        # caller holds the lock
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
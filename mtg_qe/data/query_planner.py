@@ -0,0 +1,241 @@
+# Samuel Dunn
+# CS 483, Fall 2019
+
+# This module decides how an advanced query gets run.
+# Parameters are split into scoring clauses (the free text fields, which whoosh
+# needs to rank) and filters (everything else, which only narrows the result set.)
+# Filters are answered by the cheapest source available (the columnar store,
+# the facet bitsets, or whoosh itself), most selective first, and the result is
+# handed to whoosh as a filter set for the scoring clauses.
+
+import numpy as np
+
+from whoosh.qparser import QueryParser
+
+# advanced query fields that affect ranking, everything else is a filter.
+SCORING_FIELDS = ('rules_text', 'name', 'flavor_text')
+
+def parse_advanced_parameters(schema, parameters):
+    """
+    Builds the compound whoosh query object for advanced query `parameters`.
+    Returns None if `parameters` does not produce any sub queries.
+    """
+    import whoosh.fields
+    from whoosh.query import And, Or
+
+    # After talking with Ben it sounds like we can do something to the effect
+    # of taking multiple sub queries and perform unions and intersections on their
+    # results
+    # This is going to be the best way to get the desired results.
+
+    # to start: build a list of all the query objects we'll be searching.
+    query_objs = []
+    for field, target in parameters.items():
+        # Coerce potential numeric point queries to whoosh syntax.
+        if isinstance(target, float):
+            target = int(target+0.5)
+        if isinstance(target, int):
+            target = str(target)
+            #target = f"{{{target-1} TO {target+1}}}"
+            #target = target.replace("[ TO", "[TO").replace("TO ]", "TO]")
+
+        # Coerce range queries to whoosh syntax, assume they're inclusive bounds.
+        if isinstance(target, (list, tuple)):
+            if len(target) != 2:
+                raise ValueError(f"Unable to treat parameter as range query! ({target})")
+            target = f"[{target[0] if target[0] != -1 else ''} TO {target[1] if target[1] != -1 else ''}]"
+
+            # whoosh has issues if there's an open ended range with a space separating TO from the bracket:
+            target = target.replace("[ TO", "[TO").replace("TO ]", "TO]")
+
+        # the comma-separated KEYWORD fields have been giving us some issue
+        # it seems that whoosh is a bit bi-polar when it comes to commas in these fields.
+        # so we'll add two subqueries, one with a comma and one without.
+        if field in schema and isinstance(schema[field], whoosh.fields.KEYWORD):
+            # add the extra query object:
+            subqueries = [QueryParser(field, schema).parse(target.lower()+','),
+                          QueryParser(field, schema).parse(target.lower())]
+            query_objs.append(Or(subqueries))
+
+        else:
+            query_objs.append(QueryParser(field, schema).parse(target.lower())) # again, lower capitalization on everything
+
+    if not len(query_objs):
+        return None
+
+    # now build a nice big compound query:
+    return And(query_objs)
+
+
+class FilterStep(object):
+    """
+    One filtering parameter of an advanced query, and where its answer comes from.
+    `source` is one of 'columns' (ColumnarStore), 'facets' (FacetIndex) or 'whoosh'.
+    """
+    def __init__(self, field, target, source, store=None):
+        self.field = field
+        self.target = target
+        self.source = source
+        self.estimate = None
+        self._store = store
+        self._mask = None
+
+    @property
+    def key(self):
+        """
+        A hashable that identifies this filter's result set.
+        """
+        return (self.field, repr(self.target))
+
+    def estimate_size(self, searcher):
+        """
+        Estimates (and remembers) how many documents pass this filter.
+        The in-memory stores can count exactly for next to nothing, for whoosh
+        we fall back to its estimate, which is based on term document frequencies.
+        """
+        if self.source == 'facets':
+            self.estimate = int(np.unpackbits(self._store.bitmap(self.field, self.target)).sum())
+        elif self.source == 'columns':
+            # counting needs the mask anyway, so hang on to it.
+            self._mask = self._store.mask(self.field, self.target)
+            self.estimate = int(self._mask.sum())
+        else:
+            query = parse_advanced_parameters(searcher.schema, {self.field: self.target})
+            self.estimate = query.estimate_size(searcher.reader())
+
+        return self.estimate
+
+    def mask(self, searcher):
+        """
+        Returns a boolean array, one entry per document, flagging documents that pass this filter.
+        """
+        if self._mask is not None:
+            return self._mask
+
+        if self.source in ('facets', 'columns'):
+            return self._store.mask(self.field, self.target)
+
+        mask = np.zeros(searcher.doc_count_all(), dtype=bool)
+        query = parse_advanced_parameters(searcher.schema, {self.field: self.target})
+        mask[np.fromiter(searcher.docs_for_query(query), dtype=np.int64)] = True
+        return mask
+
+    def describe(self):
+        estimate = '?' if self.estimate is None else self.estimate
+        return f"{self.field} = {self.target!r} via {self.source} (~{estimate} docs)"
+
+
+class QueryPlan(object):
+    """
+    How an advanced query will be answered: a set of scoring clauses for whoosh
+    and an ordered list of FilterSteps that produce the set of documents they may match.
+    """
+    def __init__(self, scoring, filters):
+        """
+        :param dict scoring: field: target pairs that whoosh will score.
+        :param list filters: FilterSteps
+        """
+        self.scoring = scoring
+        self.filters = filters
+        self._ordered = False
+
+    def scoring_query(self, schema):
+        """
+        Returns the whoosh query for the scoring clauses, or None if there aren't any.
+        """
+        return parse_advanced_parameters(schema, self.scoring)
+
+    @property
+    def filter_key(self):
+        """
+        A hashable that identifies the combined result of all of the plan's filters.
+        """
+        return tuple(sorted(step.key for step in self.filters))
+
+    def cache_key(self, schema):
+        """
+        A hashable that identifies the results of the whole plan.
+        """
+        query = self.scoring_query(schema)
+        return (None if query is None else repr(query.normalize()), self.filter_key)
+
+    def order(self, searcher):
+        """
+        Estimates each filter's selectivity and sorts them, most selective first.
+        """
+        if not self._ordered:
+            for step in self.filters:
+                step.estimate_size(searcher)
+            self.filters.sort(key=lambda step: step.estimate)
+            self._ordered = True
+
+    def filter_mask(self, searcher, cache=None, generation=None):
+        """
+        Runs the filters, returning a boolean array of the documents that pass all of them.
+        Returns None if the plan has no filters.
+        :param cache: optionally, a QueryCache to keep the masks in (each filter's, and the combined one.)
+        """
+        if not self.filters:
+            return None
+
+        combined = cache.get(('filters', self.filter_key), generation) if cache is not None else None
+        if combined is not None:
+            return combined
+
+        self.order(searcher)
+        mask = None
+        for step in self.filters:
+            step_mask = cache.get(('filter', step.key), generation) if cache is not None else None
+            if step_mask is None:
+                step_mask = step.mask(searcher)
+                if cache is not None:
+                    cache.put(('filter', step.key), step_mask, generation)
+
+            mask = step_mask.copy() if mask is None else mask & step_mask
+            if not mask.any():
+                # nothing left to narrow down, skip the remaining (less selective) filters.
+                break
+
+        if cache is not None:
+            cache.put(('filters', self.filter_key), mask, generation)
+        return mask
+
+    def explain(self):
+        """
+        Returns a human readable description of the plan.
+        """
+        lines = []
+        if self.scoring:
+            lines.append('score: ' + ', '.join(f'{field} = {target!r}' for field, target in self.scoring.items()))
+        else:
+            lines.append('score: none (results in index order)')
+
+        for num, step in enumerate(self.filters, 1):
+            lines.append(f'filter {num}: {step.describe()}')
+
+        return '\n'.join(lines)
+
+
+def plan_advanced_query(parameters, stores=()):
+    """
+    Splits advanced query `parameters` into scoring clauses and filters.
+    :param stores: the ColumnarStore/FacetIndex objects that may answer filters (already
+        checked to line up with the index being searched.) They're tried in order.
+    """
+    from .facet_index import FacetIndex
+
+    scoring, filters = {}, []
+    for field, target in parameters.items():
+        if field in SCORING_FIELDS:
+            scoring[field] = target
+            continue
+
+        for store in stores:
+            if store.can_filter(field, target):
+                source = 'facets' if isinstance(store, FacetIndex) else 'columns'
+                filters.append(FilterStep(field, target, source, store))
+                break
+        else:
+            filters.append(FilterStep(field, target, 'whoosh'))
+
+    return QueryPlan(scoring, filters)
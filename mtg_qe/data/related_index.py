@@ -0,0 +1,266 @@
+# Samuel Dunn
+# CS 483, Fall 2019
+
+# This module provides the related cards index: for every card that shows up in
+# the deck lists we've cached from tappedout, the cards it most often shares a deck with.
+# It's built offline from the deck lists (see `RelatedIndex.from_decks`) and saved
+# with the corpus, so the card info page can find related cards without going to the network.
+#
+# The site refreshes cards the corpus' index is missing (or has stale) while it runs. Those go into an
+# overlay kept next to the deck cache, outside the corpus (which stays as it was shipped): lookups
+# check the overlay first, then the corpus' index. See `find_related` and `save_related_overlay`.
+
+import os
+import time
+import logging
+
+import numpy as np
+
+RELATED_FILE = 'related.npz'
+
+# the site's refreshed entries, see `get_related_overlay`.
+RELATED_OVERLAY_FILE = os.path.join(os.path.dirname(__file__), 'related_overlay.npz')
+
+# how many related cards are kept per card.
+TOP_N = 25
+
+# cards in nearly every deck, which makes them related to everything (and so to nothing.)
+IGNORED_NAMES = frozenset(['Mountain', 'Island', 'Plains', 'Forest', 'Swamp'])
+
+def read_deck_list(path):
+    """
+    Returns the card names listed in a deck page saved from tappedout.
+    """
+    from lxml import html
+    with open(path, 'rb') as fd:
+        source = html.fromstring(fd.read())
+    return source.xpath('//div/ul/li/a/@data-orig')
+
+def read_deck_lists(cache):
+    """
+    Returns {deck name: [card names]} for every deck in `cache`, either a deck cache
+    file (see deck_cache.py) or a directory of saved deck pages.
+    """
+    from .deck_cache import DeckCache
+
+    if os.path.isfile(cache):
+        deck_cache = DeckCache(cache)
+        decks = deck_cache.all_decks()
+        deck_cache.close()
+        return decks
+
+    decks = {}
+    if os.path.isdir(cache):
+        for file_name in os.listdir(cache):
+            if file_name.endswith('.html'):
+                decks[file_name[:-len('.html')]] = read_deck_list(os.path.join(cache, file_name))
+    return decks
+
+class RelatedIndex(object):
+    """
+    The top related cards of every card, stored as flat arrays:
+    the related cards of names[i] are related[offsets[i]:offsets[i+1]], most related first,
+    with counts holding how many decks each pair shares.
+    An index may only have entries for some of its names (the rest are just there to be related to.)
+    """
+    def __init__(self, names, offsets, related, counts, built=None, entries=None):
+        """
+        :param list names: every card name in the index, sorted.
+        :param offsets: numpy array of len(names) + 1 offsets into `related` and `counts`.
+        :param related: numpy array of indexes into `names`.
+        :param counts: numpy array parallel to `related`, the number of decks the two cards share.
+        :param float built: when (time.time()) the index was built.
+        :param entries: optionally, a boolean array parallel to `names` flagging the names with entries. Defaults to all of them.
+        """
+        self._names = list(names)
+        self._ids = {name: i for i, name in enumerate(self._names)}
+        self._offsets = np.asarray(offsets, dtype=np.int64)
+        self._related = np.asarray(related, dtype=np.int32)
+        self._counts = np.asarray(counts, dtype=np.int32)
+        self._entries = np.ones(len(self._names), dtype=bool) if entries is None else np.asarray(entries, dtype=bool)
+        self.built = time.time() if built is None else built
+
+    def __len__(self):
+        return int(self._entries.sum())
+
+    def __contains__(self, name):
+        i = self._ids.get(name, None)
+        return i is not None and bool(self._entries[i])
+
+    @property
+    def entry_names(self):
+        """
+        Returns the names with entries.
+        """
+        return [name for name, entry in zip(self._names, self._entries) if entry]
+
+    def related(self, name, k=TOP_N):
+        """
+        Returns up to `k` (name, shared deck count) pairs for the cards most often found in decks with `name`.
+        Returns None if `name` isn't in any deck the index was built from.
+        """
+        i = self._ids.get(name, None)
+        if i is None or not self._entries[i]:
+            return None
+
+        start, end = self._offsets[i], min(self._offsets[i+1], self._offsets[i] + k)
+        return [(self._names[j], int(count)) for j, count in zip(self._related[start:end], self._counts[start:end])]
+
+    def save(self, path):
+        """
+        Writes the index to `path` (a .npz file.)
+        """
+        np.savez(path, names=np.array(self._names, dtype=str), offsets=self._offsets,
+                 related=self._related, counts=self._counts, built=np.array(self.built), entries=self._entries)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads an index previously written by `save`.
+        """
+        with np.load(path) as archive:
+            # indexes saved before entries were recorded have one for every name.
+            entries = archive['entries'] if 'entries' in archive.files else None
+            return cls(archive['names'].tolist(), archive['offsets'], archive['related'], archive['counts'],
+                       float(archive['built']), entries)
+
+    @classmethod
+    def from_decks(cls, decks, known_names=None, top_n=TOP_N, cards=None):
+        """
+        Builds an index out of deck lists.
+        :param dict decks: deck name -> list of card names in the deck.
+        :param known_names: optionally, the card names in the corpus. Cards not in it are left out.
+        :param int top_n: how many related cards to keep per card.
+        :param cards: optionally, the only card names to make entries for. Defaults to every card in the decks.
+        """
+        known = None if known_names is None else set(known_names)
+        lists = [{x for x in deck if x not in IGNORED_NAMES and (known is None or x in known)} for deck in decks.values()]
+        names = sorted(set().union(*lists)) if lists else []
+        ids = {name: i for i, name in enumerate(names)}
+
+        # the deck x card incidence matrix, in compressed sparse row form...
+        deck_cards = [np.array(sorted(ids[x] for x in deck), dtype=np.int32) for deck in lists]
+        deck_lengths = np.array([len(x) for x in deck_cards], dtype=np.int64)
+        deck_offsets = np.concatenate(([0], np.cumsum(deck_lengths)))
+        flat = np.concatenate(deck_cards) if deck_cards else np.zeros(0, dtype=np.int32)
+
+        # ...and its transpose, the decks each card is in.
+        card_decks = np.repeat(np.arange(len(deck_cards)), deck_lengths)[np.argsort(flat, kind='stable')]
+        card_offsets = np.searchsorted(np.sort(flat), np.arange(len(names) + 1))
+
+        entries = np.ones(len(names), dtype=bool)
+        if cards is not None:
+            entries[:] = False
+            entries[[ids[x] for x in set(cards) if x in ids]] = True
+
+        # row i of the co-occurrence matrix is the union (with multiplicity) of the decks card i is in.
+        offsets, related, counts = [0], [], []
+        for i in range(len(names)):
+            if not entries[i]:
+                offsets.append(offsets[-1])
+                continue
+
+            decks_of = card_decks[card_offsets[i]:card_offsets[i+1]]
+            neighbours = np.concatenate([flat[deck_offsets[d]:deck_offsets[d+1]] for d in decks_of])
+            others, shared = np.unique(neighbours, return_counts=True)
+            keep = others != i
+            others, shared = others[keep], shared[keep]
+
+            # most shared decks first, ties broken by name (names are sorted, so by index.)
+            order = np.lexsort((others, -shared))[:top_n]
+            related.append(others[order])
+            counts.append(shared[order])
+            offsets.append(offsets[-1] + len(order))
+
+        related = np.concatenate(related) if related else np.zeros(0, dtype=np.int32)
+        counts = np.concatenate(counts) if counts else np.zeros(0, dtype=np.int32)
+        return cls(names, offsets, related, counts, entries=entries)
+
+
+def get_related_index():
+    """
+    Returns the RelatedIndex saved with the corpus, or None if there isn't one.
+    """
+    # same module-global caching trick as internal_index_integration.get_internal_index
+    if '!!_related_index' not in globals():
+        from . import get_data_location
+        path = os.path.join(get_data_location(), RELATED_FILE)
+        globals()['!!_related_index'] = RelatedIndex.load(path) if os.path.exists(path) else None
+
+    return globals()['!!_related_index']
+
+def get_related_overlay():
+    """
+    Returns the RelatedIndex of cards the site has refreshed, or None if it hasn't refreshed any.
+    """
+    if '!!_related_overlay' not in globals():
+        found = os.path.exists(RELATED_OVERLAY_FILE)
+        globals()['!!_related_overlay'] = RelatedIndex.load(RELATED_OVERLAY_FILE) if found else None
+
+    return globals()['!!_related_overlay']
+
+def save_related_overlay(index):
+    """
+    Saves `index` as the site's refreshed entries, replacing the ones returned by `get_related_overlay`.
+    """
+    # write then rename, so a reader never sees half a file.
+    index.save(RELATED_OVERLAY_FILE + '.tmp.npz')
+    os.replace(RELATED_OVERLAY_FILE + '.tmp.npz', RELATED_OVERLAY_FILE)
+    globals()['!!_related_overlay'] = index
+
+def find_related(name, k=TOP_N):
+    """
+    Returns (related, built): up to `k` (name, shared deck count) pairs for the cards most related to `name`,
+    from the site's overlay if the card was refreshed and the corpus' index otherwise, and when (time.time())
+    the index they came from was built. Returns (None, None) if neither has an entry for `name`.
+    """
+    for index in (get_related_overlay(), get_related_index()):
+        related = None if index is None else index.related(name, k)
+        if related is not None:
+            return related, index.built
+
+    return None, None
+
+def related_built():
+    """
+    Returns when (time.time()) related cards last changed: when the newer of the corpus' index
+    and the site's overlay was built. None if there's neither.
+    """
+    built = [index.built for index in (get_related_overlay(), get_related_index()) if index is not None]
+    return max(built) if built else None
+
+def save_related_index(index):
+    """
+    Saves `index` to the corpus, replacing the one returned by `get_related_index`.
+    This is for building the corpus (see `cli_entry`), the site saves what it refreshes with `save_related_overlay`.
+    """
+    from . import get_data_location
+    path = os.path.join(get_data_location(), RELATED_FILE)
+
+    # write then rename, so a reader never sees half a file.
+    index.save(path + '.tmp.npz')
+    os.replace(path + '.tmp.npz', path)
+    globals()['!!_related_index'] = index
+
+def cli_entry():
+    '''
+    Rebuilds the corpus' related cards index from the decks cached from tappedout.
+    '''
+    import argparse
+    from . import get_data_location, get_internal_index
+    from .deck_cache import DEFAULT_CACHE_FILE
+
+    logging.basicConfig(level=logging.INFO)
+    log = logging.getLogger('related_index')
+
+    parser = argparse.ArgumentParser('mtg_qe_build_related')
+    parser.add_argument('-c', '--cache', type=str, default=DEFAULT_CACHE_FILE,
+                        help='the deck cache file (or a directory of saved deck pages.) Defaults to the one the site fills.')
+    parser.add_argument('-n', '--top', type=int, default=TOP_N, help='how many related cards to keep per card.')
+    args = parser.parse_args()
+
+    decks = read_deck_lists(args.cache)
+    log.info(f'Read {len(decks)} decks')
+    index = RelatedIndex.from_decks(decks, get_internal_index()['by_name'].keys(), args.top)
+    save_related_index(index)
+    log.info(f'Done! related cards for {len(index)} cards written to {os.path.join(get_data_location(), RELATED_FILE)}')
@@ -0,0 +1,102 @@
+# Samuel Dunn
+# CS 483, Fall 2019
+
+# This module defines the object the query api hands back to the site.
+# It bundles a page's worth of hits with everything the site needs to
+# draw its pagination controls, so that one search is enough to render
+# a results page.
+
+import math
+
+class ResultsPage(object):
+    """
+    A single page of search results.
+
+    Pages are zero-indexed here, matching `simple_query` and `advanced_query`.
+    Iterating over a ResultsPage (or calling len on it) behaves like the list
+    of cards the query methods used to return.
+    """
+    def __init__(self, hits, total, page, pagelen, facets=None):
+        self._hits = list(hits)
+        self._total = int(total)
+        self._page = int(page)
+        self._pagelen = int(pagelen)
+        self._facets = facets
+
+    @classmethod
+    def empty(cls, page, pagelen, facets=None):
+        """
+        Creates a page for a query that matched nothing.
+        """
+        return cls([], 0, page, pagelen, facets)
+
+    @property
+    def hits(self):
+        """
+        Returns the cards on this page, in rank order.
+        """
+        return self._hits
+
+    @property
+    def total(self):
+        """
+        Returns the total number of documents the query matched (across all pages.)
+        """
+        return self._total
+
+    @property
+    def page(self):
+        """
+        Returns the (zero-indexed) page this object represents.
+        """
+        return self._page
+
+    @property
+    def pagelen(self):
+        """
+        Returns the number of results per page used to produce this page.
+        """
+        return self._pagelen
+
+    @property
+    def page_count(self):
+        """
+        Returns the number of pages the full result set spans.
+        """
+        if self._pagelen <= 0:
+            return 0
+        return int(math.ceil(self._total / self._pagelen))
+
+    @property
+    def has_next(self):
+        """
+        Indicates whether there is at least one more page after this one.
+        """
+        return self._page + 1 < self.page_count
+
+    @property
+    def facets(self):
+        """
+        Returns facet counts over the whole result set, if they were asked for.
+        This is a dict of field -> [(value, count), ...], most common first. None otherwise.
+        """
+        return self._facets
+
+    def next_page_count(self, limit=3):
+        """
+        Returns how many pages follow this one, capped at `limit`.
+        The site uses this to decide how many page links to draw.
+        """
+        return max(0, min(limit, self.page_count - self._page - 1))
+
+    def __iter__(self):
+        return iter(self._hits)
+
+    def __len__(self):
+        return len(self._hits)
+
+    def __getitem__(self, idx):
+        return self._hits[idx]
+
+    def __repr__(self):
+        return f"ResultsPage(page={self._page}, pagelen={self._pagelen}, total={self._total}, hits={len(self._hits)})"
@@ -0,0 +1,261 @@
+# Samuel Dunn
+# CS 483, Fall 2019
+
+# This module provides content based "similar cards", for when related cards can't come from
+# tappedout. Every unique card gets a TF-IDF vector over its rules text (words and word pairs),
+# type line and colors, and its neighbours are the cards with the highest cosine similarity.
+#
+# All the neighbours are found at index time. The vectors are kept as a sparse matrix (CSR, plus
+# a CSC copy that works as a postings list per feature), and X @ X.T is computed a block of rows at a time,
+# keeping only the top k of each row, so memory stays bounded whatever the corpus size.
+# scipy.sparse does the products when it's installed, otherwise numpy does.
+
+import re
+import math
+
+import numpy as np
+
+from .columnar_store import load_corpus_store
+
+SIMILAR_FILE = 'similar.npz'
+
+# how many similar cards are kept per card.
+TOP_K = 25
+
+# features in fewer than MIN_DF cards can't make two cards similar, and ones in
+# more than MAX_DF (a fraction) of the cards hardly tell cards apart, so both are dropped.
+MIN_DF = 2
+MAX_DF = 0.5
+
+# bounds on the work done per block of rows: the (row, feature, card) products computed,
+# and the cells of the dense similarity block.
+MAX_PRODUCTS = 4000000
+MAX_CELLS = 4000000
+
+_TOKEN = re.compile(r"\{[^}]+\}|[+-]?\d+/[+-]?\d+|[a-z~]+")
+_COLORS = 'WUBRG'
+
+def card_features(card):
+    """
+    Returns {feature: count} for `card`: its rules text words and word pairs (with the card's own
+    name written as '~', the way reminder text refers to it), type line words and colors.
+    """
+    from whoosh.analysis import STOP_WORDS
+
+    features = {}
+    def add(feature):
+        features[feature] = features.get(feature, 0) + 1
+
+    text = (card.text or '').lower()
+    if card.name:
+        text = text.replace(card.name.lower(), '~')
+    words = [x for x in _TOKEN.findall(text) if x not in STOP_WORDS]
+    for word in words:
+        add(word)
+    for pair in zip(words, words[1:]):
+        add(' '.join(pair))
+
+    for word in (card.type or '').lower().split():
+        add('type:' + word)
+    for word in (card.subtypes or '').lower().split():
+        add('subtype:' + word)
+
+    mana = ''.join(card.mana_cost or ())
+    colors = [x for x in _COLORS if x in mana]
+    for color in colors:
+        add('color:' + color)
+    if not colors:
+        add('color:none')
+
+    return features
+
+class SimilarCards(object):
+    """
+    The top similar cards of every unique card, stored as flat arrays:
+    the neighbours of names[i] are neighbours[offsets[i]:offsets[i+1]], most similar first,
+    with scores holding their cosine similarity.
+    Like the other derived stores, it's tagged with the index generation it was built for.
+    """
+    def __init__(self, names, offsets, neighbours, scores, generation):
+        self._names = list(names)
+        self._ids = {name: i for i, name in enumerate(self._names)}
+        self._offsets = np.asarray(offsets, dtype=np.int64)
+        self._neighbours = np.asarray(neighbours, dtype=np.int32)
+        self._scores = np.asarray(scores, dtype=np.float32)
+        self._generation = generation
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return name in self._ids
+
+    def similar(self, name, k=TOP_K):
+        """
+        Returns up to `k` (name, similarity) pairs for the cards most similar to `name`,
+        or None if `name` isn't a card this was built from.
+        """
+        i = self._ids.get(name, None)
+        if i is None:
+            return None
+
+        start, end = self._offsets[i], min(self._offsets[i+1], self._offsets[i] + k)
+        return [(self._names[j], float(score)) for j, score in zip(self._neighbours[start:end], self._scores[start:end])]
+
+    def save(self, path):
+        """
+        Writes the neighbour lists to `path` (a .npz file.)
+        """
+        np.savez(path, __generation__=np.array(self._generation), names=np.array(self._names, dtype=str),
+                 offsets=self._offsets, neighbours=self._neighbours, scores=self._scores)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads neighbour lists previously written by `save`.
+        """
+        with np.load(path) as archive:
+            return cls(archive['names'].tolist(), archive['offsets'], archive['neighbours'], archive['scores'],
+                       int(archive['__generation__']))
+
+    @classmethod
+    def from_features(cls, names, features, generation, k=TOP_K):
+        """
+        Finds the `k` nearest neighbours of every card.
+        :param list names: the card names.
+        :param list features: parallel to `names`, each card's {feature: count} (see `card_features`.)
+        """
+        matrix = tfidf_matrix(features)
+        offsets, neighbours, scores = top_k_neighbours(*matrix, k)
+        return cls(names, offsets, neighbours, scores, generation)
+
+    @classmethod
+    def build(cls, whoosh_index, card_for, k=TOP_K):
+        """
+        Builds neighbour lists for the cards in `whoosh_index` (there's one document per unique name.)
+        :param card_for: a callable that takes a document's stored fields and returns its Card.
+        """
+        with whoosh_index.searcher() as searcher:
+            cards = sorted((card_for(stored) for stored in searcher.all_stored_fields()), key=lambda card: card.name)
+
+        return cls.from_features([card.name for card in cards], [card_features(card) for card in cards],
+                                 whoosh_index.latest_generation(), k)
+
+
+def tfidf_matrix(features):
+    """
+    Returns the L2 normalized TF-IDF vectors of `features` (a list of {feature: count}) as a
+    CSR matrix: (indptr, indices, data, number of columns). Term frequencies are sublinear (1 + log tf.)
+    """
+    df = {}
+    for counts in features:
+        for feature in counts:
+            df[feature] = df.get(feature, 0) + 1
+
+    n = len(features)
+    vocabulary = {}
+    idf = []
+    for feature, count in sorted(df.items()):
+        if MIN_DF <= count <= max(MIN_DF, MAX_DF * n):
+            vocabulary[feature] = len(vocabulary)
+            idf.append(math.log((1 + n) / (1 + count)) + 1)
+
+    indptr, indices, data = [0], [], []
+    for counts in features:
+        row = sorted((vocabulary[x], (1 + math.log(tf)) * idf[vocabulary[x]]) for x, tf in counts.items() if x in vocabulary)
+        norm = math.sqrt(sum(w * w for _, w in row)) or 1.0
+        indices.extend(i for i, _ in row)
+        data.extend(w / norm for _, w in row)
+        indptr.append(len(indices))
+
+    return (np.array(indptr, dtype=np.int64), np.array(indices, dtype=np.int32),
+            np.array(data, dtype=np.float32), len(vocabulary))
+
+def _block_products_numpy(indptr, indices, data, col_ptr, col_rows, col_data, start, end, n):
+    """
+    Returns rows start:end of X @ X.T as a dense array, from X's CSR and CSC forms.
+    """
+    entries = slice(indptr[start], indptr[end])
+    rows = np.repeat(np.arange(end - start), np.diff(indptr[start:end+1]))
+    terms, weights = indices[entries], data[entries]
+
+    # pair every nonzero of the block with every nonzero in its column (every card sharing the feature.)
+    lengths = col_ptr[terms + 1] - col_ptr[terms]
+    total = int(lengths.sum())
+    firsts = np.cumsum(lengths) - lengths
+    positions = np.arange(total) - np.repeat(firsts, lengths) + np.repeat(col_ptr[terms], lengths)
+
+    keys = np.repeat(rows, lengths) * n + col_rows[positions]
+    products = np.repeat(weights, lengths) * col_data[positions]
+    return np.bincount(keys, weights=products, minlength=(end - start) * n).reshape(end - start, n)
+
+def top_k_neighbours(indptr, indices, data, columns, k=TOP_K):
+    """
+    Returns (offsets, neighbours, scores): for every row of the CSR matrix, the (up to) `k` other rows
+    with the largest dot product with it, largest first. Rows with nothing in common are left out.
+    """
+    n = len(indptr) - 1
+    try:
+        import scipy.sparse
+        matrix = scipy.sparse.csr_matrix((data, indices, indptr), shape=(n, columns))
+        transposed = matrix.T.tocsc()
+        block_products = lambda start, end: (matrix[start:end] @ transposed).toarray()
+    except ImportError:
+        # the CSC form: for each feature (column), the rows that have it.
+        order = np.argsort(indices, kind='stable')
+        col_rows = np.repeat(np.arange(n), np.diff(indptr))[order]
+        col_data = data[order]
+        col_ptr = np.concatenate(([0], np.cumsum(np.bincount(indices, minlength=columns))))
+        block_products = lambda start, end: _block_products_numpy(indptr, indices, data, col_ptr, col_rows, col_data, start, end, n)
+
+    # each row's share of the work: how many (feature, card) pairs its features reach.
+    reach = np.concatenate(([0], np.cumsum(np.bincount(indices, minlength=columns)[indices])))
+    row_costs = reach[indptr[1:]] - reach[indptr[:-1]]
+    max_rows = max(1, MAX_CELLS // max(n, 1))
+
+    k = min(k, n - 1)
+    offsets, neighbours, scores = [0], [], []
+    start = 0
+    while start < n:
+        # grow the block until it would go over either budget (but always take at least one row.)
+        end, cost = start + 1, row_costs[start]
+        while end < n and end - start < max_rows and cost + row_costs[end] <= MAX_PRODUCTS:
+            cost += row_costs[end]
+            end += 1
+
+        block = block_products(start, end)
+        rows = np.arange(end - start)
+        block[rows, rows + start] = 0
+
+        if k > 0:
+            # each row's k-th largest score. argpartition alone picks arbitrarily among rows tied with it,
+            # so every row scoring at least that much is a candidate, and the tie-break below picks from them.
+            kth = -np.partition(-block, k - 1, axis=1)[:, k - 1]
+            for row, row_kth in zip(block, kth):
+                candidates = np.flatnonzero((row >= row_kth) & (row > 1e-6))
+                candidate_scores = row[candidates]
+                # most similar first, ties broken by row (which, for names sorted, is by name.)
+                order = np.lexsort((candidates, -candidate_scores))[:k]
+                neighbours.append(candidates[order])
+                scores.append(candidate_scores[order])
+                offsets.append(offsets[-1] + len(order))
+        else:
+            offsets.extend([offsets[-1]] * (end - start))
+
+        start = end
+
+    neighbours = np.concatenate(neighbours) if neighbours else np.zeros(0, dtype=np.int32)
+    scores = np.concatenate(scores) if scores else np.zeros(0, dtype=np.float32)
+    return np.array(offsets, dtype=np.int64), neighbours.astype(np.int32), scores.astype(np.float32)
+
+
+def get_similar_cards(generation):
+    """
+    Returns the SimilarCards saved with the corpus, so long as it was built
+    for index generation `generation`. Returns None otherwise.
+    """
+    return load_corpus_store(SIMILAR_FILE, SimilarCards.load, generation)
@@ -0,0 +1,181 @@
+# Samuel Dunn
+# CS 483, Fall 2019
+
+# This module provides "did you mean" corrections for simple queries.
+# It uses symmetric delete spelling correction (the idea behind SymSpell):
+# every dictionary term is stored under each string you can get by deleting up
+# to MAX_EDITS characters from it. A misspelled word, with up to MAX_EDITS of its
+# own characters deleted, lands on the same strings as the terms it's close to,
+# so candidates come from a few lookups rather than a scan of the dictionary.
+#
+# The dictionary is the whoosh lexicon of the name and rules_text fields.
+# The delete strings are stored as 64 bit hashes in a sorted array (collisions
+# are harmless, every candidate is checked with a real edit distance.)
+
+import re
+import hashlib
+import itertools
+
+import numpy as np
+
+from ..utils.text import edit_distance
+from .columnar_store import load_corpus_store
+
+SPELLING_FILE = 'spelling.npz'
+
+# the whoosh fields whose terms make up the dictionary.
+DICTIONARY_FIELDS = ('name', 'rules_text')
+
+# the furthest (in edits) a correction may be from what was typed.
+MAX_EDITS = 2
+
+# only the start of each word gets deletes generated, which keeps the dictionary small
+# while still catching nearly every typo.
+PREFIX_LENGTH = 7
+
+_WORD = re.compile(r"\w+")
+
+def _deletes(word, max_edits=MAX_EDITS):
+    """
+    Returns the set of strings made by deleting up to `max_edits` characters from the start of `word`.
+    """
+    prefix = word[:PREFIX_LENGTH]
+    found = {prefix}
+    for count in range(1, min(max_edits, len(prefix) - 1) + 1):
+        for drop in itertools.combinations(range(len(prefix)), count):
+            found.add(''.join(c for i, c in enumerate(prefix) if i not in drop))
+    return found
+
+def _hash(text):
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+class SpellingCorrector(object):
+    """
+    A term dictionary (with document frequencies) plus its symmetric delete lookup table.
+    Like the other derived stores, a corrector is tagged with the index generation it was built for.
+    """
+    def __init__(self, terms, counts, hashes, term_ids, generation):
+        """
+        :param list terms: the dictionary terms.
+        :param counts: numpy array, how many documents each term appears in.
+        :param hashes: sorted numpy uint64 array of delete string hashes.
+        :param term_ids: numpy array parallel to `hashes`, the term each delete came from.
+        :param int generation: the whoosh index generation this was built alongside.
+        """
+        self._terms = list(terms)
+        self._ids = {term: i for i, term in enumerate(self._terms)}
+        self._counts = np.asarray(counts, dtype=np.int32)
+        self._hashes = np.asarray(hashes, dtype=np.uint64)
+        self._term_ids = np.asarray(term_ids, dtype=np.int32)
+        self._generation = generation
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def __contains__(self, term):
+        return term in self._ids
+
+    def correct_word(self, word):
+        """
+        Returns the dictionary term closest to `word` (fewest edits, then most common),
+        `word` itself if it's in the dictionary, or None if nothing is within MAX_EDITS.
+        """
+        word = word.lower()
+        if word in self._ids:
+            return word
+
+        keys = np.array([_hash(x) for x in _deletes(word)], dtype=np.uint64)
+        lo = np.searchsorted(self._hashes, keys, side='left')
+        hi = np.searchsorted(self._hashes, keys, side='right')
+        candidates = set()
+        for a, b in zip(lo, hi):
+            candidates.update(self._term_ids[a:b].tolist())
+
+        best = None
+        for i in candidates:
+            distance = edit_distance(word, self._terms[i], MAX_EDITS)
+            if distance <= MAX_EDITS:
+                rank = (distance, -self._counts[i], self._terms[i])
+                if best is None or rank < best:
+                    best = rank
+
+        return None if best is None else best[2]
+
+    def correct(self, query):
+        """
+        Returns `query` with its misspelled words corrected, or None if there's nothing
+        to correct (every word is known, ignored, or has no close enough match.)
+        """
+        from whoosh.analysis import STOP_WORDS
+
+        changed = False
+        def fix(match):
+            nonlocal changed
+            word = match.group(0)
+            lowered = word.lower()
+            # skip words whoosh doesn't index anyway (stop words, single characters, numbers)
+            if lowered in self._ids or lowered in STOP_WORDS or len(lowered) < 2 or lowered.isdigit():
+                return word
+
+            corrected = self.correct_word(lowered)
+            if corrected is None or corrected == lowered:
+                return word
+
+            changed = True
+            return corrected
+
+        corrected = _WORD.sub(fix, query)
+        return corrected if changed else None
+
+    def save(self, path):
+        """
+        Writes the corrector to `path` (a .npz file.)
+        """
+        np.savez(path, __generation__=np.array(self._generation), terms=np.array(self._terms, dtype=str),
+                 counts=self._counts, hashes=self._hashes, term_ids=self._term_ids)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a corrector previously written by `save`.
+        """
+        with np.load(path) as archive:
+            return cls(archive['terms'].tolist(), archive['counts'], archive['hashes'], archive['term_ids'],
+                       int(archive['__generation__']))
+
+    @classmethod
+    def from_terms(cls, term_counts, generation):
+        """
+        Builds a corrector from a dict of term -> document frequency.
+        """
+        terms = sorted(term_counts)
+        pairs = sorted((_hash(delete), i) for i, term in enumerate(terms) for delete in _deletes(term))
+        hashes = np.array([h for h, _ in pairs], dtype=np.uint64)
+        term_ids = np.array([i for _, i in pairs], dtype=np.int32)
+        return cls(terms, [term_counts[x] for x in terms], hashes, term_ids, generation)
+
+    @classmethod
+    def build(cls, whoosh_index):
+        """
+        Builds a corrector out of the DICTIONARY_FIELDS lexicons of `whoosh_index`.
+        """
+        term_counts = {}
+        with whoosh_index.searcher() as searcher:
+            reader = searcher.reader()
+            for field in DICTIONARY_FIELDS:
+                for term, info in reader.iter_field(field):
+                    term = term.decode('utf-8') if isinstance(term, bytes) else term
+                    # numbers and the like aren't worth suggesting.
+                    if term.isalpha():
+                        term_counts[term] = term_counts.get(term, 0) + info.doc_frequency()
+
+        return cls.from_terms(term_counts, whoosh_index.latest_generation())
+
+
+def get_spelling_corrector(generation):
+    """
+    Returns the SpellingCorrector saved with the corpus, so long as it was built
+    for index generation `generation`. Returns None otherwise.
+    """
+    return load_corpus_store(SPELLING_FILE, SpellingCorrector.load, generation)
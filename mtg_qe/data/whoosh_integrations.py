@@ -2,23 +2,30 @@
 # CS 483, Fall 2019
 
 import os
+import time
+import threading
+import contextlib
 import whoosh
+import whoosh.index
 
-def make_whoosh_schema():
+def make_whoosh_schema(compact=False):
     """
     Creates and returns the whoosh schema being used.
     Note: typically you will want to retrieve the schema from
           the index itself (ix.schema).
           This function exists to create a schema object during
           the creation of the index.
+    :param bool compact: when True, documents only store the card's multiverseid
+        (cards are then looked up in the internal index), rather than a pickled
+        copy of the whole card.
     """
     from whoosh import fields
     schema = fields.Schema(name = fields.TEXT,
                             rules_text = fields.TEXT,
                             flavor_text = fields.TEXT,
-                            sets = fields.KEYWORD(stored=True),
-                            types = fields.KEYWORD(stored=True),
-                            subtypes = fields.KEYWORD(stored=True),
+                            sets = fields.KEYWORD(stored=not compact),
+                            types = fields.KEYWORD(stored=not compact),
+                            subtypes = fields.KEYWORD(stored=not compact),
                             power = fields.NUMERIC,
                             toughness = fields.NUMERIC,
                             cmc = fields.NUMERIC,
@@ -28,15 +35,151 @@ def make_whoosh_schema():
                             black = fields.NUMERIC,
                             red = fields.NUMERIC,
                             green = fields.NUMERIC,
-                            legal_formats = fields.KEYWORD(stored=True),
-                            data_obj = fields.STORED)
+                            legal_formats = fields.KEYWORD(stored=not compact))
+    if compact:
+        schema.add('multiverseid', fields.STORED)
+    else:
+        schema.add('data_obj', fields.STORED)
+
     return schema
 
+def is_compact_schema(schema):
+    """
+    Returns True if `schema` stores multiverseids rather than pickled cards.
+    """
+    return 'data_obj' not in schema
 
 def get_whoosh_index():
     """
     Locates, loads, and returns the whoosh index bundled with the package installation.
+    The index handle is opened once and shared by the whole process.
+    """
+    return get_searcher_pool().index
+
+def get_searcher_pool():
+    """
+    Returns the process wide SearcherPool for the bundled whoosh index,
+    opening the index the first time its needed.
+    """
+    # Same trick as internal_index_integration.get_internal_index: stash the
+    # singleton in the module's globals under a name that can't be referenced directly.
+    # Unlike the internal index, CherryPy's worker threads may race to create this,
+    # so creation is guarded by a lock.
+    pool = globals().get('!!_searcher_pool', None)
+    if pool is None:
+        with _pool_creation_lock:
+            pool = globals().get('!!_searcher_pool', None)
+            if pool is None:
+                from . import get_data_location
+                whoosh_path = os.path.join(get_data_location(), 'whoosh_index')
+                pool = SearcherPool(whoosh.index.open_dir(whoosh_path))
+                globals()['!!_searcher_pool'] = pool
+
+    return pool
+
+_pool_creation_lock = threading.Lock()
+
+
+class SearcherPool(object):
+    """
+    Hands out reusable searchers over a single, long-lived, whoosh index.
+
+    Whoosh searchers aren't safe to share between threads, but they are
+    expensive enough to open (reading the TOC and segment files) that we
+    don't want to open one per query. So each CherryPy worker checks out a
+    searcher for the duration of a query and returns it when its done.
+
+    Searchers are tied to the index generation that was current when they
+    were opened. When a new generation shows up on disk the idle searchers
+    are discarded, and any that are checked out get closed when they come back.
     """
-    from . import get_data_location
-    whoosh_path = os.path.join(get_data_location(), 'whoosh_index')
-    return whoosh.index.open_dir(whoosh_path)
+    def __init__(self, ix, max_idle=8, check_interval=1.0):
+        """
+        :param ix: the whoosh index to search.
+        :param int max_idle: the most searchers to keep open while not in use.
+        :param float check_interval: minimum number of seconds between checks of the index generation on disk.
+        """
+        self._ix = ix
+        self._max_idle = max_idle
+        self._check_interval = check_interval
+        self._lock = threading.Lock()
+        self._idle = [] # holds (generation, searcher) pairs
+        self._generation = ix.latest_generation()
+        self._last_check = time.monotonic()
+
+    @property
+    def index(self):
+        """
+        Returns the whoosh index this pool searches.
+        """
+        return self._ix
+
+    @property
+    def generation(self):
+        """
+        Returns the generation of the index the pool is currently handing out searchers for.
+        """
+        self._check_generation()
+        return self._generation
+
+    @contextlib.contextmanager
+    def searcher(self):
+        """
+        Context manager that checks out a searcher, and returns it to the pool on exit.
+        ex:
+            with pool.searcher() as searcher:
+                searcher.search(...)
+        """
+        self._check_generation()
+        with self._lock:
+            entry = self._idle.pop() if self._idle else None
+            generation = self._generation
+
+        if entry is None:
+            entry = (generation, self._ix.searcher())
+
+        try:
+            yield entry[1]
+        finally:
+            self._checkin(entry)
+
+    def close(self):
+        """
+        Closes all idle searchers. Searchers that are checked out are closed when returned.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._generation = None
+
+        for _, searcher in idle:
+            searcher.close()
+
+    def _checkin(self, entry):
+        with self._lock:
+            if entry[0] == self._generation and len(self._idle) < self._max_idle:
+                self._idle.append(entry)
+                return
+
+        # stale or surplus searcher, let it go.
+        entry[1].close()
+
+    def _check_generation(self):
+        """
+        Looks at the index generation on disk (at most once every `check_interval` seconds)
+        and drops idle searchers if its changed.
+        """
+        now = time.monotonic()
+        if now - self._last_check < self._check_interval:
+            return
+        self._last_check = now
+
+        latest = self._ix.latest_generation()
+        if latest == self._generation:
+            return
+
+        with self._lock:
+            stale, self._idle = self._idle, []
+            self._generation = latest
+
+        for _, searcher in stale:
+            searcher.close()
@@ -7,20 +7,63 @@
 # https://magic.wizards.com/en/articles/archive/magic-academy/anatomy-magic-card-2006-10-21
 
 import os
+import functools
 from requests.compat import urljoin
 import json
 
 try:
     from ..utils.path_helpers import normalize_name, join_urls
+    from ..utils.mana import mana_cost_to_html, replace_curly_brackets_in_text
 except ImportError:
     from mtg_qe.utils.path_helpers import normalize_name, join_urls
+    from mtg_qe.utils.mana import mana_cost_to_html, replace_curly_brackets_in_text
+
+@functools.lru_cache(maxsize=4096)
+def _compute_cmc(mana_cost):
+    """
+    Computes the converted mana cost of a tuple of curly-bracket mana symbols.
+    There are relatively few distinct mana costs, so results are memoized.
+    """
+    if not mana_cost:
+        return 0
+
+    l = []
+    for x in mana_cost:
+        if 'X' in x:
+            pass
+        try:
+            l.append(int(x[1:-1])) # ignore the {}'s around the number
+        except Exception:
+            l.append(1)
+
+    return sum(l)
+
+def _split_p_t(value):
+    """
+    Splits a 'power/toughness' string into its (power, toughness) pair.
+    """
+    if not value:
+        return None, None
+
+    split = value.split('/')
+    return split[0].strip(), split[1].strip() if len(split) > 1 else None
 
 class Card(object):
+    # Cards are kept in bulk (tens of thousands of them), so they use
+    # slots rather than a per-instance __dict__.
+    # _cmc, _power and _toughness are derived from _mana and _pt when those are set.
+    # _mana_html and _text_html are the rendered forms of _mana and _rules_text, worked out
+    # at index time (or on first use, for cards serialized before they existed.)
+    __slots__ = ('_artist', '_name', '_mana', '_cmc', '_type', '_subtypes', '_rarity',
+                 '_expansion', '_set_number', '_rules_text', '_flavor_text', '_pt',
+                 '_power', '_toughness', '_printings', '_legal_in', '_external_link',
+                 '_external_img_link', '_multiverseid', '_mana_html', '_text_html')
+
     def __init__(self):
         self._artist = None
         self._name = None
         self._mana = None
-        self._cmc = None
+        self._cmc = 0
         self._type = None
         self._subtypes = None
         self._rarity = None
@@ -29,10 +72,38 @@ class Card(object):
         self._rules_text = None
         self._flavor_text = None
         self._pt = None
+        self._power = None
+        self._toughness = None
         self._printings = []
-        self._legal_in = []
+        self._legal_in = ()
         self._external_link = None
         self._external_img_link = None
+        self._multiverseid = None
+        self._mana_html = None
+        self._text_html = None
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        # Cards pickled before Card used __slots__ (ie. in legacy whoosh indexes)
+        # hand us their __dict__, which may not have every field and won't
+        # have the derived ones. So start fresh and recompute what we need.
+        if isinstance(state, tuple):
+            state = dict(state[0] or {}, **(state[1] or {}))
+
+        self.__init__()
+        for name, value in state.items():
+            if name in self.__slots__:
+                object.__setattr__(self, name, value)
+
+        mana, self._mana = self._mana, None
+        self.mana_cost = mana
+        # the setter leaves cmc alone for cards without a mana cost, which old pickles may have as None.
+        # _populate gives those 0, so do the same here.
+        self._cmc = _compute_cmc(self._mana)
+        self.p_t = self._pt
+        self._legal_in = tuple(self._legal_in)
 
     def serialize(self):
         """
@@ -45,7 +116,7 @@ class Card(object):
             version, allowing us to ensure backwards compatibility.
         """
         return {
-            "schema": 2,
+            "schema": 3,
             "name": self.name,
             "rarity": self.rarity,
             "mana": self.mana_cost,
@@ -63,7 +134,9 @@ class Card(object):
             "artwork_external" : self.external_artwork,
             "artwork_internal" : self.local_artwork,
             "multiverseid": self.multiverseid,
-            "source_link" : self.gatherer_link
+            "source_link" : self.gatherer_link,
+            "mana_html": self.mana_html,
+            "text_html": self.text_html
         }
 
     def deserialize(self, obj):
@@ -74,30 +147,75 @@ class Card(object):
         if isinstance(obj, str):
             obj = json.loads(obj)
 
-        if obj['schema'] in (1, 2):
-            self.name = obj['name']
-            self.rarity = obj['rarity']
-            self.mana_cost = obj['mana']
-            self._type = obj['type']
-            self._subtypes = obj['subtypes']
-            self.text = obj['text']
-            self.flavor = obj['flavor_text']
-            self.expansion = obj['expansion']
-            self.other_prints = obj['printings']
-            self.set_number = obj['set_number']
-            self.legal_formats = obj['formats']
-            self.external_artwork = obj['artwork_external']
-            self.multiverseid = obj['multiverseid']
-
-            if obj['power'] and obj['toughness']:
-                self.p_t = obj['power'] + '/' + obj['toughness']
-
-        if obj['schema'] == 2:
-            self.gatherer_link = obj['source_link']
+        self._populate(obj)
 
         # for convenience:
         return self
 
+    @classmethod
+    def deserialize_many(cls, objs):
+        """
+        Inflates an iterable of serialized cards, returning a list of Cards.
+        This is the fast path for loading cards in bulk, it skips __init__ and the property setters.
+        """
+        new = cls.__new__
+        cards = []
+        for obj in objs:
+            if isinstance(obj, str):
+                obj = json.loads(obj)
+
+            card = new(cls)
+            card._artist = None
+            card._populate(obj)
+            cards.append(card)
+
+        return cards
+
+    def _populate(self, obj):
+        """
+        Assigns every field from a serialized card directly to its slot.
+        This produces the same card the property setters would, without the overhead.
+        """
+        schema = obj['schema']
+        if schema not in (1, 2, 3):
+            raise ValueError(f"Unknown card schema: {schema}")
+
+        mana = obj['mana']
+        self._mana = tuple(mana) if mana else None
+        self._cmc = _compute_cmc(self._mana)
+
+        power, toughness = obj['power'], obj['toughness']
+        if power and toughness:
+            self._pt = power + '/' + toughness
+            self._power, self._toughness = _split_p_t(self._pt)
+        else:
+            self._pt = self._power = self._toughness = None
+
+        self._name = obj['name']
+        self._rarity = obj['rarity']
+        self._type = obj['type']
+        self._subtypes = obj['subtypes']
+        self._rules_text = obj['text']
+        self._flavor_text = obj['flavor_text']
+        self._expansion = obj['expansion']
+        self._printings = obj['printings'].copy()
+        self._set_number = obj['set_number']
+        self._legal_in = tuple(obj['formats'])
+        self._multiverseid = int(obj['multiverseid'])
+
+        # the gatherer link isn't known yet when the artwork link is resolved
+        # (mirrors the order the property setters have always been applied in.)
+        link = obj['artwork_external']
+        if link.startswith('..'):
+            raise ValueError(f"Given relative link! ({link})")
+        self._external_img_link = link
+
+        self._external_link = obj['source_link'] if schema >= 2 else None
+
+        # older schemas don't have these, they're rendered on first use instead.
+        self._mana_html = obj.get('mana_html', None)
+        self._text_html = obj.get('text_html', None)
+
     @property
     def multiverseid(self):
         """
@@ -130,7 +248,7 @@ class Card(object):
         """
         Returns the ManaCost of a card.
         """
-        return None if self._mana is None else tuple(self._mana)
+        return self._mana
 
     @mana_cost.setter
     def mana_cost(self, value):
@@ -138,28 +256,24 @@ class Card(object):
         Sets the mana cost of the card (convert to the appropriate class as necessaary)
         """
         if value:
-            self._mana = value[:]
+            self._mana = tuple(value)
+            self._cmc = _compute_cmc(self._mana)
+            self._mana_html = None
+
+    @property
+    def mana_html(self):
+        """
+        Returns the mana cost as html (an image per symbol), or None if the card has no mana cost.
+        """
+        if self._mana_html is None and self._mana is not None:
+            self._mana_html = mana_cost_to_html(self._mana)
+        return self._mana_html
 
     @property
     def cmc(self):
         """
         Returns the converted mana cost of the card.
         """
-        if not self.mana_cost:
-            return 0
-
-        if self._cmc is None:
-            l = []
-            for x in self.mana_cost:
-                if 'X' in x:
-                    pass
-                try:
-                    l.append(int(x[1:-1])) # ignore the {}'s around the number
-                except Exception:
-                    l.append(1)
-
-            self._cmc = sum(l)
-
         return self._cmc
 
     # no setter for cmc, its calculated from mana_cost
@@ -203,6 +317,16 @@ class Card(object):
         Sets the cards text
         """
         self._rules_text = value
+        self._text_html = None
+
+    @property
+    def text_html(self):
+        """
+        Returns the rules text as html (mana symbols as images), or None if the card has no text.
+        """
+        if self._text_html is None and self._rules_text:
+            self._text_html = replace_curly_brackets_in_text(self._rules_text)
+        return self._text_html
 
     @property
     def flavor(self):
@@ -224,16 +348,14 @@ class Card(object):
         If this card is a creature, return its power.
         """
         # can't convert to int, may be '*'
-        if self._pt:
-            return self._pt.split('/')[0].strip()
+        return self._power
 
     @property
     def toughness(self):
         """
         If this card is a creature, return its toughness.
         """
-        if self._pt:
-            return self._pt.split('/')[1].strip()
+        return self._toughness
 
     @property
     def p_t(self):
@@ -246,6 +368,7 @@ class Card(object):
         """
         """
         self._pt = value
+        self._power, self._toughness = _split_p_t(value)
 
 
     @property
@@ -344,11 +467,11 @@ class Card(object):
 
     @property
     def legal_formats(self):
-        return tuple(self._legal_in)
+        return self._legal_in
 
     @legal_formats.setter
     def legal_formats(self, value):
-        self._legal_in = value[:]
+        self._legal_in = tuple(value)
 
     @property
     def gatherer_link(self):
@@ -0,0 +1,70 @@
+// Samuel Dunn
+// CS 483, Fall 2019
+// This file fills in the related cards panel of the card info page when the site
+// didn't have related cards for the card yet. It polls /related/<name> until the
+// lookup finishes, or gives up after a while.
+
+// how often (ms) to ask, and how long (ms) to keep asking.
+var RELATED_POLL_INTERVAL = 1000;
+var RELATED_DEADLINE = 20000;
+
+function renderRelatedCards(container, cards) {
+    if (cards.length == 0) {
+        container.innerHTML = '<table align="center"><tr><td>No related cards for this card yet, check back later</td></tr></table>';
+        return;
+    }
+
+    var table = document.createElement('table');
+    table.className = 'related';
+    table.align = 'center';
+    var row = table.insertRow();
+    for (var card of cards) {
+        var link = '/cardinfo?cardid=' + encodeURIComponent(card.multiverseid);
+        var cell = row.insertCell();
+
+        var art = document.createElement('a');
+        art.href = link;
+        var img = document.createElement('img');
+        img.src = card.artwork;
+        img.height = 200;
+        art.appendChild(img);
+
+        var label = document.createElement('a');
+        label.href = link;
+        label.textContent = card.name.length > 16 ? card.name.substring(0, 13) + '...' : card.name;
+
+        cell.appendChild(art);
+        cell.appendChild(document.createElement('br'));
+        cell.appendChild(label);
+    }
+
+    container.innerHTML = '';
+    container.appendChild(table);
+    var source = document.createElement('table');
+    source.align = 'center';
+    source.innerHTML = '<tr><td>Related cards sourced from <a href="https://tappedout.net/"><u>tappedout.net</u></a></td></tr>';
+    container.appendChild(source);
+}
+
+function loadRelatedCards(name, containerId) {
+    var container = document.getElementById(containerId);
+    var deadline = Date.now() + RELATED_DEADLINE;
+
+    function poll() {
+        fetch('/related/' + encodeURIComponent(name))
+            .then(function(response) { return response.json(); })
+            .then(function(result) {
+                if (result.pending && Date.now() < deadline) {
+                    setTimeout(poll, RELATED_POLL_INTERVAL);
+                } else {
+                    renderRelatedCards(container, result.cards);
+                }
+            })
+            .catch(function(err) {
+                console.log("Unable to fetch related cards: " + err);
+                renderRelatedCards(container, []);
+            });
+    }
+
+    poll();
+}
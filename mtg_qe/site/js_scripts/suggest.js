@@ -0,0 +1,35 @@
+// Samuel Dunn
+// CS 483, Fall 2019
+// This file supplies card name autocompletion for the simple search bar.
+// Suggestions are fetched from /suggest as the user types and put in a <datalist>.
+
+function applyNameSuggestions(inputId, listId) {
+    var input = document.getElementById(inputId);
+    var list = document.getElementById(listId);
+    var latest = null;
+
+    input.addEventListener('input', function() {
+        var prefix = input.value;
+        latest = prefix;
+        if (prefix.trim().length == 0) {
+            list.innerHTML = '';
+            return;
+        }
+
+        fetch('/suggest?k=8&prefix=' + encodeURIComponent(prefix))
+            .then(function(response) { return response.json(); })
+            .then(function(names) {
+                // responses may come back out of order, only show the newest.
+                if (prefix != latest) {
+                    return;
+                }
+                list.innerHTML = '';
+                for (var name of names) {
+                    var option = document.createElement('option');
+                    option.value = name;
+                    list.appendChild(option);
+                }
+            })
+            .catch(function(err) { console.log("Unable to fetch suggestions: " + err); });
+    });
+}
@@ -2,17 +2,100 @@
 # CS 483, Fall 2019
 
 import os
+import logging
+import threading
 import cherrypy
-from .related_cards import related_cards
-from ..utils.mana import replace_curly_brackets_in_text, curly_bracket_to_img_link
-from jinja2 import Environment, FileSystemLoader
+from collections import OrderedDict
+from .related_cards import related_cards, refresh_pending
+from .warmup import Warmup
+from .templating import make_environment, template_version
+from .static_assets import serve_asset, get_asset_manifest, asset_links, IMMUTABLE_MAX_AGE
 import json
 
 simple = 1
 
+# the most queries a single multi_search request may carry.
+MAX_MULTI_SEARCH = 100
+
+# the most names /suggest will return.
+MAX_SUGGESTIONS = 25
+
+# how many cards with names like a simple search's query are offered above its results.
+NAME_MATCHES = 3
+
+# how many related cards the card info page shows.
+RELATED_CARDS = 10
+
+# how long (in seconds) browsers may cache card artwork, it only changes when the corpus is rebuilt.
+ART_MAX_AGE = 7 * 24 * 60 * 60
+
+# how many hex digits of an image's hash go in its artwork links (see MTGSearch._locate_art_for_card)
+ART_FINGERPRINT_LENGTH = 10
+
+# the most result rows (see MTGSearch._result_rows) kept between requests.
+MAX_ROWS = 4096
+
+# how long (in seconds) browsers and caches may reuse a search or card page before checking it's current.
+# Pages only change with the corpus (or the site's templates), so checking is almost always a 304.
+PAGE_MAX_AGE = 10 * 60
+
+# Card.serialize() keys that may be exported, in column order.
+EXPORT_FIELDS = ('multiverseid', 'name', 'mana', 'cmc', 'type', 'subtypes', 'text', 'flavor_text', 'power', 'toughness',
+                 'rarity', 'expansion', 'set_number', 'formats', 'printings', 'artwork_external', 'artwork_internal', 'source_link')
+
+def _ndjson_rows(cards, fields):
+    """
+    Yields one line of json per card.
+    """
+    for card in cards:
+        obj = card.serialize()
+        yield (json.dumps({x: obj[x] for x in fields}) + '\n').encode('utf-8')
+
+def _csv_rows(cards, fields):
+    """
+    Yields a header line, then one csv line per card. Fields that aren't plain values
+    (mana costs, formats, printings) are written as json.
+    """
+    import io
+    import csv
+
+    def line(values):
+        buf = io.StringIO()
+        csv.writer(buf).writerow(values)
+        return buf.getvalue().encode('utf-8')
+
+    yield line(fields)
+    for card in cards:
+        obj = card.serialize()
+        yield line([json.dumps(obj[x]) if isinstance(obj[x], (list, tuple, dict)) else obj[x] for x in fields])
+
+# export format -> (content type, row generator)
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', _ndjson_rows),
+    'csv': ('text/csv; charset=utf-8', _csv_rows),
+}
+
 class MTGSearch(object):
-    def __init__(self, env_obj):
+    def __init__(self, env_obj, autocorrect=False, warmup=None, offline_related=False):
+        """
+        :param env_obj: the jinja Environment to load templates from.
+        :param bool autocorrect: when a simple search finds nothing, run the spelling
+            corrected query instead of only suggesting it.
+        :param warmup: the site's Warmup, if it has one. (see /healthz)
+        :param bool offline_related: show cards similar by rules text as related cards,
+            rather than ones found through tappedout.
+        """
         self.env = env_obj
+        self.autocorrect = autocorrect
+        self.warmup = warmup
+        self.offline_related = offline_related
+        self._art_manifest = None
+        self._validators = None
+
+        # (corpus version, multiverseid) -> the card's row in the results templates, see _result_rows.
+        # Bounded like LazyCardStore's inflated cards, most recently used last.
+        self._rows = OrderedDict()
+        self._rows_lock = threading.Lock()
 
         # Associate error handlers:
         cherrypy.config.update({'error_page.404':self.on_404})
@@ -21,6 +104,22 @@ class MTGSearch(object):
         template = self.env.get_template('error_404.html')
         return template.render()
 
+    @cherrypy.expose
+    @cherrypy.tools.json_out()
+    @cherrypy.config(**{'tools.warmup_gate.on': False})
+    def healthz(self):
+        """
+        Readiness check for load balancers. Answers 200 once warm-up is done, 503 until then,
+        along with how long each warm-up stage took.
+        """
+        if self.warmup is None:
+            return {'ready': True}
+
+        status = self.warmup.status()
+        if not status['ready']:
+            cherrypy.response.status = 503
+        return status
+
     @cherrypy.expose
     def index(self):
         global simple
@@ -49,6 +148,9 @@ class MTGSearch(object):
         page = int(page)
         results = int(results)
 
+        # a browser (or cache) asking if its copy is current gets a 304 before anything is searched.
+        self._validate_page()
+
         if decode == False:
             params = self._tweak_adv_params(params)
 
@@ -60,67 +162,182 @@ class MTGSearch(object):
             raise cherrypy.HTTPRedirect("/advanced")
 
         # now we pass off to the query method:
-        from ..data import advanced_query
-        search_results = advanced_query(params, int(page) - 1, results)
+        # a single search gives us this page's cards as well as enough info to draw the page links.
+        from ..data import advanced_search
+        search_results = advanced_search(params, int(page) - 1, results, facets=True)
 
         if len(search_results) == 0:
             template = self.env.get_template('no_results.html')
             return template.render(searchquery=str(params))
 
-        # Check if this is the last page by comparing the first entry on this page to the first on the next.
-        last_page = search_results[0].multiverseid == advanced_query(params, int(page), results)[0].multiverseid
-
-        next_pages = 0
-        while advanced_query(params, int(page) + next_pages - 1, results)[0].multiverseid != advanced_query(params, int(page) + next_pages, results)[0].multiverseid and next_pages < 3:
-            next_pages += 1
+        last_page = page >= search_results.page_count
+        next_pages = search_results.next_page_count(3) if not last_page else 0
 
         # inflate and return the template.
         template = self.env.get_template('advanced_results.html')
-        return template.render(searchquery=json.dumps(params), result=search_results,
-                               pagenum=page, resultsnum=results, lastpage=1 if last_page else 0, nextpages = next_pages,
-                               art_locator=self._locate_art_for_card,
-                               mana_symbol_fixer=replace_curly_brackets_in_text)
+        return template.render(searchquery=json.dumps(params), result=self._result_rows(search_results.hits),
+                               total=search_results.total, facets=search_results.facets,
+                               pagenum=page, resultsnum=results, lastpage=1 if last_page else 0, nextpages = next_pages)
 
 
     @cherrypy.expose
-    def results(self, query, page = 1, results = 10):
+    def results(self, query, page = 1, results = 10, correct = 1):
         if (query == ''):
             if (simple == 1):
                 raise cherrypy.HTTPRedirect('/')
             else:
                 raise cherrypy.HTTPRedirect('advanced')
 
+        self._validate_page()
+
         # Actually get the results
-        from ..data import simple_query
+        from ..data import simple_search, find_card_by_name, find_cards_by_approximate_name
 
         page_num = int(page)
         results_num = int(results)
 
-        data = simple_query(query, False, page_num - 1, results_num)
-        if len(data) == 0:
-            template = self.env.get_template('no_results.html')
-            return template.render(searchquery=query)
+        # if they typed a card's name (give or take case, accents and punctuation, or a typo)
+        # offer to take them straight to it. The name index answers that without going through whoosh.
+        card = find_card_by_name(query.strip())
+        if card is not None:
+            name_matches = [card]
+        else:
+            name_matches = [match for match, _ in find_cards_by_approximate_name(query.strip(), NAME_MATCHES)]
+
+        search_results = simple_search(query, False, page_num - 1, results_num)
+
+        # the card's name is all the search found, so there's nothing else to show them.
+        if card is not None and (search_results.total == 0 or
+                                 (search_results.total == 1 and search_results.hits[0].name == card.name)):
+            raise cherrypy.HTTPRedirect(f'/cardinfo?cardid={card.multiverseid}')
+
+        # only offered above the first page, a flat row per card (see _result_rows.)
+        name_matches = [{'multiverseid': x.multiverseid, 'name': x.name} for x in name_matches] if page_num == 1 else []
 
-        last = 0
-        if (data[0].multiverseid == simple_query(query, False, page_num, results_num)[0].multiverseid):
-            last = 1
+        # nothing found, see if it was a typo.
+        corrected_from = None
+        if len(search_results) == 0:
+            # a card name with a typo in it is a better guess than whoosh's spelling correction (and cheaper.)
+            if name_matches:
+                template = self.env.get_template('no_results.html')
+                return template.render(searchquery=query, suggestion=None, name_matches=name_matches)
+
+            from ..data import suggest_correction
+            suggestion = suggest_correction(query)
+
+            # when auto-correcting, show the corrected query's results (if it has any) straight away.
+            # (`correct` is 0 when the user asked for their original query instead.)
+            if suggestion is not None and self.autocorrect and int(correct):
+                corrected_results = simple_search(suggestion, False, page_num - 1, results_num)
+                if len(corrected_results):
+                    corrected_from, query, search_results = query, suggestion, corrected_results
 
-        next_pages = 0
-        while simple_query(query, False, page_num + next_pages - 1, results_num)[0].multiverseid != simple_query(query, False, page_num + next_pages, results_num)[0].multiverseid and next_pages < 3:
-            next_pages += 1
+            if len(search_results) == 0:
+                template = self.env.get_template('no_results.html')
+                return template.render(searchquery=query, suggestion=suggestion)
+
+        last = 1 if page_num >= search_results.page_count else 0
+        next_pages = search_results.next_page_count(3) if not last else 0
+        data = self._result_rows(search_results.hits)
 
         # incorperate results into template
         template = self.env.get_template('results.html')
-        return template.render(searchquery=query, result=data,
+        return template.render(searchquery=query, result=data, corrected_from=corrected_from,
+                               name_matches=name_matches if corrected_from is None else [],
                                pagenum=page_num, resultsnum=results_num,
-                               lastpage=last, nextpages = next_pages, art_locator=self._locate_art_for_card,
-                               mana_symbol_fixer=replace_curly_brackets_in_text)
+                               lastpage=last, nextpages = next_pages)
+
+
+    @cherrypy.expose
+    @cherrypy.tools.allow(methods=['POST'])
+    @cherrypy.tools.json_in()
+    @cherrypy.tools.json_out()
+    def multi_search(self):
+        """
+        Runs a batch of searches in one request, for clients that need many lookups at once.
+        The request body is a json list of query specs (see mtg_qe.data.multi_search), ex:
+            [{"query": "lightning bolt", "n": 1}, {"parameters": {"cmc": 3, "types": "creature"}, "page": 2}]
+        The response holds one entry per spec, in order, with the page of (serialized) cards,
+        paging info and how long the search took.
+        """
+        from ..data import multi_search
+
+        specs = cherrypy.request.json
+        if not isinstance(specs, list):
+            raise cherrypy.HTTPError(400, "Expected a json list of query specs.")
+        if len(specs) > MAX_MULTI_SEARCH:
+            raise cherrypy.HTTPError(400, f"At most {MAX_MULTI_SEARCH} queries may be batched together.")
+
+        import time
+        start = time.perf_counter()
+        try:
+            results = multi_search(specs)
+        except (ValueError, TypeError) as e:
+            raise cherrypy.HTTPError(400, str(e))
+
+        return {
+            'results': [{'hits': [card.serialize() for card in page.hits],
+                         'total': page.total,
+                         'page': page.page,
+                         'page_count': page.page_count,
+                         'seconds': seconds} for page, seconds in results],
+            'seconds': time.perf_counter() - start
+        }
+
+    @cherrypy.expose
+    @cherrypy.tools.json_out()
+    def suggest(self, prefix='', k=10):
+        """
+        Returns a json list of (up to `k`) card names that start with `prefix`, for autocompletion.
+        """
+        from ..data import suggest_names
+
+        try:
+            k = min(int(k), MAX_SUGGESTIONS)
+        except ValueError:
+            raise cherrypy.HTTPError(400, "k must be an integer.")
+
+        return suggest_names(prefix, k)
+
+    @cherrypy.expose
+    def export(self, query=None, parameters=None, format='ndjson', fields=None, ranked=0):
+        """
+        Streams every result of a search, one row per card.
+        :param str query: a simple search query, or
+        :param str parameters: a json encoded advanced search (as advanced_results takes with decode=True)
+        :param str format: 'ndjson' or 'csv'
+        :param str fields: comma separated Card.serialize() keys to include, defaults to all of them.
+        :param ranked: 1 to order rows by rank rather than index order (slower for large result sets.)
+        """
+        from ..data import iter_search
+
+        if format not in EXPORT_FORMATS:
+            raise cherrypy.HTTPError(400, f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+
+        fields = [x.strip() for x in fields.split(',') if x.strip()] if fields else list(EXPORT_FIELDS)
+        unknown = [x for x in fields if x not in EXPORT_FIELDS]
+        if unknown or not fields:
+            raise cherrypy.HTTPError(400, f"Unknown export fields: {', '.join(unknown)}")
+
+        try:
+            if parameters is not None:
+                parameters = json.loads(parameters)
+            cards = iter_search(query=query, parameters=parameters, ranked=bool(int(ranked)))
+        except ValueError as e: # json.JSONDecodeError is a ValueError too.
+            raise cherrypy.HTTPError(400, str(e))
+
+        content_type, rows = EXPORT_FORMATS[format]
+        cherrypy.response.headers['Content-Type'] = content_type
+        cherrypy.response.headers['Content-Disposition'] = f'attachment; filename="mtg_qe_export.{format}"'
+        return rows(cards, fields)
 
+    # stream the export out as its produced, rather than buffering the whole body.
+    export._cp_config = {'response.stream': True}
 
     @cherrypy.expose
     def cardinfo(self, cardid):
-        template = self.env.get_template('cardinfo.html')
         # Get the card from our 'internal' index.
+        # (before the page is tagged, so an unknown card's 404 isn't cacheable)
         from ..data import find_card_by_multiverseid
         card = find_card_by_multiverseid(cardid)
 
@@ -131,31 +348,192 @@ class MTGSearch(object):
         else:
             print(f"card.external_artwork: {card.external_artwork}")
 
-        related = related_cards(card.name, 10)
+        # the related cards shown come from the related cards index (unless they're similar cards, from the corpus),
+        # whose overlay is rebuilt as decks are fetched, so pages are also tagged with when it was built.
+        # None if they're still being looked up, in which case the page fetches them from /related.
+        if self.offline_related:
+            self._validate_page()
+            related = related_cards(card.name, RELATED_CARDS, True)
+        else:
+            # looked up before a 304 can be raised: that's what queues a refresh of missing or stale
+            # related cards, and pages that are only ever revalidated need refreshing too.
+            related = related_cards(card.name, RELATED_CARDS)
+            from ..data import related_built
+            self._validate_page(related_built())
 
-        # prep some fields that need some processing
-        mana_cost = None if card.mana_cost is None else "".join([curly_bracket_to_img_link(x) for x in card.mana_cost])
-        rules_text = None if card.text is None else replace_curly_brackets_in_text(card.text)
+        template = self.env.get_template('cardinfo.html')
 
+        # the card's mana cost and rules text html was rendered when the index was built.
         return template.render(id=cardid, carddata=card,
                                 relatedcards=related,
-                                artwork=self._locate_art_for_card(card),
-                                mana_cost = mana_cost,
-                                rules_text = rules_text)
+                                related_offline=self.offline_related,
+                                artwork=self._locate_art_for_card(card))
+
+    @cherrypy.expose
+    @cherrypy.tools.json_out()
+    def related(self, *name, **params):
+        """
+        Returns the cards related to the card named in the path (ie. /related/Shivan%20Dragon) as json:
+        {"name": ..., "pending": bool, "cards": [{"multiverseid", "name", "artwork"}, ...]}
+        "pending" is true while related cards are being fetched for the card, clients should ask again shortly.
+        """
+        # names like "Fire // Ice" get split up by the path.
+        name = params.get('name', None) or '/'.join(name)
+        cards = related_cards(name, RELATED_CARDS, self.offline_related)
+        return {
+            'name': name,
+            'pending': cards is None and refresh_pending(name),
+            'cards': [{'multiverseid': card.multiverseid, 'name': card.name,
+                       'artwork': 'https://gatherer.wizards.com' + card.external_artwork} for card in cards or []]
+        }
+
+    @cherrypy.expose
+    def card_art(self, multiverseid, *rest, v=None):
+        """
+        Serves a card's artwork out of the corpus' artwork pack.
+        The path matches Card.local_artwork (/card_art/<multiverseid>/<set>.png),
+        only the multiverseid is needed to find the image.
+        Responses carry the image's hash as a strong ETag, so revalidating is a 304 that never reads the image.
+        Pages link to artwork with (the start of) its hash as `v`, while it matches the image is cached as immutable.
+        """
+        from cherrypy.lib import cptools, httputil, static
+        from ..data import get_artwork_pack, get_data_location
+
+        etag = self._artwork_manifest().etag(multiverseid)
+        if etag is None:
+            raise cherrypy.HTTPError(404)
+
+        headers = cherrypy.response.headers
+        if v is not None and v == etag[1:len(v) + 1] and len(v) >= ART_FINGERPRINT_LENGTH:
+            headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+        else:
+            headers['Cache-Control'] = f'public, max-age={ART_MAX_AGE}'
+        headers['ETag'] = etag
+        # answers with a 304 if the browser's copy is current.
+        cptools.validate_etags()
+
+        pack = get_artwork_pack()
+        if pack is None:
+            # corpora built before the artwork pack have loose image files.
+            return static.serve_file(os.path.join(get_data_location(), 'artwork', self._artwork_manifest().path(multiverseid)))
+
+        image = pack.get(multiverseid)
+        if image is None:
+            raise cherrypy.HTTPError(404)
+
+        headers['Content-Type'] = 'image/png'
+        headers['Last-Modified'] = httputil.HTTPDate(pack.mtime)
+        cptools.validate_since()
+        return bytes(image)
+
+    def _validate_page(self, related_built=None):
+        """
+        Tags the response with validators (ETag, Last-Modified) worked out from the corpus version and the templates,
+        and lets caches keep it for PAGE_MAX_AGE. If the request's copy is still current this raises
+        a 304 (see cherrypy.lib.cptools.validate_etags), so call it before doing any work for the page.
+        :param float related_built: for pages showing related cards, when the related cards index was built.
+        """
+        from cherrypy.lib import cptools, httputil
+
+        version, modified = self._page_version()
+        if related_built is not None:
+            version = f'{version}-{int(related_built * 1000):x}'
+            modified = max(modified, related_built)
+
+        headers = cherrypy.response.headers
+        headers['Cache-Control'] = f'public, max-age={PAGE_MAX_AGE}'
+        headers['ETag'] = f'"{version}"'
+        headers['Last-Modified'] = httputil.HTTPDate(modified)
+
+        cptools.validate_etags()
+        # If-Modified-Since only counts when there's no ETag to go by (the ETag also covers the site's settings.)
+        if 'If-None-Match' not in cherrypy.request.headers:
+            cptools.validate_since()
+
+    def _page_version(self):
+        """
+        Returns (version, modified) for the site's pages: a tag that changes whenever a page might render differently,
+        and when that last happened. Kept from then on, unless templates are being reloaded.
+        """
+        if self._validators is None or self.env.auto_reload:
+            from ..data import get_corpus_version
+            corpus, built = get_corpus_version()
+            templates, edited = template_version(self.env)
+            settings = f'{int(bool(self.autocorrect))}{int(bool(self.offline_related))}'
+            # pages link to the current asset build's fingerprinted files.
+            assets = get_asset_manifest()
+            assets = assets.version if assets is not None else 'plain'
+            self._validators = (f'{corpus[:16]}-{templates[:8]}-{assets}-{settings}', max(built, edited))
+        return self._validators
+
+    @cherrypy.expose
+    def static(self, *path):
+        """
+        Serves the site's fingerprinted styles, scripts, fonts and images (see static_assets.py),
+        gzipped when the client takes it, ie. /static/styles/results.3f9a1c0b2e.css
+        """
+        return serve_asset('/'.join(path))
+
+    def _artwork_manifest(self):
+        """
+        Returns the corpus' ArtworkManifest, loaded on first use and kept from then on.
+        """
+        if self._art_manifest is None:
+            from ..data import get_artwork_manifest
+            self._art_manifest = get_artwork_manifest()
+        return self._art_manifest
 
     def _locate_art_for_card(self, card):
         """
         Determines if we have local artwork loaded for this card, if we do it provides a link to that
         if not, it will provide an external link to the cards artwork.
+        Local links carry the image's fingerprint (see card_art), so browsers can keep it for good.
         """
-        from ..data import get_data_location
-        local_path = os.path.join(get_data_location(), 'artwork', card.local_artwork)
-        if os.path.exists(local_path):
-            return '/'.join(['/card_art', card.local_artwork])
+        etag = self._artwork_manifest().etag(card.multiverseid)
+        if etag is not None:
+            return '/'.join(['/card_art', card.local_artwork]) + f'?v={etag[1:ART_FINGERPRINT_LENGTH + 1]}'
 
         else:
             return "https://gatherer.wizards.com" + card.external_artwork
 
+    def _result_rows(self, cards):
+        """
+        Returns a row for the results templates per card: a flat dict of just what the row shows,
+        worked out ahead of time so rendering a row doesn't call back into python.
+        A card's row only changes with the corpus, so recently shown ones are kept (the MAX_ROWS most recent.)
+        """
+        from ..data import get_corpus_version
+        corpus, _ = get_corpus_version()
+
+        rows = []
+        missing = []
+        with self._rows_lock:
+            for card in cards:
+                key = (corpus, card.multiverseid)
+                row = self._rows.get(key, None)
+                if row is not None:
+                    self._rows.move_to_end(key)
+                else:
+                    missing.append((len(rows), key, card))
+                rows.append(row)
+
+        # made outside the lock, locating artwork may read the artwork manifest.
+        for i, key, card in missing:
+            rows[i] = {'multiverseid': card.multiverseid,
+                       'name': card.name,
+                       'artwork': self._locate_art_for_card(card),
+                       'text_html': asset_links(card.text_html)}
+
+        if missing:
+            with self._rows_lock:
+                for i, key, _ in missing:
+                    self._rows[key] = rows[i]
+                    self._rows.move_to_end(key)
+                while len(self._rows) > MAX_ROWS:
+                    self._rows.popitem(last=False)
+
+        return rows
+
 
     def _tweak_adv_params(self, params):
         # need to bridge the keys and values to how advanced_query will expect them.
@@ -222,15 +600,34 @@ def main():
     parser = ArgumentParser('mtg_qe')
     parser.add_argument('-p', '--port', type=int, default=None, help="Specifies the port to run mtg_qe server on. Note: if you pick a protected port, you'll need to use super user permissions. Defaults to 8080")
     parser.add_argument('-i', '--interface', type=str, default=None, help="Specifies the socket host, or interface, to run on. Defaults to 127.0.0.1 (only serves to yourself)")
+    parser.add_argument('--hot-queries', type=str, default=None, help="A file of queries to run during warm-up, one per line (json objects for advanced queries.)")
+    parser.add_argument('--skip-warmup', action='store_true', help="Start serving immediately, loading indexes on first use instead.")
+    parser.add_argument('--autocorrect', action='store_true', help="When a search finds nothing, show results for the spelling corrected query rather than just suggesting it.")
+    parser.add_argument('--offline-related', action='store_true', help="Show cards with similar rules text as related cards, rather than looking them up on tappedout.")
+    parser.add_argument('--reload-templates', action='store_true', help="Check templates for changes on every render, for working on them. By default they're compiled once, at startup.")
+    parser.add_argument('--template-cache', type=str, default=None, help="Where to keep compiled templates between runs. Defaults to a directory under the system's temp directory.")
 
     args = parser.parse_args()
 
-    from ..data import get_data_location
     here = os.path.dirname(os.path.abspath(__file__))
     old = os.getcwd()
     os.chdir(here)
-    env = Environment(loader=FileSystemLoader('templates'))
+    env = make_environment(not args.reload_templates, args.template_cache)
+
+    # Load everything up front (in the background), turning requests away until its done.
+    warmup = None
+    if not args.skip_warmup:
+        logging.basicConfig(level=logging.INFO)
+        warmup = Warmup(env, args.hot_queries)
+        cherrypy.engine.subscribe('start', warmup.start)
+
     conf = {
+        '/': {
+            'tools.warmup_gate.on': warmup is not None,
+            'tools.warmup_gate.warmup': warmup
+        },
+        # the static files under their plain names. Pages link to the fingerprinted copies under /static
+        # when the assets have been built (mtg_qe_build_assets), these are for when they haven't.
         '/styles': {
             'tools.staticdir.on': True,
             'tools.staticdir.dir': os.path.join(here, 'styles')
@@ -246,10 +643,6 @@ def main():
         "/scripts": {
             "tools.staticdir.on": True,
             "tools.staticdir.dir": os.path.join(here, "js_scripts")
-        },
-        "/card_art": {
-            "tools.staticdir.on": True,
-            "tools.staticdir.dir": os.path.join(get_data_location(), 'artwork')
         }
     }
 
@@ -259,7 +652,7 @@ def main():
         cherrypy.config.update({'server.socket_host': args.interface})
 
     try:
-        cherrypy.quickstart(MTGSearch(env), '/', conf)
+        cherrypy.quickstart(MTGSearch(env, args.autocorrect, warmup, args.offline_related), '/', conf)
     except Exception as e:
         import traceback as tb
         tb.print_exc(e)
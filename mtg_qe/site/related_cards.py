@@ -1,84 +1,199 @@
 # Noah Scarbrough
 # CS 483, Fall 2019
 
+# Related cards come from the related cards index saved with the corpus (see data/related_index.py),
+# which is built from deck lists cached from tappedout (see data/deck_cache.py). Page views only ever read the index;
+# cards that are missing from it (or whose entry has gone stale) are handed to a small pool of
+# background workers, which fetch decks for the card, cache them, and rebuild the site's overlay of refreshed
+# cards from them. The corpus' own index is never written to.
+# The card info page polls /related/<name> for the result.
+#
+# In offline mode, related cards are the card's content based similar cards instead
+# (see data/similar_cards.py), which come with the corpus and never need a refresh.
+
 import os
-import random
+import time
+import logging
+import threading
+import concurrent.futures
 import requests
 from lxml import html
-from ..data import find_card_by_name
+from ..data import find_related_cards, find_similar_cards
 
 site = 'https://tappedout.net'
 
+# how old (in seconds) the related cards index can get before cards looked up in it are refreshed.
+STALE_AFTER = 7 * 24 * 60 * 60
+
+# how long (in seconds) to wait before refreshing the same card again, so cards
+# tappedout has no decks for don't get searched for on every view.
+RETRY_AFTER = 60 * 60
+
+# (connect, read) timeouts in seconds for requests to tappedout.
+REQUEST_TIMEOUT = (3.05, 10)
+
+# how many refreshes run at once, and how many may be waiting. Past that, misses
+# aren't refreshed until a later view finds room.
+REFRESH_WORKERS = 4
+MAX_PENDING = 64
+
+# name -> the Future of its refresh, for refreshes queued or running.
+# A second miss for the same name waits on the same future rather than fetching again.
+_inflight = {}
+# name -> when it was last queued for a refresh.
+_refreshed = {}
+_refresh_lock = threading.Lock()
+_rebuild_lock = threading.Lock()
+_deck_cache_lock = threading.Lock()
+
+def get_deck_cache():
+    """
+    Returns the site's DeckCache, opening it the first time.
+    Deck pages left by the old (one html file per deck) cache aren't used until
+    they're imported, with `mtg_qe_migrate_index --import-deck-pages`.
+    """
+    # same module-global caching trick as internal_index_integration.get_internal_index
+    with _deck_cache_lock:
+        if '!!_deck_cache' not in globals():
+            from ..data.deck_cache import DeckCache, DEFAULT_CACHE_FILE, LEGACY_CACHE_DIR
+
+            if os.path.isdir(LEGACY_CACHE_DIR):
+                logging.getLogger('related_refresh').warning(f'{LEGACY_CACHE_DIR} holds deck pages from the old cache, '
+                                                             'import them with mtg_qe_migrate_index --import-deck-pages')
+            globals()['!!_deck_cache'] = DeckCache(DEFAULT_CACHE_FILE)
+
+    return globals()['!!_deck_cache']
+
+def _get_executor():
+    """
+    Returns the pool refreshes run on, starting it the first time. Call with _refresh_lock held.
+    """
+    # made on first use, so importing this module doesn't start threads.
+    if '!!_refresh_executor' not in globals():
+        globals()['!!_refresh_executor'] = concurrent.futures.ThreadPoolExecutor(max_workers=REFRESH_WORKERS,
+                                                                                 thread_name_prefix='related_refresh')
+    return globals()['!!_refresh_executor']
+
 def get_html(url):
-    page = requests.get(url)
+    page = requests.get(url, timeout=REQUEST_TIMEOUT)
     return html.fromstring(page.content)
 
-def related_cards(name, amount):
-    all_related = []
-    counted = []
-    max = 1
-    # Retrieves top 3 decks
-    paths = related_decks(name, 3)
-    results = []
-    sorted = [[]]
-    # Scrape related cards from tappedout
-    if not os.path.exists(os.path.dirname(__file__) + '/../data/related_cache'):
-        os.mkdir(os.path.dirname(__file__) + '/../data/related_cache')
-    for path in paths:
+def related_cards(name, amount, offline=False):
+    """
+    Returns up to `amount` cards related to the card named `name`, from the related cards index.
+    Never touches the network: if the card has no entry (yet) this returns None and schedules a refresh,
+    see `refresh_pending`.
+    :param bool offline: return the card's similar cards instead, nothing is ever refreshed.
+    """
+    from ..data import find_related
+
+    if offline:
+        return find_similar_cards(name, amount) or []
+
+    cards = find_related_cards(name, amount)
+    _, built = find_related(name, 0)
+    if cards is None or time.time() - built > STALE_AFTER:
+        schedule_refresh(name)
+
+    return cards
+
+def refresh_pending(name):
+    """
+    Returns True if a refresh of `name`'s related cards is queued or running.
+    """
+    with _refresh_lock:
+        return name in _inflight
+
+def schedule_refresh(name):
+    """
+    Queues `name` for a background refresh of its related cards, unless it was refreshed recently.
+    Returns the refresh's Future (shared with anyone else waiting on the same name), or None if nothing was queued.
+    """
+    with _refresh_lock:
+        if name in _inflight:
+            return _inflight[name]
+        if time.time() - _refreshed.get(name, 0) < RETRY_AFTER or len(_inflight) >= MAX_PENDING:
+            return None
+
+        _refreshed[name] = time.time()
+        future = _get_executor().submit(_refresh, name)
+        _inflight[name] = future
+
+    future.add_done_callback(lambda _: _finish_refresh(name))
+    return future
+
+def _finish_refresh(name):
+    with _refresh_lock:
+        _inflight.pop(name, None)
+
+def _fetch_decks(name, decks):
+    """
+    Fetches (and caches) the top `decks` decks tappedout has for `name`.
+    Returns the number of decks that weren't cached already.
+    """
+    cache = get_deck_cache()
+    paths = cache.get_search(name)
+    if paths is None:
+        paths = related_decks(name, decks)
+        if paths:
+            cache.put_search(name, paths)
+
+    fetched = 0
+    for path in paths[:decks]:
         deck_name = path.split('/')[len(path.split('/')) - 2]
-        local_path = os.path.dirname(__file__) + '/../data/related_cache/' + deck_name + '.html'
-        # Check if deck is cached
-        if os.path.exists(local_path):
-            print('Cache exists')
-            f = open(local_path)
-            source = html.fromstring(f.read())
-            f.close()
-        else:
-            print('Cache does not exist')
-            # Handle the case where tappedout is down
-            try:
-                source = get_html(site + path)
-            except requests.exceptions.ConnectionError:
-                return []
-            else:
-                f = open(local_path, 'wb')
-                f.write(html.tostring(source))
-                f.close()
-        all_related += source.xpath('//div/ul/li/a/@data-orig')
-    # Form 2D array: sorted[occurances][array of card names]
-    for i in range(len(all_related)):
-        sorted.append([])
-    for card in all_related:
-        if (set(counted).intersection({card}) != {card}):
-            counted.append(card)
-            sorted[all_related.count(card)].append(card)
-            if (all_related.count(card) > max):
-                max = all_related.count(card)
-    # Get list of most common occurences
-    while (len(results) < amount) & (max > 0):
-        if sorted == [[]]:
-            return []
-        if (len(sorted[max]) != 0):
-            new_card_name = sorted[max].pop(random.choice(range(len(sorted[max]))))
-            new_card = find_card_by_name(new_card_name)
-            if new_card is not None:
-                # Disallow card being related to itself
-                if (new_card != find_card_by_name(name) and new_card.name not in ['Mountain', 'Island', 'Plains', 'Forest', 'Swamp']):
-                    results.append(new_card)
-            else:
-                print('Card ' + new_card_name + ' does not exist.')
-        else:
-            max -= 1
-    return results
+        if cache.get_deck(deck_name) is not None:
+            continue
+
+        try:
+            source = get_html(site + path)
+        except requests.exceptions.RequestException:
+            break
+
+        cache.put_deck(deck_name, source.xpath('//div/ul/li/a/@data-orig'))
+        fetched += 1
+
+    return fetched
+
+def refresh_related_index(names):
+    """
+    Fetches decks for each of `names`, then rebuilds and saves the site's overlay of refreshed cards
+    from every cached deck: entries for `names` and every card refreshed before them. Cards that were never
+    refreshed keep the entries the corpus shipped with. Returns the number of new decks.
+    The overlay is rebuilt even when no decks were new (they may have been cached by another card's refresh),
+    unless it's current and already has an entry for each of `names`.
+    """
+    from ..data import get_internal_index
+    from ..data.related_index import RelatedIndex, get_related_overlay, save_related_overlay
+
+    fetched = sum(_fetch_decks(name, 3) for name in names)
+
+    # workers fetch in parallel, but only one rebuilds at a time.
+    with _rebuild_lock:
+        overlay = get_related_overlay()
+        current = overlay is not None and time.time() - overlay.built <= STALE_AFTER and all(x in overlay for x in names)
+        if fetched or not current:
+            refreshed = set(names) | set(overlay.entry_names if overlay is not None else ())
+            save_related_overlay(RelatedIndex.from_decks(get_deck_cache().all_decks(), get_internal_index()['by_name'].keys(),
+                                                         cards=refreshed))
+
+    return fetched
+
+def _refresh(name):
+    log = logging.getLogger('related_refresh')
+    try:
+        fetched = refresh_related_index([name])
+        log.info(f'refreshed related cards for {name}, {fetched} new decks (deck cache: {get_deck_cache().stats()})')
+    except Exception:
+        log.exception(f'refreshing related cards for {name} failed')
 
 def related_decks(name, decks):
     url = site + '/mtg-decks/search/?q=' + name
     try:
         source = get_html(url)
-    except requests.exceptions.ConnectionError:
+    except requests.exceptions.RequestException:
         return []
     else:
         return source.xpath('//div/h3/a/@href')[:decks]
 
 if __name__ == '__main__':
-    related_cards('The Great Henge', 5)
+    print(refresh_related_index(['The Great Henge']))
@@ -0,0 +1,302 @@
+# Samuel Dunn
+# CS 483, Fall 2019
+
+# This module builds and serves the site's static files (styles, scripts, fonts and images) as
+# fingerprinted assets: each file is copied to a name with (part of) its sha256 in it, ie.
+# styles/results.css -> styles/results.3f9a1c0b2e.css, along with a gzipped copy for text files
+# that compress. A manifest maps each file's plain name to its fingerprinted one.
+#
+# Since a fingerprinted name's contents never change, they're served with far-future, immutable
+# cache headers, and browsers never ask for them again. Pages link to assets through `asset_url`,
+# so a rebuilt asset gets a new name (and is fetched fresh) the next time a page is rendered.
+# Html stored with the corpus (mana symbols in rules text) keeps plain paths, `asset_links` maps
+# them when the page is rendered, so the corpus doesn't depend on the asset build.
+#
+# The build is a separate step (mtg_qe_build_assets), run before packaging the site. Without a
+# build, `asset_url` hands out the plain paths, served from the site's static directories as before.
+
+import os
+import re
+import json
+import gzip
+import shutil
+import hashlib
+import mimetypes
+
+SITE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# url prefix -> directory (within the site package) its files are in.
+SOURCE_DIRS = {
+    'styles': 'styles',
+    'images': 'images',
+    'fonts': 'fonts',
+    'scripts': 'js_scripts',
+}
+
+BUILD_DIR = os.path.join(SITE_DIR, 'static_build')
+MANIFEST_FILE = 'manifest.json'
+
+# where fingerprinted assets are served from.
+URL_PREFIX = '/static'
+
+# how many hex digits of the sha256 go in a fingerprinted name.
+FINGERPRINT_LENGTH = 10
+
+# only text compresses, images and fonts already are. The gzipped copy is kept if it's at least this much smaller.
+COMPRESSIBLE = frozenset(['.css', '.js', '.svg', '.json', '.txt', '.html'])
+MIN_GZIP_SAVING = 0.1
+
+# how long (in seconds) fingerprinted assets may be cached: a year, the most HTTP/1.1 caches are asked to honor.
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+# how long (in seconds) plain names, and fingerprints that don't match the current build, may be cached.
+# (pages rendered before an asset changed, or by a node running another build, still get the asset.)
+PLAIN_MAX_AGE = 10 * 60
+
+_FINGERPRINTED = re.compile(r'^(.*)\.([0-9a-f]{%d})(\.[^./]+)$' % FINGERPRINT_LENGTH)
+
+# plain links to static files in html, ie. src="/images/mana/W.gif"
+_PLAIN_LINK = re.compile(r'(src|href)="/((?:%s)/[^"]+)"' % '|'.join(SOURCE_DIRS))
+
+mimetypes.add_type('font/woff', '.woff')
+mimetypes.add_type('font/woff2', '.woff2')
+
+def _source_files(site_dir):
+    """
+    Yields (plain name, path) for every static file in the site, ie. ('scripts/related.js', '<site_dir>/js_scripts/related.js')
+    """
+    for prefix, directory in sorted(SOURCE_DIRS.items()):
+        root = os.path.join(site_dir, directory)
+        for dir_path, dir_names, file_names in os.walk(root):
+            dir_names.sort()
+            for file_name in sorted(file_names):
+                path = os.path.join(dir_path, file_name)
+                yield '/'.join([prefix] + os.path.relpath(path, root).split(os.sep)), path
+
+def build_assets(site_dir=SITE_DIR, build_dir=BUILD_DIR):
+    """
+    Writes a fingerprinted (and where it helps, gzipped) copy of every static file in `site_dir` to `build_dir`,
+    along with the manifest. Anything already in `build_dir` is replaced.
+    Returns the manifest: {plain name: {'file': fingerprinted name, 'sha256': hex digest, 'size': bytes, 'gzip_size': bytes or None}}
+    """
+    # build next to the old output, then swap, so a running site never sees half a build.
+    temp_dir = build_dir + '.tmp'
+    if os.path.exists(temp_dir):
+        shutil.rmtree(temp_dir)
+
+    manifest = {}
+    for name, path in _source_files(site_dir):
+        with open(path, 'rb') as fd:
+            content = fd.read()
+
+        digest = hashlib.sha256(content).hexdigest()
+        base, ext = os.path.splitext(name)
+        fingerprinted = f'{base}.{digest[:FINGERPRINT_LENGTH]}{ext}'
+
+        out_path = os.path.join(temp_dir, *fingerprinted.split('/'))
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        with open(out_path, 'wb') as fd:
+            fd.write(content)
+
+        gzip_size = None
+        if ext.lower() in COMPRESSIBLE:
+            # mtime=0 so rebuilding the same file gives the same bytes.
+            compressed = gzip.compress(content, compresslevel=9, mtime=0)
+            if len(compressed) <= len(content) * (1 - MIN_GZIP_SAVING):
+                with open(out_path + '.gz', 'wb') as fd:
+                    fd.write(compressed)
+                gzip_size = len(compressed)
+
+        manifest[name] = {'file': fingerprinted, 'sha256': digest, 'size': len(content), 'gzip_size': gzip_size}
+
+    with open(os.path.join(temp_dir, MANIFEST_FILE), 'w') as fd:
+        json.dump(manifest, fd, indent=1, sort_keys=True)
+
+    if os.path.exists(build_dir):
+        shutil.rmtree(build_dir)
+    os.rename(temp_dir, build_dir)
+    return manifest
+
+class AssetManifest(object):
+    """
+    A build's manifest, for linking to and serving its assets.
+    """
+    def __init__(self, assets, build_dir=BUILD_DIR):
+        """
+        :param dict assets: the manifest, as `build_assets` returns it.
+        :param str build_dir: the directory the build was written to.
+        """
+        self._assets = assets
+        self._build_dir = build_dir
+        self._urls = {name: f"{URL_PREFIX}/{entry['file']}" for name, entry in assets.items()}
+        self._by_file = {entry['file']: name for name, entry in assets.items()}
+        # changes whenever any asset does, pages linking to assets are tagged with it.
+        self.version = hashlib.sha256(' '.join(sorted(self._by_file)).encode('utf-8')).hexdigest()[:8]
+        # fingerprinted name (+ '.gz') -> its bytes, read on first request. There's only a few hundred KB of assets.
+        self._contents = {}
+
+    def __len__(self):
+        return len(self._assets)
+
+    def __contains__(self, name):
+        return name in self._assets
+
+    def url(self, name):
+        """
+        Returns the url of `name`'s fingerprinted copy, or None if it isn't in the build.
+        """
+        return self._urls.get(name, None)
+
+    def resolve(self, path):
+        """
+        Works out which asset a requested path (relative to URL_PREFIX) is.
+        Returns (plain name, current) where current is True if `path` is the asset's current fingerprinted name,
+        or (None, False) if it's no asset of the build's. Plain names, and fingerprints from other builds, resolve to
+        the asset with current False.
+        """
+        name = self._by_file.get(path, None)
+        if name is not None:
+            return name, True
+
+        match = _FINGERPRINTED.match(path)
+        if match is not None:
+            path = match.group(1) + match.group(3)
+        return (path, False) if path in self._assets else (None, False)
+
+    def entry(self, name):
+        return self._assets[name]
+
+    def content(self, name, gzipped=False):
+        """
+        Returns the bytes of `name`'s fingerprinted copy (or of its gzipped copy.)
+        """
+        file_name = self._assets[name]['file'] + ('.gz' if gzipped else '')
+        content = self._contents.get(file_name, None)
+        if content is None:
+            with open(os.path.join(self._build_dir, *file_name.split('/')), 'rb') as fd:
+                content = self._contents[file_name] = fd.read()
+        return content
+
+    @classmethod
+    def load(cls, build_dir=BUILD_DIR):
+        with open(os.path.join(build_dir, MANIFEST_FILE)) as fd:
+            return cls(json.load(fd), build_dir)
+
+def get_asset_manifest():
+    """
+    Returns the AssetManifest of the site's asset build, or None if the assets haven't been built.
+    """
+    # same module-global caching trick as internal_index_integration.get_internal_index
+    if '!!_asset_manifest' not in globals():
+        found = os.path.exists(os.path.join(BUILD_DIR, MANIFEST_FILE))
+        globals()['!!_asset_manifest'] = AssetManifest.load() if found else None
+
+    return globals()['!!_asset_manifest']
+
+def asset_url(name):
+    """
+    Returns the url to link to the static file `name` with. `name` is the file's path under the site's
+    static directories (scripts under 'scripts/'), ie. 'styles/results.css' or 'images/mana/W.gif'.
+    That's its fingerprinted copy when the assets have been built, and its plain path otherwise.
+    """
+    manifest = get_asset_manifest()
+    url = manifest.url(name) if manifest is not None else None
+    return url if url is not None else '/' + name
+
+def asset_links(html):
+    """
+    Returns `html` with its links to static files (ie. <img src="/images/mana/W.gif">) pointed at their
+    fingerprinted copies. Returns `html` as it is when the assets haven't been built.
+    """
+    manifest = get_asset_manifest()
+    if manifest is None or not html:
+        return html
+
+    def replace(match):
+        url = manifest.url(match.group(2))
+        return match.group(0) if url is None else f'{match.group(1)}="{url}"'
+
+    return _PLAIN_LINK.sub(replace, html)
+
+def accepts_gzip(accept_encoding):
+    """
+    Returns True if an Accept-Encoding header value allows a gzipped response.
+    An explicit gzip (or x-gzip, the same coding) entry decides over a *, whatever order they're in.
+    """
+    explicit, wildcard = None, None
+    for coding in (accept_encoding or '').split(','):
+        coding, _, params = coding.strip().partition(';')
+        coding = coding.strip().lower()
+        if coding not in ('gzip', 'x-gzip', '*'):
+            continue
+
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    pass
+
+        if coding == '*':
+            wildcard = max(quality, wildcard or 0.0)
+        else:
+            explicit = max(quality, explicit or 0.0)
+
+    quality = explicit if explicit is not None else wildcard
+    return quality is not None and quality > 0
+
+def serve_asset(path):
+    """
+    Serves the asset at `path` (relative to URL_PREFIX) for the current cherrypy request: the gzipped copy
+    if there is one and the client takes it, with immutable cache headers for current fingerprinted names.
+    """
+    import cherrypy
+    from cherrypy.lib import cptools
+
+    manifest = get_asset_manifest()
+    name, current = manifest.resolve(path) if manifest is not None else (None, False)
+    if name is None:
+        raise cherrypy.HTTPError(404)
+
+    entry = manifest.entry(name)
+    headers = cherrypy.response.headers
+    gzipped = False
+    if entry['gzip_size'] is not None:
+        # caches have to keep the gzipped and plain copies apart.
+        headers['Vary'] = 'Accept-Encoding'
+        gzipped = accepts_gzip(cherrypy.request.headers.get('Accept-Encoding'))
+
+    if current:
+        headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        headers['Cache-Control'] = f'public, max-age={PLAIN_MAX_AGE}'
+    # a strong ETag per representation, so the gzipped and plain copies have different ones.
+    headers['ETag'] = f'"{entry["sha256"][:32]}{"-gz" if gzipped else ""}"'
+    cptools.validate_etags()
+
+    content_type, _ = mimetypes.guess_type(name)
+    headers['Content-Type'] = content_type or 'application/octet-stream'
+    if gzipped:
+        headers['Content-Encoding'] = 'gzip'
+    return manifest.content(name, gzipped)
+
+def cli_entry():
+    '''
+    Builds the site's fingerprinted static assets (see build_assets.)
+    '''
+    import logging
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    log = logging.getLogger('static_assets')
+
+    parser = argparse.ArgumentParser('mtg_qe_build_assets')
+    parser.add_argument('-o', '--output', type=str, default=BUILD_DIR, help='where to write the build. Defaults to the one the site serves.')
+    args = parser.parse_args()
+
+    manifest = build_assets(SITE_DIR, args.output)
+    gzipped = [x for x in manifest.values() if x['gzip_size'] is not None]
+    log.info(f"Done! {len(manifest)} assets written to {args.output}, {len(gzipped)} gzipped "
+             f"({sum(x['size'] for x in gzipped)} -> {sum(x['gzip_size'] for x in gzipped)} bytes)")
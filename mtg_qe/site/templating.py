@@ -0,0 +1,71 @@
+# Samuel Dunn
+# CS 483, Fall 2019
+
+# This module sets up the jinja Environment the site renders with.
+#
+# In production mode (the default) every template is compiled once, at startup, and kept for
+# the life of the process: there's no reload check (a stat of the template file) on each render,
+# and templates live in a plain dict rather than jinja's locked LRU cache, so concurrent renders
+# don't queue on it. Compiled templates are also written to a bytecode cache on disk, so the next
+# start skips parsing and compiling them.
+# In development mode (--reload-templates) templates are checked for changes on every render instead.
+
+import os
+
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+
+from .static_assets import asset_url, asset_links
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+def make_environment(production=True, cache_dir=None, template_dir=TEMPLATE_DIR):
+    """
+    Returns the jinja Environment for the site's templates.
+    :param bool production: compile every template up front, and never check them for changes.
+    :param str cache_dir: where to keep compiled templates between runs (production only.)
+        Defaults to a directory under the system's temp directory.
+    :param str template_dir: the directory templates are loaded from.
+    """
+    if not production:
+        env = Environment(loader=FileSystemLoader(template_dir), auto_reload=True)
+    else:
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        env = Environment(loader=FileSystemLoader(template_dir),
+                          bytecode_cache=FileSystemBytecodeCache(cache_dir),
+                          auto_reload=False,
+                          cache_size=-1) # never evict, there's only a handful of templates.
+
+    # templates link to styles, scripts and fonts with {{ asset('styles/results.css') }}, see static_assets.py
+    env.globals['asset'] = asset_url
+    # and html stored with the corpus links to them through {{ card.text_html|assets }}
+    env.filters['assets'] = asset_links
+    if production:
+        precompile(env)
+    return env
+
+def precompile(env):
+    """
+    Loads (so compiles) every html template in `env`. Returns how many there were.
+    """
+    names = env.list_templates(extensions=['html'])
+    for name in names:
+        env.get_template(name)
+    return len(names)
+
+def template_version(env):
+    """
+    Returns (version, modified) for the templates `env` loads: a hash of their sources,
+    and when (time.time()) the newest of them was last changed.
+    """
+    import hashlib
+
+    digest = hashlib.sha256()
+    modified = 0
+    for name in env.list_templates(extensions=['html']):
+        source, path, _ = env.loader.get_source(env, name)
+        digest.update(name.encode('utf-8') + b'\0' + source.encode('utf-8') + b'\0')
+        modified = max(modified, os.path.getmtime(path))
+
+    return digest.hexdigest()[:16], modified
@@ -0,0 +1,182 @@
+# Samuel Dunn
+# CS 483, Fall 2019
+
+# This module loads everything the site needs before it takes real traffic:
+# the corpus archive, internal index, whoosh index (and the stores built alongside
+# it), the jinja templates and the related cards index. Optionally it also replays
+# a list of popular queries so their results are already cached.
+#
+# While warm-up is running, the site answers everything but /healthz with a 503,
+# so a load balancer checking /healthz only sends traffic once the node is ready.
+
+import json
+import time
+import logging
+import threading
+
+import cherrypy
+
+class Warmup(object):
+    """
+    Runs the warm-up stages (once) and keeps track of how they went.
+    """
+    def __init__(self, env, hot_queries=None):
+        """
+        :param env: the jinja Environment the site renders with.
+        :param str hot_queries: optionally, the path to a file of queries to replay.
+            One query per line, blank lines and lines starting with '#' are skipped.
+            Lines starting with '{' are json advanced query parameters, everything else is a simple query.
+        """
+        self._env = env
+        self._hot_queries = hot_queries
+        self._log = logging.getLogger('warmup')
+        self._lock = threading.Lock()
+        self._thread = None
+        self.ready = False
+        self.failed = False
+
+        # name -> {'seconds': float, 'error': str or None}, in the order they ran.
+        self.stages = {}
+
+    def _stages(self):
+        """
+        Returns (name, callable, required) for every stage, in the order they should run.
+        If a required stage fails the site never reports ready.
+        """
+        return [
+            ('unpack_archive', self._unpack_archive, True),
+            ('internal_index', self._internal_index, True),
+            ('whoosh_index', self._whoosh_index, True),
+            ('derived_stores', self._derived_stores, False),
+            ('artwork', self._artwork, False),
+            ('corpus_version', self._corpus_version, False),
+            ('templates', self._templates, True),
+            ('related_index', self._related_index, False),
+            ('hot_queries', self._replay_hot_queries, False),
+        ]
+
+    def _unpack_archive(self):
+        from ..data import unpack_archive
+        unpack_archive()
+
+    def _internal_index(self):
+        from ..data import get_internal_index
+        return f"{len(get_internal_index()['by_multiverseid'])} cards"
+
+    def _whoosh_index(self):
+        from ..data import get_searcher_pool
+        pool = get_searcher_pool()
+        with pool.searcher() as searcher:
+            return f'{searcher.doc_count()} documents, generation {pool.generation}'
+
+    def _derived_stores(self):
+        from ..data import get_index_generation, get_columnar_store, get_facet_index
+        from ..data import get_name_suggester, get_name_matcher, get_spelling_corrector, get_similar_cards
+
+        generation = get_index_generation()
+        loaders = (get_columnar_store, get_facet_index, get_name_suggester, get_name_matcher, get_spelling_corrector,
+                   get_similar_cards)
+        loaded = [loader.__name__[len('get_'):] for loader in loaders if loader(generation) is not None]
+        return ', '.join(loaded) if loaded else 'none in corpus'
+
+    def _artwork(self):
+        from ..data import get_artwork_pack, get_artwork_manifest
+        pack = get_artwork_pack()
+        manifest = get_artwork_manifest()
+        return f"{len(manifest)} images{' (loose files)' if pack is None else ''}"
+
+    def _corpus_version(self):
+        # corpora built before versions were recorded have theirs worked out (hashed) here, rather than on the first page view.
+        from ..data import get_corpus_version
+        version, _ = get_corpus_version()
+        return version
+
+    def _templates(self):
+        # jinja compiles a template the first time its loaded, and caches it from then on.
+        # (in production mode they're already compiled, this just finds them in the cache.)
+        from .templating import precompile
+        return f'{precompile(self._env)} templates'
+
+    def _related_index(self):
+        from ..data.related_index import get_related_index, get_related_overlay
+        index, overlay = get_related_index(), get_related_overlay()
+        found = 'none in corpus' if index is None else f'{len(index)} cards'
+        return found if overlay is None else f'{found}, {len(overlay)} refreshed'
+
+    def _replay_hot_queries(self):
+        if not self._hot_queries:
+            return 'none configured'
+
+        from ..data import simple_search, advanced_search
+        count = 0
+        with open(self._hot_queries, encoding='utf-8') as fd:
+            for line in fd:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                if line.startswith('{'):
+                    advanced_search(json.loads(line), 0, 10, facets=True)
+                else:
+                    simple_search(line, False, 0, 10)
+                count += 1
+        return f'{count} queries'
+
+    def run(self):
+        """
+        Runs every stage, logging how long each took. Safe to call more than once, only the first call does anything.
+        """
+        with self._lock:
+            if self.ready or self.stages:
+                return
+
+            total = time.perf_counter()
+            for name, stage, required in self._stages():
+                start = time.perf_counter()
+                try:
+                    detail = stage()
+                    error = None
+                except Exception as e:
+                    detail = None
+                    error = f'{type(e).__name__}: {e}'
+                    self._log.exception(f'warm-up stage {name} failed')
+
+                seconds = time.perf_counter() - start
+                self.stages[name] = {'seconds': round(seconds, 4), 'error': error}
+                self._log.info(f"warm-up {name}: {seconds * 1000:.1f}ms{f' ({detail})' if detail else ''}")
+
+                if error and required:
+                    self.failed = True
+                    self._log.error('warm-up failed, the site will not report ready.')
+                    return
+
+            self.ready = True
+            self._log.info(f'warm-up done in {time.perf_counter() - total:.2f}s, ready for traffic.')
+
+    def start(self):
+        """
+        Runs warm-up on a background thread (so the engine can finish starting.)
+        Suitable for subscribing to cherrypy.engine's 'start' channel.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name='warmup', daemon=True)
+            self._thread.start()
+
+    def status(self):
+        """
+        Returns a json serializable summary of warm-up progress.
+        """
+        return {'ready': self.ready, 'failed': self.failed, 'stages': dict(self.stages)}
+
+
+def gate_until_ready(warmup):
+    """
+    A cherrypy tool callable: turns requests away with a 503 until `warmup` is ready.
+    """
+    if not warmup.ready:
+        # skip the page handler entirely (raising an HTTPError would throw away our Retry-After header.)
+        cherrypy.serving.request.handler = None
+        cherrypy.serving.response.status = 503
+        cherrypy.serving.response.headers['Retry-After'] = '5'
+        cherrypy.serving.response.body = [b'The site is warming up, try again shortly.']
+
+cherrypy.tools.warmup_gate = cherrypy.Tool('before_handler', gate_until_ready)
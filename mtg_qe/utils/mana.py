@@ -11,6 +11,9 @@
 
 import re
 
+# a curly bracket mana symbol within text, ie. '{T}' or '{W/U}'
+_CURLY_BRACKETS = re.compile(r'(\{.*?\})')
+
 def replace_mana_links_in_text(text):
     """
     This function takes an input string - likely from gatherer itself - and converts mana symbol-tags to curly-bracket notation
@@ -62,15 +65,22 @@ def alt_text_to_curly_bracket(text):
     # at this point we've hopefully
     return f"{{{text}}}"
 
+def _match_to_img_link(match):
+    return curly_bracket_to_img_link(match.group(1))
+
 def replace_curly_brackets_in_text(text):
     """
     Replaces curly bracket notation in text with the correct
     image link.
     """
     if text:
-        sub_aux = lambda match: curly_bracket_to_img_link(match.group(1))
-        pattern = r'(\{.*?\})'
-        return re.sub(pattern, sub_aux, text)
+        return _CURLY_BRACKETS.sub(_match_to_img_link, text)
+
+def mana_cost_to_html(mana_cost):
+    """
+    Returns the image links for a card's mana cost (a sequence of curly bracket symbols), or None if it has none.
+    """
+    return None if mana_cost is None else ''.join([curly_bracket_to_img_link(x) for x in mana_cost])
 
 def curly_bracket_to_img_link(cb):
     """
@@ -79,6 +89,7 @@ def curly_bracket_to_img_link(cb):
     """
     file_safe_name = cb[1:-1].replace('/', '_').replace(' ', '_')
     ext = 'png' if 'Phyrexian' in file_safe_name or file_safe_name in ('C', 'E') else 'gif'
+    # a plain path, the site links it to the fingerprinted image when it renders (see site/static_assets.py)
     return f"<img src=\"/images/mana/{file_safe_name}.{ext}\">"
 
 def fix_variable_mana(card):
@@ -0,0 +1,79 @@
+# Samuel Dunn
+# CS 483, Fall 2019
+
+# This module provides helpers for comparing loosely typed text (mostly card names)
+# against what we have on file.
+
+import re
+import unicodedata
+
+# letters that don't decompose into a base letter + accent, but that people type as two letters.
+_LIGATURES = str.maketrans({'æ': 'ae', 'Æ': 'AE', 'œ': 'oe', 'Œ': 'OE', 'ß': 'ss'})
+
+_NON_WORD = re.compile(r'[^0-9a-z]+')
+
+def normalize_name(text):
+    """
+    Returns a normalized form of `text` for matching: case-folded, with diacritics removed,
+    ligatures spelled out, and punctuation dropped. Words are separated by single spaces.
+    ex: "Æther Vial" -> "aether vial", "Jace, the Mind Sculptor" -> "jace the mind sculptor"
+    """
+    text = unicodedata.normalize('NFKD', text.translate(_LIGATURES))
+    text = ''.join(c for c in text if not unicodedata.combining(c)).casefold()
+
+    # apostrophes and the like shouldn't split words (ie. "Urza's" -> "urzas"), everything else should.
+    text = text.replace("'", '').replace('’', '')
+    return _NON_WORD.sub(' ', text).strip()
+
+def trigrams(text):
+    """
+    Returns the set of character trigrams of `text`, padded so the start
+    and end of the text make trigrams of their own.
+    """
+    padded = f'  {text} '
+    return {padded[i:i+3] for i in range(len(padded) - 2)}
+
+def edit_distance(a, b, max_distance=None):
+    """
+    Returns the Levenshtein distance between strings `a` and `b`.
+    :param int max_distance: optionally, give up once the distance is known to be greater
+        than this, returning max_distance + 1. Only a band of max_distance cells either side
+        of the diagonal is computed, which makes comparing far apart strings cheap.
+    """
+    # shared prefixes and suffixes don't change the distance, and typos usually leave long ones.
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < len(a) - start and end < len(b) - start and a[-1-end] == b[-1-end]:
+        end += 1
+    a, b = a[start:len(a)-end], b[start:len(b)-end]
+
+    if len(a) < len(b):
+        a, b = b, a
+    if max_distance is None:
+        max_distance = len(a)
+    if len(a) - len(b) > max_distance:
+        return max_distance + 1
+    if not b:
+        return len(a)
+
+    over = max_distance + 1
+    previous = [j if j <= max_distance else over for j in range(len(b) + 1)]
+    for i, ca in enumerate(a, 1):
+        lo, hi = max(1, i - max_distance), min(len(b), i + max_distance)
+        current = [over] * (len(b) + 1)
+        if i <= max_distance:
+            current[0] = i
+        for j in range(lo, hi + 1):
+            cost = previous[j-1] + (ca != b[j-1])
+            if previous[j] + 1 < cost:
+                cost = previous[j] + 1
+            if current[j-1] + 1 < cost:
+                cost = current[j-1] + 1
+            current[j] = cost if cost < over else over
+        if min(current[lo-1:hi+1]) >= over:
+            return over
+        previous = current
+
+    return min(previous[-1], over)
@@ -14,11 +14,14 @@ if __name__ == "__main__":
         author_email="samuel.i.dunn@wsu.edu, noah.scarbrough@wsu.edu",
         description="magic the gathering card search, for CS483-Web Data",
         packages=find_packages(),
-        install_requires=['whoosh', 'cherrypy', 'jinja2', 'lxml', 'requests'],
+        install_requires=['whoosh', 'cherrypy', 'jinja2', 'lxml', 'requests', 'numpy'],
         entry_points={
             'console_scripts': [
                 'mtg_qe = mtg_qe.site.main:main',
                 'mtg_qe_setup_index = mtg_qe.data.index_setup:cli_entry',
+                'mtg_qe_migrate_index = mtg_qe.data.index_setup:migrate_cli_entry',
+                'mtg_qe_build_related = mtg_qe.data.related_index:cli_entry',
+                'mtg_qe_build_assets = mtg_qe.site.static_assets:cli_entry',
                 'mtg_qe_scrape = mtg_qe.scraper:cli_entry',
                 'mtg_qe_unpack = mtg_qe.data:unpack_archive'
             ]
@@ -30,7 +33,11 @@ if __name__ == "__main__":
                             'js_scripts/*',
                             'images/*',
                             'images/mana/*',
-                            'fonts/*']
+                            'fonts/*',
+                            # built by mtg_qe_build_assets, before packaging.
+                            'static_build/*',
+                            'static_build/*/*',
+                            'static_build/images/mana/*']
         },
         setup_requires=['wheel']
     )